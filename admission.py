@@ -0,0 +1,160 @@
+# admission.py - Token-bucket rate limits per user and route, and a global concurrency cap
+import math
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+
+from flask import current_app, g, jsonify, request
+
+
+def parse_limits(spec):
+    # "like_post=2:40,create_trip=0.5:10" -> {'like_post': (2.0, 40.0), ...}
+    # as (tokens per second, burst)
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = item.partition('=')
+        rate, _, burst = value.partition(':')
+        limits[name.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+class BucketStore:
+    # In-process token buckets, least recently used evicted past max_keys.
+    # A shared store (e.g. for several worker processes) only has to
+    # provide the same take().
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1.0):
+        # Seconds until `cost` tokens are available; 0 means taken now
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / rate if rate > 0 else math.inf
+
+
+class AdmissionControl:
+    def __init__(self, app=None, key=None, store=None):
+        # key: callable naming the caller of the current request (user id,
+        # falling back to the client address)
+        self.key = key or (lambda: request.remote_addr)
+        self.store = store
+        self.enabled = True
+        self.user_limits = {}
+        self.route_limits = {}
+        self.max_concurrent = 0
+        self._slots = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak = 0
+        self._shed = 0
+        self._routes = defaultdict(lambda: {'admitted': 0, 'throttled_user': 0, 'throttled_route': 0})
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ADMISSION_CONTROL', True)
+        app.config.setdefault('ADMISSION_LIMITS', '')
+        app.config.setdefault('ADMISSION_ROUTE_LIMITS', '')
+        app.config.setdefault('ADMISSION_MAX_CONCURRENT', 0)
+        app.config.setdefault('ADMISSION_MAX_KEYS', 100000)
+        self.enabled = app.config['ADMISSION_CONTROL']
+        self.user_limits = parse_limits(app.config['ADMISSION_LIMITS'])
+        self.route_limits = parse_limits(app.config['ADMISSION_ROUTE_LIMITS'])
+        if self.store is None:
+            self.store = BucketStore(app.config['ADMISSION_MAX_KEYS'])
+        self.max_concurrent = app.config['ADMISSION_MAX_CONCURRENT']
+        self._slots = threading.BoundedSemaphore(self.max_concurrent) if self.max_concurrent > 0 else None
+        app.before_request(self._enter)
+        app.teardown_request(self._leave)
+
+    def _enter(self):
+        # Sheds requests beyond max_concurrent instead of letting them queue
+        # for a database connection until the pool times out
+        if self._slots is None or not self.enabled:
+            return None
+        view = current_app.view_functions.get(request.endpoint)
+        if getattr(view, 'admission_exempt', False):
+            return None
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._shed += 1
+            return self._reject('Server busy, try again shortly', 503, 1)
+        g.admission_slot = True
+        with self._lock:
+            self._in_flight += 1
+            self._peak = max(self._peak, self._in_flight)
+        return None
+
+    def _leave(self, exc=None):
+        if g.pop('admission_slot', False):
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def exempt(self, view):
+        # Long-lived responses (e.g. event streams) that hold no connection
+        view.admission_exempt = True
+        return view
+
+    def limit(self, user, route=None):
+        # user / route: default (tokens per second, burst) for each caller and
+        # for the route as a whole; ADMISSION_LIMITS / ADMISSION_ROUTE_LIMITS
+        # override them by view name
+        def decorator(view):
+            name = view.__name__
+
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+                stats = self._routes[name]
+                rate, burst = self.user_limits.get(name, user)
+                wait = self.store.take(f'user:{name}:{self.key()}', rate, burst)
+                if wait:
+                    with self._lock:
+                        stats['throttled_user'] += 1
+                    return self._reject('Too many requests', 429, wait)
+                route_limit = self.route_limits.get(name, route)
+                if route_limit:
+                    wait = self.store.take(f'route:{name}', *route_limit)
+                    if wait:
+                        with self._lock:
+                            stats['throttled_route'] += 1
+                        return self._reject('Too many requests', 429, wait)
+                with self._lock:
+                    stats['admitted'] += 1
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _reject(self, message, status, retry_after):
+        response = jsonify({'error': message})
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, math.ceil(min(retry_after, 3600))))
+        return response
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'max_concurrent': self.max_concurrent,
+                'in_flight': self._in_flight,
+                'peak_in_flight': self._peak,
+                'shed': self._shed,
+                'routes': {name: dict(stats) for name, stats in self._routes.items()}
+            }
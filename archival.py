@@ -0,0 +1,62 @@
+# archival.py - Move cold rows of append-only tables into archive tables
+import heapq
+import itertools
+from datetime import datetime
+
+from sqlalchemy import Column, Index, Table, func, select
+
+
+def archive_table(table, metadata, *index_columns):
+    # Same columns as `table`, keyed by the original ids, but without foreign
+    # keys so rows can outlive what they referenced. index_columns: tuples of
+    # column names to index.
+    name = f'{table.name}_archive'
+    columns = [Column(column.name, column.type, primary_key=column.primary_key,
+                      nullable=column.nullable, autoincrement=False)
+               for column in table.columns]
+    indexes = [Index(f"ix_{name}_{'_'.join(names)}", *names) for names in index_columns]
+    return Table(name, metadata, *columns, *indexes)
+
+
+def month_start(value, months_back=0):
+    month = value.year * 12 + value.month - 1 - months_back
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+def below_newest(table):
+    # The row with the highest id always stays hot: SQLite and MySQL 5.7
+    # (after a restart) derive the next id from the largest one left in the
+    # table, so archiving it would hand its id out again
+    return table.c.id < select(func.max(table.c.id)).scalar_subquery()
+
+
+def move_rows(session, table, archive, condition, batch_size=5000):
+    # Copies rows matching `condition` into `archive` and deletes them from
+    # `table`, committing one batch at a time so locks stay short. The
+    # newest row is never moved (see below_newest).
+    names = [column.name for column in archive.columns]
+    newest = session.execute(select(func.max(table.c.id))).scalar()
+    moved = 0
+    while newest is not None:
+        ids = session.execute(select(table.c.id).where(condition, table.c.id < newest)
+                              .order_by(table.c.id).limit(batch_size)).scalars().all()
+        if not ids:
+            return moved
+        session.execute(archive.insert().from_select(
+            names, select(*[table.c[name] for name in names]).where(table.c.id.in_(ids))))
+        session.execute(table.delete().where(table.c.id.in_(ids)))
+        session.commit()
+        moved += len(ids)
+    return moved
+
+
+def newest_first(hot_query, archive_query, watermark, limit=None):
+    # Rows carry their sort key as the last column, and `watermark` is of the
+    # same type. Archived rows are all older than the watermark, so the
+    # archive is only read when the requested page reaches past it.
+    hot = (hot_query.limit(limit) if limit else hot_query).all()
+    if watermark is None or (limit and len(hot) >= limit and hot[-1][-1] >= watermark):
+        return hot
+    archived = (archive_query.limit(limit) if limit else archive_query).all()
+    rows = heapq.merge(hot, archived, key=lambda row: row[-1], reverse=True)
+    return list(itertools.islice(rows, limit)) if limit else list(rows)
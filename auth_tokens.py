@@ -0,0 +1,32 @@
+# auth_tokens.py - Signed, expiring bearer tokens carrying the user's claims
+from itsdangerous import BadData, URLSafeTimedSerializer
+
+
+class TokenSigner:
+    def __init__(self, app=None, salt='auth-token'):
+        self.salt = salt
+        self.max_age = 86400
+        self._serializer = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AUTH_TOKEN_MAX_AGE', 86400)
+        self.max_age = app.config['AUTH_TOKEN_MAX_AGE']
+        self._serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt=self.salt)
+
+    def issue(self, profile):
+        # `ver` lets the server revoke every outstanding token for a user by
+        # bumping their token version (logout, role change)
+        return self._serializer.dumps({
+            'uid': profile['id'],
+            'username': profile['username'],
+            'role': profile['role'],
+            'ver': profile['token_version']
+        })
+
+    def verify(self, token):
+        try:
+            return self._serializer.loads(token, max_age=self.max_age)
+        except BadData:
+            return None
@@ -0,0 +1,333 @@
+# bench_api.py - Seeded load benchmark for the API routes
+#
+#   python benchmarks/bench_api.py --users 200 --posts 5000 --concurrency 8 \
+#       --requests 500 --output bench.json
+#   python benchmarks/bench_api.py ... --compare bench.json
+#
+# Seeds a throwaway SQLite database (or DATABASE_URL when --database-url is
+# given) with synthetic users, cars, trips, emission records, posts and
+# comments, then drives each route (reads, writes, bulk uploads and the
+# streaming exports) through the Flask test client from concurrent threads.
+# Reports p50/p95/p99 latency, throughput and SQL queries per request as
+# JSON so runs can be diffed between commits.
+import argparse
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FUEL_TYPES = ['Petrol', 'Diesel', 'Electric', 'Hybrid']
+COMPANIES = ['Tata', 'Maruti', 'Hyundai', 'Mahindra', 'Honda', 'Toyota', 'Kia']
+WORDS = ['electric', 'commute', 'battery', 'charging', 'diesel', 'mileage', 'traffic',
+         'carpool', 'emissions', 'tyres', 'highway', 'city', 'savings', 'solar', 'route']
+BENCH_PASSWORD = 'bench-password'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Seeded load benchmark for the API routes')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--cars', type=int, default=1000)
+    parser.add_argument('--trips', type=int, default=10000)
+    parser.add_argument('--emissions', type=int, default=10000)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--comments', type=int, default=10000)
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--bulk-rows', type=int, default=100, help='rows per /trips/bulk and /emissions/bulk request')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=400, help='requests per route')
+    parser.add_argument('--warmup', type=int, default=20, help='unmeasured requests per route')
+    parser.add_argument('--routes', nargs='*', help='only run routes whose name contains one of these')
+    parser.add_argument('--no-response-cache', action='store_true')
+    parser.add_argument('--database-url', help='benchmark against this database instead of SQLite')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', help='write the JSON report here as well as stdout')
+    parser.add_argument('--compare', help='previous JSON report to print deltas against')
+    return parser.parse_args()
+
+
+def chunked(rows, size=5000):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def seed(backend, app, args, rng):
+    from werkzeug.security import generate_password_hash
+
+    db = backend.db
+    now = datetime.utcnow()
+    password_hash = generate_password_hash(BENCH_PASSWORD, app.config['PASSWORD_HASH_METHOD'])
+
+    def insert(model, rows):
+        for chunk in chunked(rows):
+            db.session.execute(model.__table__.insert(), chunk)
+        db.session.commit()
+
+    insert(backend.User, [{
+        'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com',
+        'password_hash': password_hash, 'role': 'customer', 'created_at': now
+    } for i in range(1, args.users + 1)])
+
+    # Car i belongs to user i, so every user has a car to write trips with
+    cars = [{
+        'id': i, 'user_id': i if i <= args.users else rng.randint(1, args.users),
+        'year': rng.randint(2005, 2024),
+        'price': float(rng.randint(100000, 3000000)), 'mileage': round(rng.uniform(8, 30), 1),
+        'type': 'car', 'created_at': now - timedelta(minutes=i),
+        **backend.vehicle_catalog_ids(rng.choice(COMPANIES), f'Model {rng.randint(1, 40)}',
+                                      rng.choice(FUEL_TYPES), rng.choice(['Manual', 'Automatic']))
+    } for i in range(1, max(args.cars, args.users) + 1)]
+    insert(backend.UserCar, cars)
+
+    trips = []
+    for i in range(1, args.trips + 1):
+        car = rng.choice(cars)
+        start = now - timedelta(hours=rng.randint(1, 24 * 365))
+        lat, lng = 12.9 + rng.uniform(-0.3, 0.3), 77.6 + rng.uniform(-0.3, 0.3)
+        trips.append({
+            'id': i, 'user_id': car['user_id'], 'vehicle_id': car['id'],
+            'start_location': 'A', 'end_location': 'B', 'distance': round(rng.uniform(1, 80), 1),
+            'start_time': start, 'end_time': start + timedelta(minutes=rng.randint(5, 120)),
+            'start_lat': lat, 'start_lng': lng, 'end_lat': lat + 0.05, 'end_lng': lng + 0.05,
+            'route_polyline': None, 'start_geohash': None, 'created_at': start
+        })
+    insert(backend.Trip, trips)
+
+    emissions = []
+    for i in range(1, args.emissions + 1):
+        trip = trips[i - 1] if i <= len(trips) else rng.choice(trips)
+        emissions.append({
+            'id': i, 'trip_id': trip['id'] if i <= len(trips) else None,
+            'user_id': trip['user_id'], 'vehicle_id': trip['vehicle_id'],
+            'co2_emissions': round(trip['distance'] * 0.12, 3), 'distance': trip['distance'],
+            'fuel_consumed': round(trip['distance'] / 15, 3), 'record_date': trip['start_time'].date(),
+            'created_at': now
+        })
+    insert(backend.EmissionRecord, emissions)
+    backend.rebuild_emission_rollups()
+
+    insert(backend.CommunityPost, [{
+        'id': i, 'user_id': rng.randint(1, args.users),
+        'title': ' '.join(rng.choices(WORDS, k=5)), 'content': ' '.join(rng.choices(WORDS, k=40)),
+        'post_type': rng.choice(['discussion', 'achievement', 'question', 'tip']),
+        'likes': 0, 'views': 0, 'created_at': now - timedelta(minutes=i), 'updated_at': now
+    } for i in range(1, args.posts + 1)])
+
+    insert(backend.PostComment, [{
+        'id': i, 'post_id': rng.randint(1, args.posts), 'user_id': rng.randint(1, args.users),
+        'content': ' '.join(rng.choices(WORDS, k=12)), 'likes': 0, 'created_at': now
+    } for i in range(1, args.comments + 1)])
+
+    insert(backend.Message, [{
+        'id': i, 'content': ' '.join(rng.choices(WORDS, k=10)), 'author_name': 'bench',
+        'created_at': now - timedelta(minutes=i)
+    } for i in range(1, args.messages + 1)])
+
+
+def routes(args, rng):
+    # name -> (method, path factory, json body factory or None, needs login).
+    # Body factories get the requesting user's id, which is also their car's.
+    post_id = lambda: rng.randint(1, args.posts)  # noqa: E731
+    new_user = itertools.count(1)
+    trip_body = lambda user_id: {  # noqa: E731
+        'start_location': 'A', 'end_location': 'B', 'distance': round(rng.uniform(1, 80), 1),
+        'start_time': '2024-01-01T10:00:00', 'end_time': '2024-01-01T10:30:00', 'vehicle_id': user_id,
+        'start_lat': 12.9 + rng.uniform(-0.3, 0.3), 'start_lng': 77.6 + rng.uniform(-0.3, 0.3)
+    }
+
+    def register_body(user_id):
+        n = next(new_user)
+        return {'username': f'bench{n}', 'email': f'bench{n}@example.com', 'password': BENCH_PASSWORD}
+
+    emission_body = lambda user_id: {  # noqa: E731
+        'vehicle_id': user_id, 'co2_emissions': round(rng.uniform(0.5, 10), 3), 'distance': 25.0,
+        'fuel_consumed': 1.7, 'record_date': f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+    }
+    return {
+        'get_posts': ('GET', lambda: '/posts', None, False),
+        'get_posts_page': ('GET', lambda: '/posts?limit=20', None, False),
+        'get_single_post': ('GET', lambda: f'/posts/{post_id()}', None, False),
+        'get_comments': ('GET', lambda: f'/posts/{post_id()}/comments', None, False),
+        'search_posts': ('GET', lambda: f'/posts/search?q={rng.choice(WORDS)}', None, False),
+        'get_messages': ('GET', lambda: '/messages', None, False),
+        'marketplace_vehicles': ('GET', lambda: '/api/marketplace/vehicles', None, False),
+        'marketplace_search': ('GET', lambda: f'/api/marketplace/search?sort=price_asc&fuel_type={rng.choice(FUEL_TYPES)}'
+                                              f'&min_year={rng.randint(2005, 2020)}', None, False),
+        'heatmap': ('GET', lambda: f'/api/heatmap?zoom={rng.randint(8, 14)}', None, True),
+        'check_login': ('GET', lambda: '/check_login', None, True),
+        'get_vehicles': ('GET', lambda: '/api/vehicles', None, True),
+        'get_trips': ('GET', lambda: '/trips', None, True),
+        'get_emissions': ('GET', lambda: '/emissions', None, True),
+        'emissions_summary': ('GET', lambda: '/api/emissions/summary?granularity=month', None, True),
+        'export_trips': ('GET', lambda: '/api/export/trips', None, True),
+        'export_trips_csv': ('GET', lambda: '/api/export/trips?format=csv', None, True),
+        'export_emissions': ('GET', lambda: '/api/export/emissions', None, True),
+        'register': ('POST', lambda: '/register', register_body, False),
+        'login': ('POST', lambda: '/login', lambda user_id: {'username': f'user{user_id}', 'password': BENCH_PASSWORD}, False),
+        'create_post': ('POST', lambda: '/posts', lambda user_id: {
+            'title': ' '.join(rng.choices(WORDS, k=5)), 'content': ' '.join(rng.choices(WORDS, k=40)),
+            'post_type': rng.choice(['discussion', 'achievement', 'question', 'tip'])}, True),
+        'create_message': ('POST', lambda: '/messages', lambda user_id: {
+            'content': ' '.join(rng.choices(WORDS, k=10)), 'author_name': 'bench'}, True),
+        'like_post': ('POST', lambda: f'/posts/{post_id()}/like', None, True),
+        'create_trip': ('POST', lambda: '/trips', trip_body, True),
+        'trips_bulk': ('POST', lambda: '/trips/bulk',
+                       lambda user_id: [trip_body(user_id) for _ in range(args.bulk_rows)], True),
+        'emissions_bulk': ('POST', lambda: '/emissions/bulk',
+                           lambda user_id: [emission_body(user_id) for _ in range(args.bulk_rows)], True),
+    }
+
+
+class QueryCounter:
+    # Counts statements per thread; the test client runs each request on
+    # the calling thread, so this is a per-request count
+    def __init__(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        self.local = threading.local()
+        event.listen(Engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.local.count = getattr(self.local, 'count', 0) + 1
+
+    def reset(self):
+        self.local.count = 0
+
+    def value(self):
+        return getattr(self.local, 'count', 0)
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))] if samples else 0.0
+
+
+def run_route(app, counter, args, method, path_for, body_for, needs_login):
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.user_id = random.randint(1, args.users)
+            local.client = app.test_client()
+            if needs_login:
+                with local.client.session_transaction() as session:
+                    session['user_id'] = local.user_id
+        return local.client
+
+    def one(_):
+        c = client()
+        kwargs = {'json': body_for(local.user_id)} if body_for else {}
+        counter.reset()
+        start = time.perf_counter()
+        response = c.open(path_for(), method=method, **kwargs)
+        # Streamed bodies (the exports) are only produced as they are read
+        response.get_data()
+        elapsed = time.perf_counter() - start
+        response.close()
+        return elapsed, counter.value(), response.status_code
+
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(one, range(args.warmup)))
+        start = time.perf_counter()
+        results = list(executor.map(one, range(args.requests)))
+        wall = time.perf_counter() - start
+
+    latencies = [elapsed * 1000 for elapsed, _, _ in results]
+    statuses = {}
+    for _, _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(results),
+        'throughput_rps': round(len(results) / wall, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries_per_request': round(sum(queries for _, queries, _ in results) / len(results), 2),
+        'status_codes': statuses
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(report, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"{'route':24} {'p50 ms':>16} {'p95 ms':>16} {'rps':>16} {'queries':>12}", file=sys.stderr)
+    for name, result in report['routes'].items():
+        old = baseline.get('routes', {}).get(name)
+        if not old:
+            continue
+
+        def delta(key):
+            return f"{old[key]:.1f}->{result[key]:.1f}"
+        print(f"{name:24} {delta('p50_ms'):>16} {delta('p95_ms'):>16} {delta('throughput_rps'):>16} "
+              f"{delta('queries_per_request'):>12}", file=sys.stderr)
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_api.db')
+    if args.no_response_cache:
+        os.environ['RESPONSE_CACHE_TTL'] = '0'
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+    # A handful of seeded users hammering the write routes would only
+    # measure 429s; set ADMISSION_CONTROL=true to include the limiter
+    os.environ.setdefault('ADMISSION_CONTROL', 'false')
+
+    import flask_backend_sql as backend
+    app = backend.create_app()
+
+    with app.app_context():
+        backend.db.drop_all()
+        backend.migrate_schema()
+        start = time.perf_counter()
+        seed(backend, app, args, rng)
+        seed_seconds = time.perf_counter() - start
+        backend.db.session.remove()
+
+    counter = QueryCounter()
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'seed_seconds': round(seed_seconds, 2),
+        'routes': {}
+    }
+    for name, (method, path_for, body_for, needs_login) in routes(args, rng).items():
+        if args.routes and not any(fragment in name for fragment in args.routes):
+            continue
+        report['routes'][name] = run_route(app, counter, args, method, path_for, body_for, needs_login)
+        print(f'{name}: {report["routes"][name]}', file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    if args.compare:
+        print_comparison(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# bench_login.py - Logins/sec for different password KDF settings
+#
+#   python benchmarks/bench_login.py --methods pbkdf2:sha256:260000 pbkdf2:sha256:100000 \
+#       --workers 0 4 --threads 8 --logins 200
+#
+# Runs /login through the Flask test client against a throwaway SQLite
+# database and prints one JSON line per (method, workers) combination.
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Logins/sec for different password KDF settings')
+    parser.add_argument('--methods', nargs='+', default=['pbkdf2:sha256:260000', 'pbkdf2:sha256:100000'])
+    parser.add_argument('--workers', nargs='+', type=int, default=[0, os.cpu_count() or 1])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--logins', type=int, default=200)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench_login.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    import flask_backend_sql as backend
+
+    app = backend.create_app()
+    with app.app_context():
+        backend.migrate_schema()
+        user = backend.User(username='bench', email='bench@example.com')
+        user.password_hash = ''
+        backend.db.session.add(user)
+        backend.db.session.commit()
+
+    def login(_):
+        client = app.test_client()
+        response = client.post('/login', json={'username': 'bench', 'password': 'bench-password'})
+        assert response.status_code == 200, response.status_code
+
+    for method in args.methods:
+        for workers in args.workers:
+            app.config['PASSWORD_HASH_METHOD'] = method
+            app.config['PASSWORD_HASH_WORKERS'] = workers
+            backend.password_hasher.init_app(app)
+            with app.app_context():
+                user = backend.User.query.filter_by(username='bench').first()
+                user.set_password('bench-password')
+                backend.db.session.commit()
+            login(None)  # warm up the process pool
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.threads) as executor:
+                list(executor.map(login, range(args.logins)))
+            elapsed = time.perf_counter() - start
+            print(json.dumps({
+                'method': method,
+                'workers': workers,
+                'threads': args.threads,
+                'logins': args.logins,
+                'seconds': round(elapsed, 3),
+                'logins_per_sec': round(args.logins / elapsed, 1)
+            }))
+
+    backend.password_hasher.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# bench_search.py - Query latency of the in-process post search index
+#
+#   python benchmarks/bench_search.py --posts 1000000 --queries 200
+#
+# Indexes synthetic posts (Zipf-distributed vocabulary, like real text)
+# and prints one JSON line with build time and p50/p95/p99 query latency.
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import InvertedIndex  # noqa: E402
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query latency of the in-process post search index')
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--vocabulary', type=int, default=50000)
+    parser.add_argument('--words-per-post', type=int, default=24)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = [f'w{i}' for i in range(args.vocabulary)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(args.vocabulary)))
+
+    index = InvertedIndex()
+    start = time.perf_counter()
+    for post_id in range(1, args.posts + 1):
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=args.words_per_post)
+        index.add(post_id, ' '.join(words[:6]), weight=2)
+        index.add(post_id, ' '.join(words[6:]))
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(args.queries):
+        query = ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(1, 3)))
+        start = time.perf_counter()
+        index.search(query, limit=20)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    print(json.dumps({
+        'posts': args.posts,
+        'terms': len(index.postings),
+        'build_seconds': round(build_seconds, 2),
+        'queries': args.queries,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2)
+    }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# bench_serialization.py - Rows/sec of the list serialization paths
+#
+#   python benchmarks/bench_serialization.py --rows 50000 --repeat 5
+#
+# Seeds a throwaway SQLite database with cars and times the full
+# fetch -> dict -> JSON bytes path for a marketplace-sized list:
+#   orm_jsonify     whole ORM objects, hand-built dicts, stdlib json (the old path)
+#   compiled        selected columns, compiled projection, fast encoder if installed
+#   compiled_stdlib the same with the stdlib encoder
+#   compiled_fields the same restricted to ?fields=id,price
+# Prints one JSON line with the best-of-repeat rows/sec for each.
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def legacy_car_dict(car):
+    return {
+        'id': car.id,
+        'company': car.company,
+        'model': car.model,
+        'year': car.year,
+        'price': car.price,
+        'mileage': car.mileage,
+        'fuel_type': car.fuel_type,
+        'transmission': car.transmission,
+        'image_url': car.image_url,
+        'created_at': car.created_at.isoformat()
+    }
+
+
+def best_rate(fn, rows, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return round(rows / best)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rows/sec of the list serialization paths')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_serialization.db')
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+    import flask_backend_sql as backend
+    import serialization
+    app = backend.create_app()
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    with app.app_context():
+        backend.migrate_schema()
+        backend.db.session.execute(backend.UserCar.__table__.insert(), [{
+            'id': i, 'user_id': 1, 'year': rng.randint(2005, 2024),
+            'price': float(rng.randint(100000, 3000000)), 'mileage': round(rng.uniform(8, 30), 1),
+            'type': 'car', 'created_at': now - timedelta(seconds=i),
+            **backend.vehicle_catalog_ids(rng.choice(['Tata', 'Maruti', 'Hyundai', 'Kia']), f'Model {rng.randint(1, 40)}',
+                                          rng.choice(['Petrol', 'Diesel', 'Electric']), 'Manual')
+        } for i in range(1, args.rows + 1)])
+        backend.db.session.commit()
+
+        def orm_jsonify():
+            cars = backend.UserCar.query.all()
+            json.dumps([legacy_car_dict(car) for car in cars], sort_keys=True).encode()
+            backend.db.session.expunge_all()
+
+        def compiled(fields=None):
+            projection = backend.CAR_SCHEMA.select(fields)
+            serialization.dumps(projection.many(backend.db.session.query(*projection.columns)))
+
+        def compiled_stdlib():
+            fast, serialization.orjson = serialization.orjson, None
+            try:
+                compiled()
+            finally:
+                serialization.orjson = fast
+
+        report = {
+            'rows': args.rows,
+            'fast_encoder': serialization.orjson is not None,
+            'rows_per_sec': {
+                'orm_jsonify': best_rate(orm_jsonify, args.rows, args.repeat),
+                'compiled': best_rate(compiled, args.rows, args.repeat),
+                'compiled_stdlib': best_rate(compiled_stdlib, args.rows, args.repeat),
+                'compiled_fields': best_rate(lambda: compiled(['id', 'price']), args.rows, args.repeat)
+            }
+        }
+    print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
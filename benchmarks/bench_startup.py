@@ -0,0 +1,88 @@
+# bench_startup.py - Cold-start time of the app, phase by phase
+#
+#   python benchmarks/bench_startup.py --trials 10
+#   python benchmarks/bench_startup.py --repo /path/to/older/checkout
+#
+# Each trial is a fresh interpreter against a fresh SQLite file (or
+# --database-url) and times:
+#   import         importing flask_backend_sql
+#   create_app     building the app (trees without create_app: nothing)
+#   schema         `flask migrate` work when --migrate is given; trees without
+#                  create_app always pay db.create_all() here, as their
+#                  __main__ did on every start
+#   first_request  the first GET /api/metrics
+# Prints one JSON line with the median and max of each phase in ms.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {repo!r})
+import flask_backend_sql as backend
+imported = time.perf_counter()
+if hasattr(backend, 'create_app'):
+    app = backend.create_app()
+    created = time.perf_counter()
+    if {migrate!r}:
+        with app.app_context():
+            backend.migrate_schema()
+else:
+    app = backend.app
+    created = time.perf_counter()
+    backend.init_db()
+migrated = time.perf_counter()
+status = app.test_client().get('/api/metrics', headers={{'X-Metrics-Token': 'bench'}}).status_code
+served = time.perf_counter()
+sys.stderr.write(json.dumps({{
+    'factory': hasattr(backend, 'create_app'),
+    'status': status,
+    'import': (imported - start) * 1000,
+    'create_app': (created - imported) * 1000,
+    'schema': (migrated - created) * 1000,
+    'first_request': (served - migrated) * 1000,
+}}) + '\\n')
+'''
+
+PHASES = ('import', 'create_app', 'schema', 'first_request', 'total')
+
+
+def run_trial(args):
+    env = dict(os.environ, PASSWORD_HASH_WORKERS='0', LOG_LEVEL='WARNING', METRICS_TOKEN='bench')
+    env['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_startup.db')
+    code = CHILD.format(repo=os.path.abspath(args.repo), migrate=args.migrate)
+    result = subprocess.run([sys.executable, '-c', code], env=env, cwd=args.repo,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    trial = json.loads(result.stderr.strip().splitlines()[-1])
+    trial['total'] = sum(trial[phase] for phase in PHASES[:-1])
+    return trial
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start time of the app, phase by phase')
+    parser.add_argument('--repo', default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help='Checkout to measure (default: this one)')
+    parser.add_argument('--trials', type=int, default=10)
+    parser.add_argument('--migrate', action='store_true', help='Include `flask migrate` in the schema phase')
+    parser.add_argument('--database-url', help='Default: a fresh SQLite file per trial')
+    args = parser.parse_args()
+
+    trials = [run_trial(args) for _ in range(args.trials)]
+    print(json.dumps({
+        'trials': args.trials,
+        'factory': trials[0]['factory'],
+        'statuses': sorted({trial['status'] for trial in trials}),
+        'ms': {phase: {
+            'median': round(statistics.median(trial[phase] for trial in trials), 1),
+            'max': round(max(trial[phase] for trial in trials), 1)
+        } for phase in PHASES}
+    }))
+
+
+if __name__ == '__main__':
+    main()
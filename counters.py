@@ -0,0 +1,52 @@
+# counters.py - In-process counters that are flushed to the database in batches
+import threading
+import time
+from collections import Counter
+
+
+class BufferedCounter:
+    # Increments accumulate in memory and are handed to flush_fn as a
+    # {key: amount} dict once flush_interval seconds have passed or
+    # max_pending increments are waiting, whichever comes first.
+    def __init__(self, flush_fn, flush_interval=5.0, max_pending=1000):
+        self.flush_fn = flush_fn
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = Counter()
+        self._pending_total = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def increment(self, key, amount=1):
+        with self._lock:
+            self._pending[key] += amount
+            self._pending_total += amount
+            due = (self._pending_total >= self.max_pending or
+                   time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def pending(self, key):
+        with self._lock:
+            return self._pending.get(key, 0)
+
+    def flush(self):
+        # Only one flush runs at a time; increments keep landing in a fresh
+        # buffer while the previous batch is written
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending
+                self._pending = Counter()
+                self._pending_total = 0
+                self._last_flush = time.monotonic()
+            if not batch:
+                return
+            try:
+                self.flush_fn(dict(batch))
+            except Exception:
+                # Put the batch back so the increments are retried next time
+                with self._lock:
+                    self._pending.update(batch)
+                    self._pending_total += sum(batch.values())
+                raise
@@ -0,0 +1,120 @@
+# db_pool.py - Connection pool settings from the environment and pool metrics
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class PoolMetrics:
+    def __init__(self, sample_size=1024):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=sample_size)
+        self._pool = None
+        self.checkouts = 0
+        self.checkout_time_total = 0.0
+        self.checkout_time_max = 0.0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+
+    def record_checkout(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_time_total += seconds
+            self.checkout_time_max = max(self.checkout_time_max, seconds)
+            self._samples.append(seconds)
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            data = {
+                'checkouts': self.checkouts,
+                'checkout_ms_avg': self.checkout_time_total / self.checkouts * 1000 if self.checkouts else 0.0,
+                'checkout_ms_max': self.checkout_time_max * 1000,
+                'checkout_ms_p95': samples[int(len(samples) * 0.95)] * 1000 if samples else 0.0,
+                'overflow_checkouts': self.overflow_checkouts,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations
+            }
+        pool = self._pool
+        if pool is not None:
+            data.update({
+                'pool_size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': pool.overflow(),
+                'max_overflow': pool._max_overflow
+            })
+        return data
+
+    def attach(self, pool):
+        self._pool = pool
+
+        @event.listens_for(pool, 'connect')
+        def on_connect(dbapi_connection, connection_record):
+            self.incr('connects')
+
+        @event.listens_for(pool, 'checkout')
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            if pool.overflow() > 0:
+                self.incr('overflow_checkouts')
+
+        @event.listens_for(pool, 'invalidate')
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            self.incr('invalidations')
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    # QueuePool that times how long callers wait for a connection
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        pool_metrics.attach(self)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.incr('timeouts')
+            raise
+        finally:
+            pool_metrics.record_checkout(time.perf_counter() - start)
+
+
+def _env(name, cast, default):
+    value = os.environ.get(name)
+    return cast(value) if value not in (None, '') else default
+
+
+def _env_bool(value):
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def engine_options_from_env(database_uri):
+    # SQLite uses its own single-connection pools, so sizing only applies
+    # to server databases
+    options = {'pool_pre_ping': _env('DB_POOL_PRE_PING', _env_bool, True)}
+    if database_uri.startswith('sqlite'):
+        return options
+    options.update({
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': _env('DB_POOL_SIZE', int, 10),
+        'max_overflow': _env('DB_MAX_OVERFLOW', int, 20),
+        'pool_timeout': _env('DB_POOL_TIMEOUT', float, 10.0),
+        # Recycle well inside MySQL's wait_timeout so idle connections are never stale
+        'pool_recycle': _env('DB_POOL_RECYCLE', int, 1800)
+    })
+    return options
@@ -0,0 +1,146 @@
+# db_routing.py - Send read-only requests to replica engines, writes to the primary
+import itertools
+import threading
+import time
+
+from flask import g, has_request_context
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import QueuePool
+
+from db_pool import engine_options_from_env
+
+
+class Replica:
+    def __init__(self, url, retry_seconds=30.0):
+        self.url = make_url(url)
+        self.retry_seconds = retry_seconds
+        self.down_until = 0.0
+        self.failures = 0
+        self.queries = 0
+        self._engine = None
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self):
+        # Created on first use, so startup never touches the replicas
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = self._create_engine()
+        return self._engine
+
+    def _create_engine(self):
+        options = engine_options_from_env(self.url.render_as_string(hide_password=False))
+        if 'poolclass' in options:
+            # The instrumented pool reports into the primary's metrics
+            options['poolclass'] = QueuePool
+        engine = create_engine(self.url, **options)
+
+        @event.listens_for(engine, 'handle_error')
+        def on_error(context):
+            if context.is_disconnect:
+                self.mark_down()
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def on_execute(*args):
+            self.queries += 1
+
+        return engine
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.down_until
+
+    def in_use(self):
+        if self._engine is None:
+            return 0
+        checkedout = getattr(self._engine.pool, 'checkedout', None)
+        return checkedout() if checkedout else 0
+
+    def mark_down(self):
+        self.failures += 1
+        self.down_until = time.monotonic() + self.retry_seconds
+
+
+class ReplicaSet:
+    def __init__(self, urls=(), strategy='round_robin', retry_seconds=30.0):
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._configure(urls, strategy, retry_seconds)
+
+    def init_app(self, app):
+        app.config.setdefault('DATABASE_REPLICA_URLS', [])
+        app.config.setdefault('REPLICA_STRATEGY', 'round_robin')
+        app.config.setdefault('REPLICA_RETRY_SECONDS', 30.0)
+        self._configure(app.config['DATABASE_REPLICA_URLS'], app.config['REPLICA_STRATEGY'],
+                        app.config['REPLICA_RETRY_SECONDS'])
+
+    def _configure(self, urls, strategy, retry_seconds):
+        if strategy not in ('round_robin', 'least_loaded'):
+            raise ValueError(f'Unknown replica strategy: {strategy}')
+        self.strategy = strategy
+        self.replicas = [Replica(url, retry_seconds) for url in urls]
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def choose(self):
+        # None when every replica is down, so the caller uses the primary
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        if self.strategy == 'least_loaded':
+            return min(healthy, key=Replica.in_use)
+        with self._lock:
+            return healthy[next(self._next) % len(healthy)]
+
+    def snapshot(self):
+        return [{
+            'url': replica.url.render_as_string(hide_password=True),
+            'healthy': replica.healthy,
+            'in_use': replica.in_use(),
+            'queries': replica.queries,
+            'failures': replica.failures
+        } for replica in self.replicas]
+
+
+def use_primary():
+    # Sends the rest of the current request's queries to the primary
+    if has_request_context():
+        g.db_replica = None
+
+
+class RoutingSession(SignallingSession):
+    # Uses the replica chosen for the current request (g.db_replica) for
+    # plain reads. Flushes and INSERT/UPDATE/DELETE always go to the primary
+    # and pin the rest of the request there.
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get('db_replica') if has_request_context() else None
+        if replica is not None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                g.db_replica = None
+            elif self._connect_replica(replica):
+                return replica.engine
+        return super().get_bind(mapper, clause)
+
+    def _connect_replica(self, replica):
+        # Opens the replica connection up front so an unreachable replica
+        # falls back to the primary instead of failing the request
+        if g.get('db_replica_connected'):
+            return True
+        try:
+            self.connection(bind_arguments={'bind': replica.engine})
+        except DBAPIError:
+            replica.mark_down()
+            g.db_replica = None
+            return False
+        g.db_replica_connected = True
+        return True
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
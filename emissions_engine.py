@@ -0,0 +1,164 @@
+# emissions_engine.py - Server-side port of the calculator.html emissions math
+import numpy as np
+
+# Per-gallon factors (kg) by vehicle type, kept in sync with calculator.html
+EMISSIONS_FACTORS = {
+    'sedan': {'co2': 8.887, 'ch4': 0.0178, 'n2o': 0.0148},
+    'suv': {'co2': 10.657, 'ch4': 0.0214, 'n2o': 0.0178},
+    'truck': {'co2': 12.874, 'ch4': 0.0267, 'n2o': 0.0223},
+    'electric': {'co2': 0, 'ch4': 0, 'n2o': 0},
+    'motorcycle': {'co2': 4.445, 'ch4': 0.0089, 'n2o': 0.0074},
+    'hybrid': {'co2': 6.657, 'ch4': 0.0134, 'n2o': 0.0112}
+}
+
+DRIVING_STYLE_FACTORS = {
+    'normal': 1,
+    'aggressive': 1.3,
+    'eco': 0.8
+}
+
+FUEL_TYPE_FACTORS = {
+    'gasoline': 1,
+    'diesel': 1.1,
+    'electric': 0.4,
+    'hybrid': 0.7
+}
+
+# Global warming potential of CH4 and N2O relative to CO2
+CH4_GWP = 25
+N2O_GWP = 298
+
+KM_PER_MILE = 1.60934
+KMPL_TO_MPG = 2.35214
+
+# distance unit -> multiplier to annual miles. 'miles' and 'km' are plain
+# distances (e.g. a single trip), so the "annual" figures are trip totals.
+DISTANCE_UNITS = {
+    'milesAnnually': 1.0,
+    'kmDaily': 365 / KM_PER_MILE,
+    'kmMonthly': 12 / KM_PER_MILE,
+    'miles': 1.0,
+    'km': 1 / KM_PER_MILE
+}
+
+EFFICIENCY_UNITS = {
+    'mpg': 1.0,
+    'kmpl': KMPL_TO_MPG
+}
+
+# Free-text UserCar.fuel_type values -> FUEL_TYPE_FACTORS keys
+FUEL_TYPE_ALIASES = {
+    'gasoline': 'gasoline',
+    'petrol': 'gasoline',
+    'gas': 'gasoline',
+    'diesel': 'diesel',
+    'electric': 'electric',
+    'ev': 'electric',
+    'hybrid': 'hybrid'
+}
+
+# Free-text UserCar.type values -> EMISSIONS_FACTORS keys
+VEHICLE_TYPE_ALIASES = {
+    'car': 'sedan',
+    'sedan': 'sedan',
+    'hatchback': 'sedan',
+    'suv': 'suv',
+    'truck': 'truck',
+    'pickup': 'truck',
+    'motorcycle': 'motorcycle',
+    'bike': 'motorcycle',
+    'scooter': 'motorcycle'
+}
+
+# Lookup tables as arrays so a whole batch is resolved with fancy indexing
+_VEHICLE_TYPES = list(EMISSIONS_FACTORS)
+_VEHICLE_INDEX = {name: i for i, name in enumerate(_VEHICLE_TYPES)}
+_GAS_FACTORS = np.array([[EMISSIONS_FACTORS[name][gas] for gas in ('co2', 'ch4', 'n2o')]
+                         for name in _VEHICLE_TYPES])
+_GWP = np.array([1.0, CH4_GWP, N2O_GWP])
+
+
+def _lookup(rows, field, table, default=None):
+    values = np.empty(len(rows))
+    for i, row in enumerate(rows):
+        key = row.get(field, default)
+        try:
+            values[i] = table[key]
+        except (KeyError, TypeError):
+            raise ValueError(f'Row {i}: invalid {field} {key!r}')
+    return values
+
+
+def _positive(rows, field):
+    values = np.empty(len(rows))
+    for i, row in enumerate(rows):
+        try:
+            values[i] = float(row[field])
+        except KeyError:
+            raise ValueError(f'Row {i}: missing {field}')
+        except (TypeError, ValueError):
+            raise ValueError(f'Row {i}: invalid {field} {row[field]!r}')
+        if not values[i] > 0:
+            raise ValueError(f'Row {i}: {field} must be positive')
+    return values
+
+
+def calculate_batch(rows):
+    # rows: iterable of dicts with distance, efficiency, vehicle_type,
+    # fuel_type and optional driving_style / distance_unit / efficiency_unit.
+    # Returns per-row results and fleet totals; all emissions are in tons.
+    rows = list(rows)
+    if not rows:
+        return [], {'annual_emissions': 0.0, 'co2_emissions': 0.0,
+                    'ch4_emissions': 0.0, 'n2o_emissions': 0.0}
+
+    vehicle_idx = np.empty(len(rows), dtype=np.intp)
+    for i, row in enumerate(rows):
+        try:
+            vehicle_idx[i] = _VEHICLE_INDEX[row.get('vehicle_type')]
+        except (KeyError, TypeError):
+            raise ValueError(f"Row {i}: invalid vehicle_type {row.get('vehicle_type')!r}")
+
+    annual_miles = _positive(rows, 'distance') * _lookup(rows, 'distance_unit', DISTANCE_UNITS, 'milesAnnually')
+    mpg = _positive(rows, 'efficiency') * _lookup(rows, 'efficiency_unit', EFFICIENCY_UNITS, 'mpg')
+    multiplier = (_lookup(rows, 'driving_style', DRIVING_STYLE_FACTORS, 'normal') *
+                  _lookup(rows, 'fuel_type', FUEL_TYPE_FACTORS))
+
+    gallons = annual_miles / mpg
+    # (n, 3) matrix of CO2 / CH4 / N2O in tons
+    gases = _GAS_FACTORS[vehicle_idx] * (gallons * multiplier)[:, None] / 1000
+    total = gases @ _GWP
+
+    results = [{
+        'annual_emissions': annual,
+        'monthly_emissions': annual / 12,
+        'daily_emissions': annual / 365,
+        'co2_emissions': co2,
+        'ch4_emissions': ch4,
+        'n2o_emissions': n2o,
+        'annual_miles': miles
+    } for annual, (co2, ch4, n2o), miles in zip(total.tolist(), gases.tolist(), annual_miles.tolist())]
+
+    co2, ch4, n2o = gases.sum(axis=0).tolist()
+    totals = {
+        'annual_emissions': float(total.sum()),
+        'co2_emissions': co2,
+        'ch4_emissions': ch4,
+        'n2o_emissions': n2o
+    }
+    return results, totals
+
+
+def vehicle_profile(vehicle_type, fuel_type):
+    # Map a stored vehicle's free-text type/fuel to engine keys
+    fuel = FUEL_TYPE_ALIASES.get((fuel_type or '').strip().lower())
+    if fuel is None:
+        raise ValueError(f'Unsupported fuel type {fuel_type!r}')
+    if fuel in ('electric', 'hybrid'):
+        return fuel, fuel
+    return VEHICLE_TYPE_ALIASES.get((vehicle_type or '').strip().lower(), 'sedan'), fuel
+
+
+def calculate(row):
+    results, _ = calculate_batch([row])
+    return results[0]
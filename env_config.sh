@@ -15,4 +15,118 @@ DATABASE_URL=sqlite:///app.db
 # Server Configuration
 FLASK_ENV=development
 FLASK_DEBUG=True
-PORT=5000
\ No newline at end of file
+PORT=5000
+# Largest request body in bytes (413 beyond it), including NDJSON uploads to
+# /trips/bulk and /emissions/bulk
+MAX_CONTENT_LENGTH=16777216
+
+# Database connection pool (ignored for SQLite)
+DB_POOL_SIZE=10
+DB_MAX_OVERFLOW=20
+DB_POOL_TIMEOUT=10
+DB_POOL_RECYCLE=1800
+DB_POOL_PRE_PING=True
+
+# SQL profiling (Server-Timing header, slow request/query log)
+SQL_PROFILING=False
+SLOW_REQUEST_MS=500
+SLOW_QUERY_MS=100
+
+# /api/metrics (pool, replicas, slow SQL with plans, admission counters) is
+# served to admin users and to requests whose X-Metrics-Token header
+# matches METRICS_TOKEN; empty: admins only
+METRICS_TOKEN=
+
+# Response cache TTL in seconds for /posts, /messages and marketplace
+# listings. The cache is per worker process and a write only invalidates the
+# worker that handled it, so this is how long other workers can serve a page
+# without a new post, message or listing. Feed like/view counts are always
+# current.
+RESPONSE_CACHE_TTL=30
+
+# Password hashing (Werkzeug method string). PBKDF2 runs on the request
+# thread and releases the GIL; PASSWORD_HASH_WORKERS > 0 moves it to a
+# per-process pool of that many forkserver processes instead (gunicorn
+# caps it to CPUs / WEB_WORKERS)
+PASSWORD_HASH_METHOD=pbkdf2:sha256:260000
+PASSWORD_HASH_WORKERS=0
+
+# Post search backend: auto (FULLTEXT on MySQL, in-process index otherwise), fulltext or memory
+SEARCH_BACKEND=auto
+# Seconds between full rebuilds of the in-process index (new posts are picked up on every search)
+SEARCH_INDEX_REFRESH=300
+
+# Seconds to keep each zoom level's heatmap cells before re-reading them
+HEATMAP_CACHE_TTL=300
+# Heatmap cells crossed by fewer trips than this are left out
+HEATMAP_MIN_TRIPS=5
+
+# Auth: session (cookie) or token (signed bearer tokens returned by /login)
+AUTH_MODE=session
+AUTH_TOKEN_MAX_AGE=86400
+# Per-process cache of username/email; role and token revocation are
+# checked against the database on every request
+USER_PROFILE_CACHE_TTL=60
+
+# Static pages: precompress into memory at startup and cache for STATIC_MAX_AGE seconds
+STATIC_PRECOMPRESS=True
+STATIC_MAX_AGE=300
+
+# Logging: JSON lines on stdout via a background queue listener
+LOG_LEVEL=INFO
+# Per-logger overrides, e.g. flask_backend_sql=DEBUG,werkzeug=WARNING
+LOG_LEVELS=
+# Fraction of DEBUG records kept
+LOG_DEBUG_SAMPLE_RATE=1.0
+LOG_REQUESTS=False
+
+# Leaderboard: rolling windows in days (0 = all time), minimum km to be ranked, reload interval
+LEADERBOARD_WINDOWS=7,30,0
+LEADERBOARD_MIN_DISTANCE=50
+LEADERBOARD_REFRESH=300
+
+# Read replicas (comma-separated URLs); GETs go to a replica unless the client wrote
+# within REPLICA_PIN_SECONDS (tracked per signed-in user in the database,
+# otherwise by cookie). Strategy: round_robin or least_loaded.
+DATABASE_REPLICA_URLS=
+REPLICA_STRATEGY=round_robin
+REPLICA_PIN_SECONDS=5
+REPLICA_RETRY_SECONDS=30
+
+# Archival: `flask rotate-archives` moves trips and emission records older
+# than this many months into the *_archive tables
+ARCHIVE_HOT_MONTHS=12
+
+# Production server (gunicorn -c gunicorn.conf.py wsgi:app). Run
+# `FLASK_APP=flask_backend_sql flask migrate` on deploy; startup no longer
+# touches the schema. WEB_WORKERS defaults to 2 x CPUs + 1.
+WEB_BIND=0.0.0.0:5000
+WEB_WORKERS=
+WEB_THREADS=4
+WEB_TIMEOUT=30
+WEB_GRACEFUL_TIMEOUT=30
+WEB_KEEPALIVE=5
+WEB_MAX_REQUESTS=0
+WEB_PRELOAD=true
+# Server-Sent Events (/stream/*). Events go through the stream_event table,
+# which every process polls each SSE_POLL_INTERVAL seconds; clients can
+# resume with Last-Event-ID for SSE_RETENTION seconds. gunicorn starts
+# stream_server.py on STREAM_BIND (empty: streams stay on the worker
+# threads) and redirects /stream/* to SSE_STREAM_URL, by default the
+# request's host on the STREAM_BIND port. A proxy can instead route
+# /stream/ to STREAM_BIND directly. Raise the open-file limit
+# (ulimit -n) for the stream server to hold thousands of clients.
+STREAM_BIND=0.0.0.0:5001
+SSE_STREAM_URL=
+SSE_POLL_INTERVAL=0.5
+SSE_RETENTION=3600
+
+# Admission control for write routes: per-user and per-route token buckets
+# (429 + Retry-After), overridable per view as name=tokens_per_sec:burst,
+# e.g. ADMISSION_LIMITS=like_post=2:40,create_trip=0.5:10. Requests beyond
+# ADMISSION_MAX_CONCURRENT in flight get 503; unset sizes it to
+# DB_POOL_SIZE + DB_MAX_OVERFLOW, 0 disables it. Counters: /api/metrics.
+ADMISSION_CONTROL=True
+ADMISSION_LIMITS=
+ADMISSION_ROUTE_LIMITS=
+ADMISSION_MAX_CONCURRENT=
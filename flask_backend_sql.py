@@ -1,30 +1,152 @@
 # app.py - Main application file
-from flask import Flask, request, jsonify, session, render_template, send_from_directory
-from flask_sqlalchemy import SQLAlchemy
+from flask import Blueprint, Flask, current_app, request, jsonify, session, g, render_template, send_from_directory, abort, redirect, Response, stream_with_context
 from flask_cors import CORS
-from datetime import datetime
+from datetime import datetime, date, timedelta
+from collections import defaultdict
+from functools import partial
+import base64
+import csv
+import io
+import hmac
+import json
+import atexit
+import click
+import math
+import logging
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
+import threading
+import numpy as np
 import pymysql
+from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import DropIndex
+from counters import BufferedCounter
+import emissions_engine
+import geo
+from db_pool import engine_options_from_env, pool_metrics
+from db_routing import ReplicaSet, RoutingSQLAlchemy, use_primary
+from sql_profiler import SQLProfiler
+from response_cache import ResponseCache, MemoryBackend
+from password_hashing import PasswordHasher
+from auth_tokens import TokenSigner
+from static_assets import AssetStore
+from log_pipeline import LogPipeline
+from search_index import InvertedIndex
+from pubsub import Broker, TableEventLog, sse_message
+from leaderboard import Leaderboard
+from serialization import Field, Schema, dumps, json_response, parse_fields
+from archival import archive_table, below_newest, month_start, move_rows, newest_first
+from admission import AdmissionControl
+from vehicle_catalog import VehicleCatalog
+import migrations
 
 pymysql.install_as_MySQLdb()
 
-app = Flask(__name__)
-CORS(app, 
-     resources={r"/*": {
-         "origins": ["http://localhost:8000", "http://127.0.0.1:8000", "http://127.0.0.1:5000"],
-         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-         "allow_headers": ["Content-Type", "Authorization"],
-         "supports_credentials": True
-     }},
-     supports_credentials=True)
+CORS_ORIGINS = ["http://localhost:8000", "http://127.0.0.1:8000", "http://127.0.0.1:5000"]
 
-# Database Configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'mysql+pymysql://root:@127.0.0.1:3306/greengear'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = 'your-secret-key-here'
+def config_from_env():
+    # create_app(config) applies its overrides on top of these
+    load_dotenv()
+    return {
+        'SQLALCHEMY_DATABASE_URI': os.environ.get('DATABASE_URL', 'mysql+pymysql://root:@127.0.0.1:3306/greengear'),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        # Request body limit in bytes, also applied while NDJSON bulk bodies stream in
+        'MAX_CONTENT_LENGTH': int(os.environ.get('MAX_CONTENT_LENGTH') or 16 * 1024 * 1024),
+        # Comma-separated read replica URLs; GET requests are spread across them
+        'DATABASE_REPLICA_URLS': [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()],
+        'REPLICA_STRATEGY': os.environ.get('REPLICA_STRATEGY', 'round_robin'),
+        'REPLICA_PIN_SECONDS': float(os.environ.get('REPLICA_PIN_SECONDS', 5)),
+        'REPLICA_RETRY_SECONDS': float(os.environ.get('REPLICA_RETRY_SECONDS', 30)),
+        'SECRET_KEY': os.environ.get('SECRET_KEY', 'your-secret-key-here'),
+        'VIEW_COUNTER_FLUSH_INTERVAL': float(os.environ.get('VIEW_COUNTER_FLUSH_INTERVAL', 5.0)),
+        'VIEW_COUNTER_MAX_PENDING': int(os.environ.get('VIEW_COUNTER_MAX_PENDING', 1000)),
+        'RESPONSE_CACHE_TTL': float(os.environ.get('RESPONSE_CACHE_TTL', 30)),
+        'PASSWORD_HASH_METHOD': os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000'),
+        'PASSWORD_HASH_WORKERS': int(os.environ.get('PASSWORD_HASH_WORKERS') or 0),
+        'AUTH_MODE': os.environ.get('AUTH_MODE', 'session'),
+        'AUTH_TOKEN_MAX_AGE': int(os.environ.get('AUTH_TOKEN_MAX_AGE', 86400)),
+        'USER_PROFILE_CACHE_TTL': float(os.environ.get('USER_PROFILE_CACHE_TTL', 60)),
+        'STATIC_PRECOMPRESS': os.environ.get('STATIC_PRECOMPRESS', 'true').lower() in ('1', 'true', 'yes'),
+        'STATIC_MAX_AGE': int(os.environ.get('STATIC_MAX_AGE', 300)),
+        'SEARCH_BACKEND': os.environ.get('SEARCH_BACKEND', 'auto'),
+        'SEARCH_INDEX_REFRESH': float(os.environ.get('SEARCH_INDEX_REFRESH', 300)),
+        'SSE_HEARTBEAT': float(os.environ.get('SSE_HEARTBEAT', 15)),
+        'SSE_POLL_INTERVAL': float(os.environ.get('SSE_POLL_INTERVAL', 0.5)),
+        'SSE_RETENTION': float(os.environ.get('SSE_RETENTION', 3600)),
+        # Base URL of stream_server.py; /stream/* redirects there when set.
+        # ":<port>" means the request's own host on that port.
+        'SSE_STREAM_URL': os.environ.get('SSE_STREAM_URL', ''),
+        'HEATMAP_CACHE_TTL': float(os.environ.get('HEATMAP_CACHE_TTL', 300)),
+        'HEATMAP_MIN_TRIPS': int(os.environ.get('HEATMAP_MIN_TRIPS', 5)),
+        'LEADERBOARD_WINDOWS': [int(days) for days in os.environ.get('LEADERBOARD_WINDOWS', '7,30,0').split(',')],
+        'LEADERBOARD_MIN_DISTANCE': float(os.environ.get('LEADERBOARD_MIN_DISTANCE', 50)),
+        'LEADERBOARD_REFRESH': float(os.environ.get('LEADERBOARD_REFRESH', 300)),
+        'ARCHIVE_HOT_MONTHS': int(os.environ.get('ARCHIVE_HOT_MONTHS', 12)),
+        'LOG_LEVEL': os.environ.get('LOG_LEVEL', 'INFO'),
+        'LOG_LEVELS': os.environ.get('LOG_LEVELS', ''),
+        'LOG_DEBUG_SAMPLE_RATE': float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 1.0)),
+        'LOG_REQUESTS': os.environ.get('LOG_REQUESTS', '').lower() in ('1', 'true', 'yes'),
+        'SQL_PROFILING': os.environ.get('SQL_PROFILING', '').lower() in ('1', 'true', 'yes'),
+        'SLOW_REQUEST_MS': float(os.environ.get('SLOW_REQUEST_MS', 500)),
+        'SLOW_QUERY_MS': float(os.environ.get('SLOW_QUERY_MS', 100)),
+        # Sent as X-Metrics-Token by monitoring; admins can read /api/metrics without it
+        'METRICS_TOKEN': os.environ.get('METRICS_TOKEN', ''),
+        'ADMISSION_CONTROL': os.environ.get('ADMISSION_CONTROL', 'true').lower() in ('1', 'true', 'yes'),
+        # Per-view "name=rate:burst" overrides of the @admission.limit defaults
+        'ADMISSION_LIMITS': os.environ.get('ADMISSION_LIMITS', ''),
+        'ADMISSION_ROUTE_LIMITS': os.environ.get('ADMISSION_ROUTE_LIMITS', ''),
+        # Unset: sized to the DB pool in create_app; 0 disables
+        'ADMISSION_MAX_CONCURRENT': int(os.environ['ADMISSION_MAX_CONCURRENT']) if os.environ.get('ADMISSION_MAX_CONCURRENT') else None
+    }
 
-db = SQLAlchemy(app)
+api = Blueprint('api', __name__, cli_group=None)
+
+def log_user_id():
+    # Never triggers a profile lookup just to log
+    user = g.get('auth_user')
+    return user['id'] if user else session.get('user_id')
+
+log_pipeline = LogPipeline(user_id=log_user_id)
+logger = logging.getLogger(__name__)
+
+db = RoutingSQLAlchemy()
+replicas = ReplicaSet()
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+REPLICA_PIN_COOKIE = 'db_pin'
+
+@api.before_app_request
+def route_reads_to_replica():
+    # A client that wrote recently keeps its reads on the primary until the
+    # replicas have caught up. Signed-in users are pinned on their user row,
+    # which works for bearer-token clients that keep no cookies; anyone else
+    # carries a short-lived cookie.
+    if replicas and request.method in READ_METHODS and not request.cookies.get(REPLICA_PIN_COOKIE):
+        user = current_user()
+        if user is None or user['replica_pin_until'] is None or user['replica_pin_until'] < datetime.utcnow():
+            g.db_replica = replicas.choose()
+
+@api.after_app_request
+def pin_writer_to_primary(response):
+    if replicas and request.method not in READ_METHODS and response.status_code < 400:
+        pin_seconds = current_app.config['REPLICA_PIN_SECONDS']
+        response.set_cookie(REPLICA_PIN_COOKIE, '1', max_age=math.ceil(pin_seconds), httponly=True, samesite='Lax')
+        user_id = current_user_id()
+        if user_id is not None:
+            table = User.__table__
+            with db.engine.begin() as conn:
+                conn.execute(table.update().where(table.c.id == user_id).values(
+                    replica_pin_until=datetime.utcnow() + timedelta(seconds=pin_seconds)))
+    return response
+sql_profiler = SQLProfiler()
+# Cached bodies are shared with clients pinned to the primary, so misses
+# are rendered from the primary
+response_cache = ResponseCache(before_fill=use_primary)
+password_hasher = PasswordHasher()
+token_signer = TokenSigner()
+user_profiles = MemoryBackend(max_entries=10000)
+admission = AdmissionControl(key=lambda: current_user_id() or request.remote_addr)
+static_assets = AssetStore(os.path.dirname(os.path.abspath(__file__)))
+broker = Broker()
 
 # Database Models
 class User(db.Model):
@@ -34,12 +156,16 @@ class User(db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     role = db.Column(db.String(20), nullable=False, default='customer')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped to revoke every signed token issued to the user
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # The user's reads stay on the primary until then after they write
+    replica_pin_until = db.Column(db.DateTime)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
 
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -47,16 +173,39 @@ class Message(db.Model):
     author_name = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+# Vehicle catalog: makes, models, fuel types and transmissions are stored
+# once and referenced from UserCar by id; vehicle_catalog caches the names
+class VehicleMake(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+
+class VehicleModel(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    make_id = db.Column(db.Integer, db.ForeignKey('vehicle_make.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('make_id', 'name', name='uq_vehicle_model_make_name'),
+    )
+
+class FuelType(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+
+class Transmission(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(20), unique=True, nullable=False)
+
 class UserCar(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    company = db.Column(db.String(100), nullable=False)
-    model = db.Column(db.String(100), nullable=False)
+    make_id = db.Column(db.Integer, db.ForeignKey('vehicle_make.id'))
+    model_id = db.Column(db.Integer, db.ForeignKey('vehicle_model.id'))
     year = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
     mileage = db.Column(db.Float, nullable=False)
-    fuel_type = db.Column(db.String(50), nullable=False)
-    transmission = db.Column(db.String(20), nullable=False)
+    fuel_type_id = db.Column(db.Integer, db.ForeignKey('fuel_type.id'))
+    transmission_id = db.Column(db.Integer, db.ForeignKey('transmission.id'))
     image_url = db.Column(db.String(500))
     type = db.Column(db.String(50))
     color = db.Column(db.String(50))
@@ -64,9 +213,85 @@ class UserCar(db.Model):
     purchase_date = db.Column(db.Date)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    @property
+    def company(self):
+        return vehicle_catalog.name('make', self.make_id)
+
+    @property
+    def model(self):
+        return vehicle_catalog.name('model', self.model_id)
+
+    @property
+    def fuel_type(self):
+        return vehicle_catalog.name('fuel_type', self.fuel_type_id)
+
+    @property
+    def transmission(self):
+        return vehicle_catalog.name('transmission', self.transmission_id)
+
+    # Indexes backing the marketplace search filters and keyset sort orders
+    __table_args__ = (
+        db.Index('ix_user_car_fuel_type_id_price', 'fuel_type_id', 'price', 'id'),
+        db.Index('ix_user_car_make_id', 'make_id', 'id'),
+        db.Index('ix_user_car_transmission_id', 'transmission_id', 'id'),
+        db.Index('ix_user_car_price', 'price', 'id'),
+        db.Index('ix_user_car_year', 'year', 'id'),
+        db.Index('ix_user_car_mileage', 'mileage', 'id'),
+        db.Index('ix_user_car_created_at', 'created_at', 'id'),
+    )
+
 # Add relationship to User model
 User.cars = db.relationship('UserCar', backref='owner', lazy=True)
 
+CATALOG_MODELS = {'make': VehicleMake, 'model': VehicleModel, 'fuel_type': FuelType, 'transmission': Transmission}
+
+def load_vehicle_catalog():
+    with db.engine.connect() as conn:
+        for kind, model in CATALOG_MODELS.items():
+            parent = model.make_id if kind == 'model' else db.null()
+            for entry_id, name, parent_id in conn.execute(db.select(model.id, model.name, parent)):
+                yield kind, entry_id, name, parent_id
+
+def create_catalog_entry(kind, name, parent_id):
+    # Committed in its own transaction: the id is cached process-wide, so it
+    # must survive a rollback of the request that created it
+    table = CATALOG_MODELS[kind].__table__
+    values = {'name': name}
+    match = db.func.lower(table.c.name) == name.lower()
+    if kind == 'model':
+        values['make_id'] = parent_id
+        match = db.and_(match, table.c.make_id == parent_id)
+    existing = db.select(table.c.id).where(match).order_by(table.c.id).limit(1)
+    try:
+        with db.engine.begin() as conn:
+            entry_id = conn.execute(existing).scalar()
+            if entry_id is None:
+                entry_id = conn.execute(table.insert().values(**values)).inserted_primary_key[0]
+    except IntegrityError:
+        # Another process inserted it first
+        with db.engine.connect() as conn:
+            entry_id = conn.execute(existing).scalar()
+    return entry_id
+
+vehicle_catalog = VehicleCatalog(load_vehicle_catalog, create_catalog_entry)
+
+def vehicle_catalog_ids(company, model, fuel_type, transmission):
+    make_id = vehicle_catalog.intern('make', company)
+    return {
+        'make_id': make_id,
+        'model_id': vehicle_catalog.intern('model', model, make_id),
+        'fuel_type_id': vehicle_catalog.intern('fuel_type', fuel_type),
+        'transmission_id': vehicle_catalog.intern('transmission', transmission)
+    }
+
+def catalog_filter(column, kind, name):
+    # Unknown names match nothing
+    entry_id = vehicle_catalog.lookup(kind, name)
+    return column == entry_id if entry_id is not None else db.false()
+
+def catalog_name(kind):
+    return partial(vehicle_catalog.name, kind)
+
 # New Models for Enhanced Features
 class Trip(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -78,12 +303,23 @@ class Trip(db.Model):
     end_time = db.Column(db.DateTime, nullable=False)
     vehicle_id = db.Column(db.Integer, db.ForeignKey('user_car.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Optional geometry for the emissions heatmap
+    start_lat = db.Column(db.Float)
+    start_lng = db.Column(db.Float)
+    end_lat = db.Column(db.Float)
+    end_lng = db.Column(db.Float)
+    route_polyline = db.Column(db.Text)
+    start_geohash = db.Column(db.String(12), index=True)
     
     # Relationships
     user = db.relationship('User', backref='trips')
     vehicle = db.relationship('UserCar', backref='trips')
     emission_record = db.relationship('EmissionRecord', backref='trip', uselist=False)
 
+    __table_args__ = (
+        db.Index('ix_trip_user_created_at', 'user_id', 'created_at'),
+    )
+
 class EmissionRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     trip_id = db.Column(db.Integer, db.ForeignKey('trip.id'))
@@ -99,6 +335,53 @@ class EmissionRecord(db.Model):
     user = db.relationship('User', backref='emission_records')
     vehicle = db.relationship('UserCar', backref='emission_records')
 
+    __table_args__ = (
+        db.Index('ix_emission_record_user_record_date', 'user_id', 'record_date'),
+    )
+
+# Cold rows are moved here by `flask rotate-archives`. The aliased entities
+# let the Trip/EmissionRecord queries run unchanged against the archive.
+trip_archive = archive_table(Trip.__table__, db.metadata, ('user_id', 'created_at'))
+emission_record_archive = archive_table(EmissionRecord.__table__, db.metadata, ('user_id', 'record_date'))
+TripArchive = db.aliased(Trip, trip_archive, adapt_on_names=True)
+EmissionRecordArchive = db.aliased(EmissionRecord, emission_record_archive, adapt_on_names=True)
+
+class ArchiveWatermark(db.Model):
+    # Every archived row of `table_name` is older than `archived_before`
+    table_name = db.Column(db.String(64), primary_key=True)
+    archived_before = db.Column(db.DateTime, nullable=False)
+
+def archive_watermark(table):
+    row = ArchiveWatermark.query.get(table.name)
+    return row.archived_before if row else None
+
+class EmissionRollup(db.Model):
+    # Pre-aggregated EmissionRecord totals per user, vehicle and day/month,
+    # maintained incrementally by apply_emission_rollups()
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('user_car.id'), nullable=False)
+    granularity = db.Column(db.Enum('day', 'month'), nullable=False)
+    period_start = db.Column(db.Date, nullable=False)
+    co2_emissions = db.Column(db.Float, nullable=False, default=0)
+    distance = db.Column(db.Float, nullable=False, default=0)
+    fuel_consumed = db.Column(db.Float, nullable=False, default=0)
+    record_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'granularity', 'period_start', 'vehicle_id',
+                            name='uq_emission_rollup_period'),
+    )
+
+class HeatmapCell(db.Model):
+    # Trip CO2 and trip counts binned into each heatmap zoom level's grid,
+    # maintained incrementally by apply_heatmap_cells()
+    zoom = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    cell_row = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    cell_col = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    co2_emissions = db.Column(db.Float, nullable=False, default=0)
+    trip_count = db.Column(db.Integer, nullable=False, default=0)
+
 class CommunityPost(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -114,6 +397,28 @@ class CommunityPost(db.Model):
     user = db.relationship('User', backref='posts')
     comments = db.relationship('PostComment', backref='post', lazy='dynamic')
 
+    __table_args__ = (
+        # For /posts/search; only MySQL supports FULLTEXT, so other
+        # databases skip it (see migrations.applies_to)
+        db.Index('ft_community_post', 'title', 'content', mysql_prefix='FULLTEXT',
+                 info={'dialects': ('mysql',)}),
+    )
+
+# Log of Server-Sent Events; every process polls it, so an event published
+# by one worker reaches streams served by any other
+class StreamEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(100), nullable=False)
+    event_type = db.Column(db.String(50), nullable=False)
+    data = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index('ix_stream_event_channel', 'channel', 'id'),
+        # Never reuse the ids of pruned events; clients resume by id
+        {'sqlite_autoincrement': True},
+    )
+
 class PostComment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     post_id = db.Column(db.Integer, db.ForeignKey('community_post.id'), nullable=False)
@@ -125,17 +430,237 @@ class PostComment(db.Model):
     # Relationships
     user = db.relationship('User', backref='comments')
 
+    __table_args__ = (
+        db.Index('ft_post_comment', 'content', mysql_prefix='FULLTEXT', info={'dialects': ('mysql',)}),
+    )
+
+# Counters
+# Views are buffered in memory and written as one batched UPDATE per flush;
+# likes are applied immediately as an atomic SQL-side increment. Neither
+# touches updated_at, which tracks edits to the post itself.
+def flush_post_views(batch):
+    table = CommunityPost.__table__
+    stmt = table.update().where(table.c.id == db.bindparam('post_id')).values(
+        views=table.c.views + db.bindparam('amount'),
+        updated_at=table.c.updated_at
+    )
+    with db.engine.begin() as conn:
+        conn.execute(stmt, [{'post_id': post_id, 'amount': amount}
+                            for post_id, amount in batch.items()])
+
+post_views = BufferedCounter(flush_post_views)
+
+def flush_counters(app):
+    with app.app_context():
+        post_views.flush()
+
+def increment_column(model, row_id, column, amount=1):
+    extra = {}
+    if 'updated_at' in model.__table__.c:
+        extra[model.updated_at] = model.updated_at
+    updated = model.query.filter_by(id=row_id).update(
+        {column: column + amount, **extra}, synchronize_session=False)
+    db.session.commit()
+    return updated
+
+# Emission rollups
+ROLLUP_GRANULARITIES = ('day', 'month')
+
+def rollup_period(record_date, granularity):
+    if granularity == 'month':
+        return record_date.replace(day=1)
+    return record_date
+
+def apply_emission_rollups(records):
+    # Fold new emission rows (dicts of EmissionRecord column values) into the
+    # rollup table inside the caller's transaction. Deltas are combined per
+    # rollup row first, so a bulk insert costs one upsert per touched period.
+    deltas = defaultdict(lambda: [0.0, 0.0, 0.0, 0])
+    if leaderboard.ready:
+        db.session.info.setdefault('leaderboard_pending', []).extend(records)
+    for record in records:
+        for granularity in ROLLUP_GRANULARITIES:
+            key = (record['user_id'], record['vehicle_id'], granularity,
+                   rollup_period(record['record_date'], granularity))
+            delta = deltas[key]
+            delta[0] += record['co2_emissions']
+            delta[1] += record['distance']
+            delta[2] += record['fuel_consumed']
+            delta[3] += 1
+
+    table = EmissionRollup.__table__
+    for (user_id, vehicle_id, granularity, period_start), (co2, distance, fuel, count) in deltas.items():
+        match = db.and_(table.c.user_id == user_id, table.c.vehicle_id == vehicle_id,
+                        table.c.granularity == granularity, table.c.period_start == period_start)
+        increment = table.update().where(match).values(
+            co2_emissions=table.c.co2_emissions + co2,
+            distance=table.c.distance + distance,
+            fuel_consumed=table.c.fuel_consumed + fuel,
+            record_count=table.c.record_count + count
+        )
+        if db.session.execute(increment).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(
+                    user_id=user_id, vehicle_id=vehicle_id, granularity=granularity,
+                    period_start=period_start, co2_emissions=co2, distance=distance,
+                    fuel_consumed=fuel, record_count=count
+                ))
+        except IntegrityError:
+            # Another writer created the row first
+            db.session.execute(increment)
+
+def rebuild_emission_rollups():
+    # Pages by id so the rollup upserts never run while a result is streaming
+    EmissionRollup.query.delete()
+    for entity in (EmissionRecord, EmissionRecordArchive):
+        columns = [entity.id, entity.user_id, entity.vehicle_id, entity.record_date,
+                   entity.co2_emissions, entity.distance, entity.fuel_consumed]
+        last_id = 0
+        while True:
+            rows = db.session.query(*columns).filter(entity.id > last_id).order_by(entity.id).limit(5000).all()
+            if not rows:
+                break
+            apply_emission_rollups([row._asdict() for row in rows])
+            last_id = rows[-1].id
+    db.session.info.pop('leaderboard_pending', None)
+    db.session.commit()
+    leaderboard.ready = False
+
+@api.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    rebuild_emission_rollups()
+    print('Emission rollups rebuilt')
+
+def rotate_archives(hot_months):
+    # Archives whole months older than the newest `hot_months` months.
+    # Emission records go first and only with their trip, so a hot trip's
+    # emission record is always hot and an archived trip's is archived.
+    cutoff = month_start(datetime.utcnow(), hot_months)
+    emissions, trips = EmissionRecord.__table__, Trip.__table__
+    old_trip_ids = db.select(trips.c.id).where(trips.c.created_at < cutoff, below_newest(trips))
+    moved_emissions = move_rows(db.session, emissions, emission_record_archive, db.and_(
+        emissions.c.record_date < cutoff.date(),
+        db.or_(emissions.c.trip_id.is_(None), emissions.c.trip_id.in_(old_trip_ids))))
+    referenced = db.select(emissions.c.trip_id).where(emissions.c.trip_id.isnot(None))
+    moved_trips = move_rows(db.session, trips, trip_archive, db.and_(
+        trips.c.created_at < cutoff, trips.c.id.notin_(referenced)))
+
+    for table in (emissions, trips):
+        watermark = ArchiveWatermark.query.get(table.name)
+        if watermark is None:
+            db.session.add(ArchiveWatermark(table_name=table.name, archived_before=cutoff))
+        elif watermark.archived_before < cutoff:
+            watermark.archived_before = cutoff
+    db.session.commit()
+    return cutoff, moved_emissions, moved_trips
+
+@api.cli.command('rotate-archives')
+@click.option('--hot-months', type=int, default=None, help='Months of data to keep hot (ARCHIVE_HOT_MONTHS)')
+def rotate_archives_command(hot_months):
+    if hot_months is None:
+        hot_months = current_app.config['ARCHIVE_HOT_MONTHS']
+    cutoff, moved_emissions, moved_trips = rotate_archives(hot_months)
+    print(f'Archived {moved_emissions} emission records and {moved_trips} trips older than {cutoff.date()}')
+
 # Serve HTML files
-@app.route('/')
+@api.route('/')
 def home():
-    return send_from_directory('.', 'login.html')
+    return serve_file('login.html')
 
-@app.route('/<path:filename>')
+@api.route('/<path:filename>')
 def serve_file(filename):
+    response = static_assets.response(filename)
+    if response is not None:
+        return response
     return send_from_directory('.', filename)
 
+# Authentication
+def user_profile(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'role': user.role,
+        'token_version': user.token_version or 0,
+        'replica_pin_until': user.replica_pin_until
+    }
+
+# Only these are cached per process. role and token_version decide access
+# and revocation, so they are read from the primary on every request and a
+# logout or role change in any worker applies at once; so is the user's
+# replica pin, set by whichever worker handled their last write.
+CACHED_PROFILE_FIELDS = ('id', 'username', 'email')
+
+def load_user_profile(user_id):
+    table = User.__table__
+    profile = user_profiles.get(user_id)
+    # Always from the primary: a replica could still hold a revoked
+    # token_version or an old role
+    with db.engine.connect() as conn:
+        if profile is not None:
+            access = conn.execute(db.select(table.c.role, table.c.token_version, table.c.replica_pin_until)
+                                  .where(table.c.id == user_id)).first()
+            if access is None:
+                return None
+            return {**profile, 'role': access.role, 'token_version': access.token_version or 0,
+                    'replica_pin_until': access.replica_pin_until}
+        user = conn.execute(table.select().where(table.c.id == user_id)).first()
+    if user is None:
+        return None
+    profile = user_profile(user)
+    if current_app.config['USER_PROFILE_CACHE_TTL'] > 0:
+        user_profiles.set(user_id, {field: profile[field] for field in CACHED_PROFILE_FIELDS},
+                          current_app.config['USER_PROFILE_CACHE_TTL'])
+    return profile
+
+@db.event.listens_for(User, 'before_update')
+def revoke_tokens_on_role_change(mapper, connection, user):
+    if db.inspect(user).attrs.role.history.has_changes():
+        user.token_version = (user.token_version or 0) + 1
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def invalidate_user_profile(mapper, connection, user):
+    user_profiles.delete(user.id)
+
+def current_user():
+    # Resolved once per request, from the bearer token or the cookie session
+    if 'auth_user' not in g:
+        g.auth_user = None
+        header = request.headers.get('Authorization', '')
+        if header.startswith('Bearer '):
+            claims = token_signer.verify(header[len('Bearer '):])
+            if claims is not None:
+                profile = load_user_profile(claims['uid'])
+                if profile is not None and profile['token_version'] == claims['ver']:
+                    g.auth_user = profile
+        elif 'user_id' in session:
+            g.auth_user = load_user_profile(session['user_id'])
+    return g.auth_user
+
+def current_user_id():
+    user = current_user()
+    return user['id'] if user else None
+
+def login_response(user, status=200):
+    profile = user_profile(user)
+    body = {
+        'user': {
+            'username': profile['username'],
+            'email': profile['email'],
+            'role': profile['role']
+        }
+    }
+    if current_app.config['AUTH_MODE'] == 'token':
+        body['token'] = token_signer.issue(profile)
+    else:
+        session['user_id'] = user.id
+    return jsonify(body), status
+
 # Authentication Routes
-@app.route('/register', methods=['POST'])
+@api.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
     
@@ -158,16 +683,9 @@ def register():
     db.session.add(user)
     db.session.commit()
     
-    session['user_id'] = user.id
-    return jsonify({
-        'user': {
-            'username': user.username,
-            'email': user.email,
-            'role': user.role
-        }
-    }), 201
+    return login_response(user, 201)
 
-@app.route('/login', methods=['POST'])
+@api.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
     
@@ -179,48 +697,66 @@ def login():
     if not user or not user.check_password(data['password']):
         return jsonify({'error': 'Invalid username or password'}), 401
     
-    session['user_id'] = user.id
-    return jsonify({
-        'user': {
-            'username': user.username,
-            'email': user.email,
-            'role': user.role
-        }
-    })
+    # Transparently move old hashes to the configured KDF settings
+    if password_hasher.needs_rehash(user.password_hash):
+        user.set_password(data['password'])
+        db.session.commit()
+    
+    return login_response(user)
 
-@app.route('/logout', methods=['POST'])
+@api.route('/logout', methods=['POST'])
 def logout():
+    user = current_user()
+    if user is not None:
+        if request.headers.get('Authorization', '').startswith('Bearer '):
+            # Signed tokens can't be recalled, so revoke all of the user's tokens
+            User.query.filter_by(id=user['id']).update(
+                {User.token_version: User.token_version + 1}, synchronize_session=False)
+            db.session.commit()
+        user_profiles.delete(user['id'])
     session.pop('user_id', None)
     return jsonify({'message': 'Logged out successfully'})
 
-@app.route('/check_login', methods=['GET'])
+@api.route('/check_login', methods=['GET'])
 def check_login():
-    if 'user_id' in session:
-        user = User.query.get(session['user_id'])
-        if user:
-            return jsonify({
-                'user': {
-                    'username': user.username,
-                    'email': user.email,
-                    'role': user.role
-                }
-            })
+    user = current_user()
+    if user:
+        return jsonify({
+            'user': {
+                'username': user['username'],
+                'email': user['email'],
+                'role': user['role']
+            }
+        })
     return jsonify({'error': 'Not logged in'}), 401
 
+# Response schemas; list routes accept ?fields= and fetch only those columns
+def request_projection(schema):
+    return schema.select(parse_fields(request.args.get('fields')))
+
+MESSAGE_SCHEMA = Schema(
+    Field('id', Message.id),
+    Field('content', Message.content),
+    Field('author_name', Message.author_name),
+    Field('created_at', Message.created_at)
+)
+
 # Message Routes
-@app.route('/messages', methods=['GET'])
+@api.route('/messages', methods=['GET'])
+@response_cache.cached('messages')
 def get_messages():
-    messages = Message.query.order_by(Message.created_at.desc()).all()
-    return jsonify([{
-        'id': m.id,
-        'content': m.content,
-        'author_name': m.author_name,
-        'created_at': m.created_at.isoformat()
-    } for m in messages])
-
-@app.route('/messages', methods=['POST'])
+    try:
+        projection = request_projection(MESSAGE_SCHEMA)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    rows = db.session.query(*projection.columns).order_by(Message.created_at.desc())
+    return json_response(projection.many(rows))
+
+@api.route('/messages', methods=['POST'])
+@admission.limit(user=(0.2, 10), route=(50, 100))
 def create_message():
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
 
     data = request.get_json()
@@ -234,59 +770,68 @@ def create_message():
     )
     db.session.add(message)
     db.session.commit()
+    response_cache.invalidate('messages')
     
-    return jsonify({
+    payload = {
         'id': message.id,
         'content': message.content,
         'author_name': message.author_name,
         'created_at': message.created_at.isoformat()
-    }), 201
+    }
+    broker.publish('messages', 'message', payload)
+    return jsonify(payload), 201
 
-@app.route('/messages/<int:message_id>', methods=['DELETE'])
+@api.route('/messages/<int:message_id>', methods=['DELETE'])
 def delete_message(message_id):
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
 
     message = Message.query.get_or_404(message_id)
     db.session.delete(message)
     db.session.commit()
+    response_cache.invalidate('messages')
+    broker.publish('messages', 'message_deleted', {'id': message_id})
     return jsonify({'message': 'Message deleted successfully'})
 
 # Car Routes
-@app.route('/api/vehicles', methods=['GET'])
+CAR_SCHEMA = Schema(
+    Field('id', UserCar.id),
+    Field('company', UserCar.make_id, decode=catalog_name('make')),
+    Field('model', UserCar.model_id, decode=catalog_name('model')),
+    Field('year', UserCar.year),
+    Field('price', UserCar.price),
+    Field('mileage', UserCar.mileage),
+    Field('fuel_type', UserCar.fuel_type_id, decode=catalog_name('fuel_type')),
+    Field('transmission', UserCar.transmission_id, decode=catalog_name('transmission')),
+    Field('image_url', UserCar.image_url),
+    Field('created_at', UserCar.created_at)
+)
+
+@api.route('/api/vehicles', methods=['GET'])
 def get_vehicles():
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
         
+    try:
+        projection = request_projection(CAR_SCHEMA)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     # Get filter parameters
     fuel_type = request.args.get('fuel_type')
     
     # Base query - filter by logged-in user
-    query = UserCar.query.filter_by(user_id=session['user_id'])
+    query = db.session.query(*projection.columns).filter(UserCar.user_id == current_user_id())
     
     # Apply filters if provided
     if fuel_type and fuel_type.lower() != 'all':
-        query = query.filter(UserCar.fuel_type == fuel_type)
-    
-    # Get user's cars
-    cars = query.all()
-    
-    return jsonify([{
-        'id': car.id,
-        'company': car.company,
-        'model': car.model,
-        'year': car.year,
-        'price': car.price,
-        'mileage': car.mileage,
-        'fuel_type': car.fuel_type,
-        'transmission': car.transmission,
-        'image_url': car.image_url,
-        'created_at': car.created_at.isoformat()
-    } for car in cars]), 200
-
-@app.route('/api/vehicles', methods=['POST'])
+        query = query.filter(catalog_filter(UserCar.fuel_type_id, 'fuel_type', fuel_type))
+    
+    return json_response(projection.many(query))
+
+@api.route('/api/vehicles', methods=['POST'])
 def add_vehicle():
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
 
     data = request.get_json()
@@ -295,36 +840,39 @@ def add_vehicle():
     if not all(field in data for field in required_fields):
         return jsonify({'error': 'Missing required fields'}), 400
     
+    try:
+        catalog_ids = vehicle_catalog_ids(data['company'], data['model'], data['fuel_type'], data['transmission'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     new_car = UserCar(
-        user_id=session['user_id'],
-        company=data['company'],
-        model=data['model'],
+        user_id=current_user_id(),
         year=data['year'],
         price=float(data['price']),
         mileage=float(data['mileage']),
-        fuel_type=data['fuel_type'],
-        transmission=data['transmission'],
         image_url=data.get('image_url'),
         type=data.get('type') or 'car',
         color=data.get('color'),
         registration_number=data.get('registration_number'),
-        purchase_date=data.get('purchase_date')
+        purchase_date=data.get('purchase_date'),
+        **catalog_ids
     )
     
     db.session.add(new_car)
     db.session.commit()
+    response_cache.invalidate('marketplace')
     
     return jsonify({
         'id': new_car.id,
         'message': 'Vehicle added successfully'
     }), 201
 
-@app.route('/api/vehicles/<int:vehicle_id>', methods=['PUT'])
+@api.route('/api/vehicles/<int:vehicle_id>', methods=['PUT'])
 def update_vehicle(vehicle_id):
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
 
-    car = UserCar.query.filter_by(id=vehicle_id, user_id=session['user_id']).first()
+    car = UserCar.query.filter_by(id=vehicle_id, user_id=current_user_id()).first()
     
     if not car:
         return jsonify({'message': 'Vehicle not found'}), 404
@@ -332,72 +880,192 @@ def update_vehicle(vehicle_id):
     data = request.get_json()
     
     # Update only the fields that are provided
-    if 'company' in data:
-        car.company = data['company']
-    if 'model' in data:
-        car.model = data['model']
+    try:
+        if 'company' in data or 'model' in data:
+            # A model belongs to its make, so a new make re-interns the model too
+            car.make_id = vehicle_catalog.intern('make', data.get('company', car.company))
+            car.model_id = vehicle_catalog.intern('model', data.get('model', car.model), car.make_id)
+        if 'fuel_type' in data:
+            car.fuel_type_id = vehicle_catalog.intern('fuel_type', data['fuel_type'])
+        if 'transmission' in data:
+            car.transmission_id = vehicle_catalog.intern('transmission', data['transmission'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     if 'year' in data:
         car.year = data['year']
     if 'price' in data:
         car.price = float(data['price'])
     if 'mileage' in data:
         car.mileage = float(data['mileage'])
-    if 'fuel_type' in data:
-        car.fuel_type = data['fuel_type']
-    if 'transmission' in data:
-        car.transmission = data['transmission']
     if 'image_url' in data:
         car.image_url = data['image_url']
     
     db.session.commit()
+    response_cache.invalidate('marketplace')
     return jsonify({'message': 'Vehicle updated successfully'}), 200
 
-@app.route('/api/vehicles/<int:vehicle_id>', methods=['DELETE'])
+@api.route('/api/vehicles/<int:vehicle_id>', methods=['DELETE'])
 def delete_vehicle(vehicle_id):
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
 
-    car = UserCar.query.filter_by(id=vehicle_id, user_id=session['user_id']).first()
+    car = UserCar.query.filter_by(id=vehicle_id, user_id=current_user_id()).first()
     
     if not car:
         return jsonify({'message': 'Vehicle not found'}), 404
     
     db.session.delete(car)
     db.session.commit()
+    response_cache.invalidate('marketplace')
     return jsonify({'message': 'Vehicle deleted successfully'}), 200
 
-@app.route('/api/marketplace/vehicles', methods=['GET'])
-def get_marketplace_vehicles():
-    # Get filter parameters
-    fuel_type = request.args.get('fuel_type')
-    
-    # Base query - show all vehicles available for sale
-    query = UserCar.query
-    
-    # Apply filters if provided
+# Marketplace search
+MARKETPLACE_DEFAULT_LIMIT = 50
+MARKETPLACE_MAX_LIMIT = 200
+
+# sort key -> (column, descending)
+MARKETPLACE_SORTS = {
+    'newest': (UserCar.created_at, True),
+    'oldest': (UserCar.created_at, False),
+    'price_asc': (UserCar.price, False),
+    'price_desc': (UserCar.price, True),
+    'year_asc': (UserCar.year, False),
+    'year_desc': (UserCar.year, True),
+    'mileage_asc': (UserCar.mileage, False),
+    'mileage_desc': (UserCar.mileage, True),
+}
+
+def encode_cursor(sort, value, row_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, sort, is_datetime=False):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, value, row_id = json.loads(raw)
+        if is_datetime:
+            value = datetime.fromisoformat(value)
+        row_id = int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if cursor_sort != sort:
+        raise ValueError('Cursor does not match sort order')
+    return value, row_id
+
+def search_marketplace(args, projection):
+    # Returns serialized cars; the sort value and id ride along after the
+    # projected columns to build the next cursor
+    sort = args.get('sort', 'newest')
+    if sort not in MARKETPLACE_SORTS:
+        raise ValueError('Invalid sort order')
+    column, descending = MARKETPLACE_SORTS[sort]
+
+    limit = args.get('limit', MARKETPLACE_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, MARKETPLACE_MAX_LIMIT))
+
+    query = db.session.query(*projection.columns, column, UserCar.id)
+
+    fuel_type = args.get('fuel_type')
     if fuel_type and fuel_type.lower() != 'all':
-        query = query.filter(UserCar.fuel_type == fuel_type)
-    
-    # Get all cars
-    cars = query.all()
-    
-    return jsonify([{
-        'id': car.id,
-        'company': car.company,
-        'model': car.model,
-        'year': car.year,
-        'price': car.price,
-        'mileage': car.mileage,
-        'fuel_type': car.fuel_type,
-        'transmission': car.transmission,
-        'image_url': car.image_url,
-        'created_at': car.created_at.isoformat()
-    } for car in cars]), 200
+        query = query.filter(catalog_filter(UserCar.fuel_type_id, 'fuel_type', fuel_type))
+    transmission = args.get('transmission')
+    if transmission and transmission.lower() != 'all':
+        query = query.filter(catalog_filter(UserCar.transmission_id, 'transmission', transmission))
+    company = args.get('company')
+    if company:
+        query = query.filter(catalog_filter(UserCar.make_id, 'make', company))
+
+    # Range filters
+    for name, column_attr, cast in [('price', UserCar.price, float),
+                                     ('year', UserCar.year, int),
+                                     ('mileage', UserCar.mileage, float)]:
+        low = args.get('min_' + name, type=cast)
+        high = args.get('max_' + name, type=cast)
+        if low is not None:
+            query = query.filter(column_attr >= low)
+        if high is not None:
+            query = query.filter(column_attr <= high)
+
+    # Keyset pagination: continue strictly after the last (value, id) seen
+    cursor = args.get('cursor')
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort, is_datetime=column is UserCar.created_at)
+        if descending:
+            query = query.filter(db.or_(column < value,
+                                        db.and_(column == value, UserCar.id < last_id)))
+        else:
+            query = query.filter(db.or_(column > value,
+                                        db.and_(column == value, UserCar.id > last_id)))
+
+    if descending:
+        query = query.order_by(column.desc(), UserCar.id.desc())
+    else:
+        query = query.order_by(column.asc(), UserCar.id.asc())
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort, rows[-1][-2], rows[-1][-1])
+
+    return projection.many(rows), next_cursor
+
+@api.route('/api/marketplace/search', methods=['GET'])
+@response_cache.cached('marketplace')
+def marketplace_search():
+    try:
+        cars, next_cursor = search_marketplace(request.args, request_projection(CAR_SCHEMA))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return json_response({
+        'vehicles': cars,
+        'next_cursor': next_cursor
+    })
+
+@api.route('/api/marketplace/vehicles', methods=['GET'])
+@response_cache.cached('marketplace', headers=['X-Next-Cursor'])
+def get_marketplace_vehicles():
+    # Same bounded search, kept as a plain list for existing clients;
+    # the cursor for the next page is returned in a header
+    try:
+        cars, next_cursor = search_marketplace(request.args, request_projection(CAR_SCHEMA))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = json_response(cars)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+# facet -> (UserCar column, catalog kind)
+MARKETPLACE_FACETS = {
+    'fuel_type': (UserCar.fuel_type_id, 'fuel_type'),
+    'transmission': (UserCar.transmission_id, 'transmission'),
+    'company': (UserCar.make_id, 'make'),
+}
+
+@api.route('/api/marketplace/facets', methods=['GET'])
+@response_cache.cached('marketplace')
+def marketplace_facets():
+    # Vehicle counts per catalog entry, grouped on the indexed id columns
+    # and cached until the next vehicle write
+    facets = {}
+    for facet, (column, kind) in MARKETPLACE_FACETS.items():
+        counts = db.session.query(column, db.func.count()).filter(column.isnot(None)).group_by(column)
+        facets[facet] = sorted(({'id': entry_id, 'name': vehicle_catalog.name(kind, entry_id), 'count': count}
+                                for entry_id, count in counts),
+                               key=lambda entry: (-entry['count'], entry['name'] or ''))
+    return json_response(facets)
 
 # Trip and Emission Routes
-@app.route('/trips', methods=['POST'])
+@api.route('/trips', methods=['POST'])
+@admission.limit(user=(1, 30), route=(100, 200))
 def create_trip():
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
 
     data = request.get_json()
@@ -407,17 +1075,21 @@ def create_trip():
         return jsonify({'error': 'Missing required fields'}), 400
     
     try:
+        geometry = parse_trip_geometry(data)
         new_trip = Trip(
-            user_id=session['user_id'],
+            user_id=current_user_id(),
             start_location=data['start_location'],
             end_location=data['end_location'],
             distance=float(data['distance']),
             start_time=datetime.fromisoformat(data['start_time']),
             end_time=datetime.fromisoformat(data['end_time']),
-            vehicle_id=data['vehicle_id']
+            vehicle_id=data['vehicle_id'],
+            **geometry
         )
         
         db.session.add(new_trip)
+        if geometry['start_lat'] is not None:
+            apply_heatmap_cells([trip_route(geometry)], [0.0], count_trips=True)
         db.session.commit()
         
         return jsonify({
@@ -428,30 +1100,55 @@ def create_trip():
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
-@app.route('/trips', methods=['GET'])
+def join_trip_emission(query, trip, emission, user_id):
+    # Outer-joins each trip's first emission record. Several records can be
+    # posted for one trip, and joining them all would repeat the trip.
+    first = db.session.query(emission.trip_id, db.func.min(emission.id).label('id')) \
+        .filter(emission.user_id == user_id, emission.trip_id.isnot(None)) \
+        .group_by(emission.trip_id).subquery()
+    return query.outerjoin(first, first.c.trip_id == trip.id).outerjoin(emission, emission.id == first.c.id)
+
+TRIP_SCHEMA = Schema(
+    Field('id', Trip.id),
+    Field('start_location', Trip.start_location),
+    Field('end_location', Trip.end_location),
+    Field('distance', Trip.distance),
+    Field('start_time', Trip.start_time),
+    Field('end_time', Trip.end_time),
+    Field('vehicle.id', UserCar.id),
+    Field('vehicle.model', UserCar.model_id, decode=catalog_name('model')),
+    Field('vehicle.company', UserCar.make_id, decode=catalog_name('make')),
+    Field('emissions', EmissionRecord.co2_emissions)
+)
+
+@api.route('/trips', methods=['GET'])
 def get_user_trips():
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
-    
-    trips = Trip.query.filter_by(user_id=session['user_id']).order_by(Trip.created_at.desc()).all()
-    return jsonify([{
-        'id': trip.id,
-        'start_location': trip.start_location,
-        'end_location': trip.end_location,
-        'distance': trip.distance,
-        'start_time': trip.start_time.isoformat(),
-        'end_time': trip.end_time.isoformat(),
-        'vehicle': {
-            'id': trip.vehicle.id,
-            'model': trip.vehicle.model,
-            'company': trip.vehicle.company
-        },
-        'emissions': trip.emission_record.co2_emissions if trip.emission_record else None
-    } for trip in trips])
 
-@app.route('/emissions', methods=['POST'])
+    try:
+        projection = request_projection(TRIP_SCHEMA)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = request.args.get('limit', type=int)
+
+    def user_trips(trip, emission):
+        # Newest first, with created_at appended as the merge key
+        query = (db.session.query(*projection.columns_for({Trip: trip, EmissionRecord: emission}), trip.created_at)
+                 .select_from(trip)
+                 .join(UserCar, trip.vehicle_id == UserCar.id))
+        return (join_trip_emission(query, trip, emission, current_user_id())
+                .filter(trip.user_id == current_user_id())
+                .order_by(trip.created_at.desc()))
+
+    rows = newest_first(user_trips(Trip, EmissionRecord), user_trips(TripArchive, EmissionRecordArchive),
+                        archive_watermark(Trip.__table__), limit and max(1, limit))
+    return json_response(projection.many(rows))
+
+@api.route('/emissions', methods=['POST'])
+@admission.limit(user=(1, 30), route=(100, 200))
 def record_emissions():
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
 
     data = request.get_json()
@@ -461,17 +1158,20 @@ def record_emissions():
         return jsonify({'error': 'Missing required fields'}), 400
     
     try:
-        new_emission = EmissionRecord(
-            trip_id=data.get('trip_id'),
-            user_id=session['user_id'],
-            vehicle_id=data['vehicle_id'],
-            co2_emissions=float(data['co2_emissions']),
-            distance=float(data['distance']),
-            fuel_consumed=float(data['fuel_consumed']),
-            record_date=datetime.fromisoformat(data['record_date']).date()
-        )
+        values = {
+            'trip_id': parse_trip_id(data, user_trip_ids(current_user_id(), [data.get('trip_id')])),
+            'user_id': current_user_id(),
+            'vehicle_id': data['vehicle_id'],
+            'co2_emissions': float(data['co2_emissions']),
+            'distance': float(data['distance']),
+            'fuel_consumed': float(data['fuel_consumed']),
+            'record_date': datetime.fromisoformat(data['record_date']).date()
+        }
+        new_emission = EmissionRecord(**values)
         
         db.session.add(new_emission)
+        apply_emission_rollups([values])
+        apply_emission_heatmap([values])
         db.session.commit()
         
         return jsonify({
@@ -482,30 +1182,801 @@ def record_emissions():
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
-@app.route('/emissions', methods=['GET'])
+EMISSION_SCHEMA = Schema(
+    Field('id', EmissionRecord.id),
+    Field('trip_id', EmissionRecord.trip_id),
+    Field('co2_emissions', EmissionRecord.co2_emissions),
+    Field('distance', EmissionRecord.distance),
+    Field('fuel_consumed', EmissionRecord.fuel_consumed),
+    Field('record_date', EmissionRecord.record_date),
+    Field('vehicle.id', UserCar.id),
+    Field('vehicle.model', UserCar.model_id, decode=catalog_name('model')),
+    Field('vehicle.company', UserCar.make_id, decode=catalog_name('make'))
+)
+
+@api.route('/emissions', methods=['GET'])
 def get_user_emissions():
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    emissions = EmissionRecord.query.filter_by(user_id=session['user_id']).order_by(EmissionRecord.record_date.desc()).all()
-    return jsonify([{
-        'id': record.id,
-        'trip_id': record.trip_id,
-        'co2_emissions': record.co2_emissions,
-        'distance': record.distance,
-        'fuel_consumed': record.fuel_consumed,
-        'record_date': record.record_date.isoformat(),
-        'vehicle': {
-            'id': record.vehicle.id,
-            'model': record.vehicle.model,
-            'company': record.vehicle.company
-        }
-    } for record in emissions])
+    try:
+        projection = request_projection(EMISSION_SCHEMA)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        date_from, date_to = parse_date_range()
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO dates (YYYY-MM-DD)'}), 400
+    limit = request.args.get('limit', type=int)
+
+    def user_emissions(emission):
+        query = (db.session.query(*projection.columns_for({EmissionRecord: emission}), emission.record_date)
+                 .select_from(emission)
+                 .join(UserCar, emission.vehicle_id == UserCar.id)
+                 .filter(emission.user_id == current_user_id()))
+        if date_from:
+            query = query.filter(emission.record_date >= date_from)
+        if date_to:
+            query = query.filter(emission.record_date <= date_to)
+        return query.order_by(emission.record_date.desc())
+
+    # Ranges that start after the archive watermark never touch the archive
+    watermark = archive_watermark(EmissionRecord.__table__)
+    watermark = watermark.date() if watermark and not (date_from and date_from >= watermark.date()) else None
+    rows = newest_first(user_emissions(EmissionRecord), user_emissions(EmissionRecordArchive),
+                        watermark, limit and max(1, limit))
+    return json_response(projection.many(rows))
+
+@api.route('/api/emissions/summary', methods=['GET'])
+def get_emissions_summary():
+    if current_user_id() is None:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in ROLLUP_GRANULARITIES:
+        return jsonify({'error': 'granularity must be day or month'}), 400
+
+    try:
+        date_from = request.args.get('from')
+        date_to = request.args.get('to')
+        date_from = rollup_period(date.fromisoformat(date_from), granularity) if date_from else None
+        date_to = date.fromisoformat(date_to) if date_to else None
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO dates (YYYY-MM-DD)'}), 400
+
+    query = db.session.query(
+        EmissionRollup.period_start,
+        db.func.sum(EmissionRollup.co2_emissions),
+        db.func.sum(EmissionRollup.distance),
+        db.func.sum(EmissionRollup.fuel_consumed),
+        db.func.sum(EmissionRollup.record_count)
+    ).filter(EmissionRollup.user_id == current_user_id(),
+             EmissionRollup.granularity == granularity)
+
+    vehicle_id = request.args.get('vehicle_id', type=int)
+    if vehicle_id is not None:
+        query = query.filter(EmissionRollup.vehicle_id == vehicle_id)
+    if date_from:
+        query = query.filter(EmissionRollup.period_start >= date_from)
+    if date_to:
+        query = query.filter(EmissionRollup.period_start <= date_to)
+
+    rows = query.group_by(EmissionRollup.period_start).order_by(EmissionRollup.period_start).all()
+    return jsonify({
+        'granularity': granularity,
+        'periods': [{
+            'period': period_start.isoformat(),
+            'co2_emissions': co2,
+            'distance': distance,
+            'fuel_consumed': fuel,
+            'records': int(count)
+        } for period_start, co2, distance, fuel, count in rows]
+    })
+
+EMISSIONS_MAX_BATCH = 10000
+
+@api.route('/api/emissions/calculate', methods=['POST'])
+def calculate_emissions():
+    data = request.get_json()
+    
+    # Accept a single trip object, a bare list, or {'trips': [...]}
+    if isinstance(data, dict) and 'trips' in data:
+        data = data['trips']
+    single = isinstance(data, dict)
+    rows = [data] if single else data
+    
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return jsonify({'error': 'Expected a trip object or a list of trips'}), 400
+    if len(rows) > EMISSIONS_MAX_BATCH:
+        return jsonify({'error': f'Batch too large (max {EMISSIONS_MAX_BATCH} trips)'}), 400
+    
+    try:
+        results, totals = emissions_engine.calculate_batch(rows)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if single:
+        return jsonify(results[0])
+    return jsonify({
+        'results': results,
+        'totals': totals,
+        'count': len(results)
+    })
+
+# Bulk ingestion
+BULK_MAX_ROWS = 5000
+BULK_CHUNK_SIZE = 500
+TRIP_FIELDS = ['start_location', 'end_location', 'distance', 'start_time', 'end_time', 'vehicle_id']
+EMISSION_FIELDS = ['vehicle_id', 'co2_emissions', 'distance', 'fuel_consumed', 'record_date']
+
+def read_bulk_rows(key):
+    # Accepts a JSON array, {key: [...]}, or NDJSON with one object per line.
+    # NDJSON is parsed line by line as it is read, never held whole.
+    max_bytes = current_app.config['MAX_CONTENT_LENGTH']
+    if max_bytes and (request.content_length or 0) > max_bytes:
+        abort(413)
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        rows, size = [], 0
+        for line in request.stream:
+            size += len(line)
+            if max_bytes and size > max_bytes:
+                abort(413)
+            if not line.strip():
+                continue
+            if len(rows) == BULK_MAX_ROWS:
+                raise ValueError(f'Too many rows (max {BULK_MAX_ROWS})')
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                rows.append(None)
+    else:
+        rows = request.get_json(silent=True)
+        if isinstance(rows, dict):
+            rows = rows.get(key)
+        if not isinstance(rows, list):
+            raise ValueError('Expected a JSON array or NDJSON body')
+    if len(rows) > BULK_MAX_ROWS:
+        raise ValueError(f'Too many rows (max {BULK_MAX_ROWS})')
+    return rows
+
+def require_fields(data, fields):
+    if not isinstance(data, dict):
+        raise ValueError('Row must be a JSON object')
+    missing = [field for field in fields if field not in data]
+    if missing:
+        raise ValueError('Missing required fields: ' + ', '.join(missing))
+
+def parse_vehicle_id(data, vehicles):
+    vehicle_id = int(data['vehicle_id'])
+    if vehicle_id not in vehicles:
+        raise ValueError(f'Unknown vehicle_id {vehicle_id}')
+    return vehicle_id
+
+def user_trip_ids(user_id, candidates):
+    # The values in `candidates` that are ids of the user's trips, hot or
+    # archived, looked up once for a whole batch
+    ids = set()
+    for value in candidates:
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    ids, found = list(ids), set()
+    for entity in (Trip, TripArchive):
+        for start in range(0, len(ids), 500):
+            found.update(trip_id for trip_id, in db.session.query(entity.id).filter(
+                entity.user_id == user_id, entity.id.in_(ids[start:start + 500])))
+    return found
+
+def parse_trip_id(data, trips):
+    if data.get('trip_id') is None:
+        return None
+    trip_id = int(data['trip_id'])
+    if trip_id not in trips:
+        raise ValueError(f'Unknown trip_id {trip_id}')
+    return trip_id
+
+def parse_trip_geometry(data):
+    # Optional start/end coordinates and encoded route polyline. Every key
+    # is always present so bulk rows share one executemany parameter set.
+    geometry = dict.fromkeys(['start_lat', 'start_lng', 'end_lat', 'end_lng',
+                              'route_polyline', 'start_geohash'])
+    for point in ('start', 'end'):
+        lat, lng = data.get(f'{point}_lat'), data.get(f'{point}_lng')
+        if lat is not None and lng is not None:
+            geometry[f'{point}_lat'], geometry[f'{point}_lng'] = geo.validate_coordinates(lat, lng)
+    if data.get('route_polyline'):
+        geo.decode_polyline(data['route_polyline'])
+        geometry['route_polyline'] = data['route_polyline']
+    if geometry['start_lat'] is not None:
+        geometry['start_geohash'] = geo.encode_geohash(geometry['start_lat'], geometry['start_lng'])
+    return geometry
+
+def parse_trip_row(data, user_id, vehicles):
+    require_fields(data, TRIP_FIELDS)
+    trip = {
+        'user_id': user_id,
+        'start_location': str(data['start_location']),
+        'end_location': str(data['end_location']),
+        'distance': float(data['distance']),
+        'start_time': datetime.fromisoformat(data['start_time']),
+        'end_time': datetime.fromisoformat(data['end_time']),
+        'vehicle_id': parse_vehicle_id(data, vehicles),
+        **parse_trip_geometry(data)
+    }
+    if trip['end_time'] < trip['start_time']:
+        raise ValueError('end_time is before start_time')
+    return trip
+
+def parse_emission_row(data, user_id, vehicles, trips):
+    require_fields(data, EMISSION_FIELDS)
+    return {
+        'trip_id': parse_trip_id(data, trips),
+        'user_id': user_id,
+        'vehicle_id': parse_vehicle_id(data, vehicles),
+        'co2_emissions': float(data['co2_emissions']),
+        'distance': float(data['distance']),
+        'fuel_consumed': float(data['fuel_consumed']),
+        'record_date': datetime.fromisoformat(data['record_date']).date()
+    }
+
+def derive_trip_emissions(trips, vehicles):
+    # Emission values for (row_index, trip) pairs using each vehicle's
+    # stored type, fuel and km/l mileage. Trip distances are in km and the
+    # stored co2_emissions is CO2-equivalent in kg.
+    derived, errors, inputs = {}, [], []
+    for index, trip in trips:
+        car = vehicles[trip['vehicle_id']]
+        try:
+            vehicle_type, fuel_type = emissions_engine.vehicle_profile(car.type, car.fuel_type)
+            if not car.mileage or car.mileage <= 0:
+                raise ValueError(f'Vehicle {car.id} has no usable mileage')
+        except ValueError as e:
+            errors.append({'row': index, 'error': str(e)})
+            continue
+        inputs.append((index, trip, {
+            'distance': trip['distance'],
+            'distance_unit': 'km',
+            'efficiency': car.mileage,
+            'efficiency_unit': 'kmpl',
+            'vehicle_type': vehicle_type,
+            'fuel_type': fuel_type
+        }))
+    if inputs:
+        results, _ = emissions_engine.calculate_batch(row for _, _, row in inputs)
+        for (index, trip, row), result in zip(inputs, results):
+            derived[index] = {
+                'user_id': trip['user_id'],
+                'vehicle_id': trip['vehicle_id'],
+                'co2_emissions': result['annual_emissions'] * 1000,
+                'distance': trip['distance'],
+                'fuel_consumed': trip['distance'] / row['efficiency'],
+                'record_date': trip['start_time'].date()
+            }
+    return derived, errors
+
+def insert_in_chunks(items, insert_chunk):
+    # items: list of (row_index, payload). Each chunk is one transaction;
+    # if a chunk fails it is retried row by row so only bad rows are rejected.
+    inserted, errors = 0, []
+    for start in range(0, len(items), BULK_CHUNK_SIZE):
+        chunk = items[start:start + BULK_CHUNK_SIZE]
+        try:
+            insert_chunk([payload for _, payload in chunk])
+            db.session.commit()
+            inserted += len(chunk)
+            continue
+        except Exception:
+            db.session.rollback()
+        for index, payload in chunk:
+            try:
+                insert_chunk([payload])
+                db.session.commit()
+                inserted += 1
+            except Exception as e:
+                db.session.rollback()
+                errors.append({'row': index, 'error': str(getattr(e, 'orig', None) or e)})
+    return inserted, errors
+
+def insert_trips(payloads):
+    located = [(trip, emission) for trip, emission in payloads if trip['start_lat'] is not None]
+    apply_heatmap_cells([trip_route(trip) for trip, _ in located],
+                        [emission['co2_emissions'] if emission else 0.0 for _, emission in located],
+                        count_trips=True)
+    if not any(emission for _, emission in payloads):
+        # Plain trips go out as a single executemany INSERT
+        db.session.execute(Trip.__table__.insert(), [trip for trip, _ in payloads])
+        return
+    apply_emission_rollups([emission for _, emission in payloads if emission])
+    # Trips with emission records need their generated ids, so go through the ORM
+    for trip, emission in payloads:
+        new_trip = Trip(**trip)
+        if emission:
+            new_trip.emission_record = EmissionRecord(**emission)
+        db.session.add(new_trip)
+    db.session.flush()
+
+def insert_emissions(payloads):
+    db.session.execute(EmissionRecord.__table__.insert(), payloads)
+    apply_emission_rollups(payloads)
+    apply_emission_heatmap(payloads)
+
+def bulk_response(total, inserted, errors):
+    errors.sort(key=lambda error: error['row'])
+    return jsonify({
+        'received': total,
+        'inserted': inserted,
+        'failed': len(errors),
+        'errors': errors
+    }), 201 if inserted else 400 if errors else 200
+
+@api.route('/trips/bulk', methods=['POST'])
+@admission.limit(user=(0.1, 5), route=(5, 10))
+def create_trips_bulk():
+    if current_user_id() is None:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        rows = read_bulk_rows('trips')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    user_id = current_user_id()
+    vehicles = {car.id: car for car in UserCar.query.filter_by(user_id=user_id)}
+    derive = request.args.get('derive_emissions', '').lower() in ('1', 'true', 'yes')
+
+    errors, parsed, to_derive = [], [], []
+    for index, data in enumerate(rows):
+        try:
+            trip = parse_trip_row(data, user_id, vehicles)
+            emission = None
+            if isinstance(data.get('emissions'), dict):
+                # Linked to the new trip on insert
+                emission = parse_emission_row(
+                    {'vehicle_id': trip['vehicle_id'], 'distance': trip['distance'],
+                     'record_date': data['start_time'], **data['emissions'], 'trip_id': None},
+                    user_id, vehicles, ())
+                emission.pop('trip_id')
+            elif derive:
+                to_derive.append((index, trip))
+            parsed.append((index, trip, emission))
+        except (ValueError, TypeError, KeyError) as e:
+            errors.append({'row': index, 'error': str(e)})
+
+    derived, derive_errors = derive_trip_emissions(to_derive, vehicles)
+    errors.extend(derive_errors)
+    failed = {error['row'] for error in derive_errors}
+
+    items = [(index, (trip, emission or derived.get(index)))
+             for index, trip, emission in parsed if index not in failed]
+    inserted, insert_errors = insert_in_chunks(items, insert_trips)
+    return bulk_response(len(rows), inserted, errors + insert_errors)
+
+@api.route('/emissions/bulk', methods=['POST'])
+@admission.limit(user=(0.1, 5), route=(5, 10))
+def record_emissions_bulk():
+    if current_user_id() is None:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        rows = read_bulk_rows('emissions')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    user_id = current_user_id()
+    vehicles = {car.id: car for car in UserCar.query.filter_by(user_id=user_id)}
+
+    trips = user_trip_ids(user_id, [data.get('trip_id') for data in rows if isinstance(data, dict)])
+
+    errors, items = [], []
+    for index, data in enumerate(rows):
+        try:
+            items.append((index, parse_emission_row(data, user_id, vehicles, trips)))
+        except (ValueError, TypeError, KeyError) as e:
+            errors.append({'row': index, 'error': str(e)})
+
+    inserted, insert_errors = insert_in_chunks(items, insert_emissions)
+    return bulk_response(len(rows), inserted, errors + insert_errors)
+
+# Streaming export
+EXPORT_PAGE_SIZE = 1000
+
+def trip_export_columns(trip, emission):
+    return [
+        trip.id, trip.start_location, trip.end_location, trip.distance, trip.start_time,
+        trip.end_time, trip.vehicle_id, VehicleMake.name.label('vehicle_company'),
+        VehicleModel.name.label('vehicle_model'), emission.co2_emissions
+    ]
+
+def emission_export_columns(emission):
+    return [
+        emission.id, emission.trip_id, emission.vehicle_id,
+        VehicleMake.name.label('vehicle_company'), VehicleModel.name.label('vehicle_model'),
+        emission.co2_emissions, emission.distance, emission.fuel_consumed,
+        emission.record_date
+    ]
+
+def export_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def iter_export_rows(query, id_column):
+    # Keyset pages over the primary key keep each query cheap and memory
+    # bounded to one page of plain row tuples
+    last_id = 0
+    while True:
+        rows = query.filter(id_column > last_id).order_by(id_column).limit(EXPORT_PAGE_SIZE).all()
+        if not rows:
+            return
+        for row in rows:
+            yield row
+        last_id = rows[-1].id
+
+def export_response(parts, name):
+    # parts: (query, id_column) pairs streamed one after another, e.g. the
+    # archive followed by the hot table; all must select the same columns
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    fields = [column['name'] for column in parts[0][0].column_descriptions]
+
+    def rows():
+        for query, id_column in parts:
+            yield from iter_export_rows(query, id_column)
+
+    def generate_ndjson():
+        for row in rows():
+            yield json.dumps({field: export_value(value) for field, value in zip(fields, row)}) + '\n'
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for row in rows():
+            writer.writerow([export_value(value) for value in row])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    if export_format == 'csv':
+        response = Response(stream_with_context(generate_csv()), mimetype='text/csv')
+    else:
+        response = Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.{export_format}'
+    return response
+
+def parse_date_range():
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    return (date.fromisoformat(date_from) if date_from else None,
+            date.fromisoformat(date_to) if date_to else None)
+
+@api.route('/api/export/trips', methods=['GET'])
+def export_trips():
+    if current_user_id() is None:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        date_from, date_to = parse_date_range()
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO dates (YYYY-MM-DD)'}), 400
+
+    def user_trips(trip, emission):
+        query = (db.session.query(*trip_export_columns(trip, emission))
+                 .select_from(trip)
+                 .join(UserCar, trip.vehicle_id == UserCar.id)
+                 .outerjoin(VehicleMake, VehicleMake.id == UserCar.make_id)
+                 .outerjoin(VehicleModel, VehicleModel.id == UserCar.model_id))
+        query = join_trip_emission(query, trip, emission, current_user_id()) \
+            .filter(trip.user_id == current_user_id())
+        if date_from:
+            query = query.filter(trip.start_time >= datetime.combine(date_from, datetime.min.time()))
+        if date_to:
+            query = query.filter(trip.start_time < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+        return query, trip.id
+
+    return export_response([user_trips(TripArchive, EmissionRecordArchive),
+                            user_trips(Trip, EmissionRecord)], 'trips')
+
+@api.route('/api/export/emissions', methods=['GET'])
+def export_emissions():
+    if current_user_id() is None:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        date_from, date_to = parse_date_range()
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO dates (YYYY-MM-DD)'}), 400
+
+    def user_emissions(emission):
+        query = (db.session.query(*emission_export_columns(emission))
+                 .select_from(emission)
+                 .join(UserCar, emission.vehicle_id == UserCar.id)
+                 .outerjoin(VehicleMake, VehicleMake.id == UserCar.make_id)
+                 .outerjoin(VehicleModel, VehicleModel.id == UserCar.model_id)
+                 .filter(emission.user_id == current_user_id()))
+        if date_from:
+            query = query.filter(emission.record_date >= date_from)
+        if date_to:
+            query = query.filter(emission.record_date <= date_to)
+        return query, emission.id
+
+    return export_response([user_emissions(EmissionRecordArchive),
+                            user_emissions(EmissionRecord)], 'emissions')
+
+# Emissions heatmap
+# Zoom 14 cells are about 600 m wide; finer grids would single out
+# individual trips' origins and destinations
+HEATMAP_MAX_ZOOM = 14
+
+def trip_route(trip):
+    # Route points of a trip's geometry (a mapping of the Trip columns), or
+    # its start and end when no polyline was recorded
+    route = geo.decode_polyline(trip['route_polyline']) if trip['route_polyline'] else []
+    if not route:
+        route = [(trip['start_lat'], trip['start_lng'])]
+        if trip['end_lat'] is not None:
+            route.append((trip['end_lat'], trip['end_lng']))
+    return route
+
+def load_trip_routes(trip_ids):
+    # {trip_id: route} for the trips (hot or archived) that have geometry
+    trip_ids, routes = list(trip_ids), {}
+    for entity in (Trip, TripArchive):
+        for start in range(0, len(trip_ids), 500):
+            rows = db.session.query(entity.id, entity.start_lat, entity.start_lng, entity.end_lat,
+                                    entity.end_lng, entity.route_polyline) \
+                .filter(entity.id.in_(trip_ids[start:start + 500]), entity.start_lat.isnot(None))
+            routes.update((row.id, trip_route(row._mapping)) for row in rows)
+    return routes
+
+def apply_heatmap_cells(routes, weights, count_trips):
+    # Bins each route's weight (CO2, spread evenly over its points) into the
+    # cells of every zoom level, inside the caller's transaction. With
+    # count_trips the routes are new trips, counted once in each cell they
+    # cross; otherwise only the CO2 is added.
+    points = [(lat, lng, weight / len(route), index)
+              for index, (route, weight) in enumerate(zip(routes, weights)) if count_trips or weight
+              for lat, lng in route]
+    if not points:
+        return
+    lats, lngs, shares, groups = (np.array(column) for column in zip(*points))
+    for zoom in range(HEATMAP_MAX_ZOOM + 1):
+        rows, cols, co2, counts = geo.bin_points(lats, lngs, shares, groups, geo.grid_cell_size(zoom))
+        upsert_heatmap_cells(zoom, {(int(row), int(col)): (float(total), int(count) if count_trips else 0)
+                                    for row, col, total, count in zip(rows, cols, co2, counts)})
+
+def upsert_heatmap_cells(zoom, deltas):
+    # deltas: {(row, col): (co2, trips)}. Existing cells are incremented with
+    # one executemany UPDATE and the rest inserted with one INSERT.
+    table = HeatmapCell.__table__
+    cells, existing = list(deltas), set()
+    for start in range(0, len(cells), 500):
+        existing.update(tuple(row) for row in db.session.execute(
+            db.select(table.c.cell_row, table.c.cell_col).where(
+                table.c.zoom == zoom,
+                db.tuple_(table.c.cell_row, table.c.cell_col).in_(cells[start:start + 500]))))
+    increment = table.update().where(
+        table.c.zoom == zoom, table.c.cell_row == db.bindparam('b_row'), table.c.cell_col == db.bindparam('b_col')
+    ).values(co2_emissions=table.c.co2_emissions + db.bindparam('b_co2'),
+             trip_count=table.c.trip_count + db.bindparam('b_trips'))
+    params = [{'b_row': row, 'b_col': col, 'b_co2': co2, 'b_trips': trips}
+              for (row, col), (co2, trips) in deltas.items()]
+    updates = [param for param in params if (param['b_row'], param['b_col']) in existing]
+    inserts = [param for param in params if (param['b_row'], param['b_col']) not in existing]
+    if updates:
+        db.session.execute(increment, updates)
+    if not inserts:
+        return
+    values = [{'zoom': zoom, 'cell_row': param['b_row'], 'cell_col': param['b_col'],
+               'co2_emissions': param['b_co2'], 'trip_count': param['b_trips']} for param in inserts]
+    try:
+        with db.session.begin_nested():
+            db.session.execute(table.insert(), values)
+    except IntegrityError:
+        # Another writer created some of the cells first
+        for param, value in zip(inserts, values):
+            if db.session.execute(increment, param).rowcount:
+                continue
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(**value))
+            except IntegrityError:
+                db.session.execute(increment, param)
+
+def apply_emission_heatmap(records):
+    # Adds new emission records' CO2 to the cells of the trips they belong to
+    routes = load_trip_routes({record['trip_id'] for record in records if record['trip_id'] is not None})
+    located = [(routes[record['trip_id']], record['co2_emissions'])
+               for record in records if record['trip_id'] in routes]
+    apply_heatmap_cells([route for route, _ in located], [co2 for _, co2 in located], count_trips=False)
+
+def rebuild_heatmap_cells():
+    # Pages by id so the cell upserts never run while a result is streaming
+    HeatmapCell.query.delete()
+    for entity in (Trip, TripArchive):
+        columns = [entity.id, entity.start_lat, entity.start_lng, entity.end_lat, entity.end_lng, entity.route_polyline]
+        last_id = 0
+        while True:
+            rows = db.session.query(*columns).filter(entity.id > last_id, entity.start_lat.isnot(None)) \
+                .order_by(entity.id).limit(5000).all()
+            if not rows:
+                break
+            apply_heatmap_cells([trip_route(row._mapping) for row in rows], [0.0] * len(rows), count_trips=True)
+            last_id = rows[-1].id
+    for entity in (EmissionRecord, EmissionRecordArchive):
+        last_id = 0
+        while True:
+            rows = db.session.query(entity.id, entity.trip_id, entity.co2_emissions) \
+                .filter(entity.id > last_id, entity.trip_id.isnot(None)).order_by(entity.id).limit(5000).all()
+            if not rows:
+                break
+            apply_emission_heatmap([row._asdict() for row in rows])
+            last_id = rows[-1].id
+    db.session.commit()
+
+@api.cli.command('rebuild-heatmap')
+def rebuild_heatmap_command():
+    rebuild_heatmap_cells()
+    print('Heatmap cells rebuilt')
+
+# Each zoom level's cells, reloaded from heatmap_cell every HEATMAP_CACHE_TTL
+# seconds; one request per process reloads while the others wait for it
+heatmap_cache = MemoryBackend(max_entries=HEATMAP_MAX_ZOOM + 1)
+heatmap_lock = threading.Lock()
+
+def heatmap_grid(zoom):
+    key = f'grid:{zoom}'
+    grid = heatmap_cache.get(key)
+    if grid is None:
+        with heatmap_lock:
+            grid = heatmap_cache.get(key)
+            if grid is None:
+                grid = load_heatmap_grid(zoom)
+                heatmap_cache.set(key, grid, current_app.config['HEATMAP_CACHE_TTL'])
+    return grid
+
+def load_heatmap_grid(zoom):
+    # Cells crossed by only a few trips are left out
+    table = HeatmapCell.__table__
+    rows = db.session.execute(db.select(table.c.cell_row, table.c.cell_col, table.c.co2_emissions).where(
+        table.c.zoom == zoom, table.c.trip_count >= current_app.config['HEATMAP_MIN_TRIPS'])).all()
+    cell_rows, cell_cols, co2 = (np.array(column, dtype=float) for column in zip(*rows)) if rows else \
+        (np.empty(0), np.empty(0), np.empty(0))
+    return (*geo.cell_centres(cell_rows, cell_cols, geo.grid_cell_size(zoom)), co2)
+
+@api.route('/api/heatmap', methods=['GET'])
+def get_heatmap():
+    if current_user_id() is None:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    zoom = request.args.get('zoom', 12, type=int)
+    if zoom < 0:
+        return jsonify({'error': 'zoom must not be negative'}), 400
+    # Closer zooms get the finest allowed grid
+    zoom = min(zoom, HEATMAP_MAX_ZOOM)
+
+    cell_lats, cell_lngs, co2 = heatmap_grid(zoom)
+    bbox = request.args.get('bbox')
+    if bbox:
+        # bbox=min_lng,min_lat,max_lng,max_lat (Leaflet's toBBoxString order)
+        try:
+            min_lng, min_lat, max_lng, max_lat = [float(value) for value in bbox.split(',')]
+        except ValueError:
+            return jsonify({'error': 'bbox must be min_lng,min_lat,max_lng,max_lat'}), 400
+        mask = ((cell_lats >= min_lat) & (cell_lats <= max_lat) &
+                (cell_lngs >= min_lng) & (cell_lngs <= max_lng))
+        cell_lats, cell_lngs, co2 = cell_lats[mask], cell_lngs[mask], co2[mask]
+
+    peak = co2.max() if len(co2) else 0
+    intensity = co2 / peak if peak else co2
+    return jsonify({
+        'zoom': zoom,
+        'cell_size': geo.grid_cell_size(zoom),
+        'max_co2': float(peak),
+        # [lat, lng, intensity] triples, ready for L.heatLayer
+        'points': np.column_stack([cell_lats, cell_lngs, intensity]).round(6).tolist()
+    })
+
+# Leaderboard
+leaderboard = Leaderboard()
+LEADERBOARD_DEFAULT_LIMIT = 20
+LEADERBOARD_MAX_LIMIT = 100
+
+def ensure_leaderboard():
+    # Loaded from the emission rollups, then kept current by
+    # publish_leaderboard_deltas; the periodic reload picks up writes made
+    # by other worker processes
+    if not leaderboard.stale():
+        return
+    with leaderboard.lock:
+        if not leaderboard.stale():
+            return
+        daily = db.session.query(
+            EmissionRollup.user_id, EmissionRollup.period_start,
+            db.func.sum(EmissionRollup.co2_emissions), db.func.sum(EmissionRollup.distance)
+        ).filter(EmissionRollup.granularity == 'day',
+                 EmissionRollup.period_start > datetime.utcnow().date() - timedelta(days=leaderboard.rolling_days)) \
+            .group_by(EmissionRollup.user_id, EmissionRollup.period_start)
+        all_time = db.session.query(
+            EmissionRollup.user_id,
+            db.func.sum(EmissionRollup.co2_emissions), db.func.sum(EmissionRollup.distance)
+        ).filter(EmissionRollup.granularity == 'month').group_by(EmissionRollup.user_id)
+        leaderboard.load(daily.all(), all_time.all())
+
+@db.event.listens_for(db.session, 'after_commit')
+def publish_leaderboard_deltas(session):
+    # Records queued by apply_emission_rollups only count once committed
+    if session.in_nested_transaction():
+        return
+    deltas = defaultdict(lambda: [0.0, 0.0])
+    for record in session.info.pop('leaderboard_pending', ()):
+        delta = deltas[(record['user_id'], record['record_date'])]
+        delta[0] += record['co2_emissions']
+        delta[1] += record['distance']
+    for (user_id, day), (co2, distance) in deltas.items():
+        leaderboard.record(user_id, day, co2, distance)
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_leaderboard_deltas(session):
+    if not session.in_nested_transaction():
+        session.info.pop('leaderboard_pending', None)
+
+def leaderboard_window():
+    window = request.args.get('window', '30')
+    window = 0 if window == 'all' else int(window) if window.isdigit() else None
+    if window not in leaderboard.windows:
+        names = ', '.join(str(days) if days else 'all' for days in leaderboard.windows)
+        raise ValueError(f'window must be one of: {names}')
+    return window
+
+def leaderboard_response(window, total, **body):
+    return jsonify({
+        'window': window or 'all',
+        'min_distance': leaderboard.min_distance,
+        'ranked_users': total,
+        **body
+    })
+
+@api.route('/api/leaderboard', methods=['GET'])
+def get_leaderboard():
+    try:
+        window = leaderboard_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = request.args.get('limit', LEADERBOARD_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, LEADERBOARD_MAX_LIMIT))
+    offset = max(0, request.args.get('offset', 0, type=int))
+
+    ensure_leaderboard()
+    total, entries = leaderboard.top(window, limit, offset)
+    usernames = dict(db.session.query(User.id, User.username)
+                     .filter(User.id.in_([entry['user_id'] for entry in entries]))) if entries else {}
+    for entry in entries:
+        entry['username'] = usernames.get(entry['user_id'])
+    return leaderboard_response(window, total, entries=entries)
+
+@api.route('/api/leaderboard/me', methods=['GET'])
+def get_my_leaderboard_standing():
+    user = current_user()
+    if user is None:
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        window = leaderboard_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    ensure_leaderboard()
+    total, entry = leaderboard.standing(window, user['id'])
+    entry['username'] = user['username']
+    return leaderboard_response(window, total, entry=entry)
 
 # Community Routes
-@app.route('/posts', methods=['POST'])
+@api.route('/posts', methods=['POST'])
 def create_post():
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
 
     data = request.get_json()
@@ -519,7 +1990,7 @@ def create_post():
     
     try:
         new_post = CommunityPost(
-            user_id=session['user_id'],
+            user_id=current_user_id(),
             title=data['title'],
             content=data['content'],
             post_type=data['post_type']
@@ -527,6 +1998,7 @@ def create_post():
         
         db.session.add(new_post)
         db.session.commit()
+        response_cache.invalidate('posts')
         
         return jsonify({
             'id': new_post.id,
@@ -536,31 +2008,181 @@ def create_post():
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
-@app.route('/posts', methods=['GET'])
-def get_posts():
-    posts = CommunityPost.query.order_by(CommunityPost.created_at.desc()).all()
-    return jsonify([{
+FEED_DEFAULT_LIMIT = 50
+FEED_MAX_LIMIT = 200
+
+def serialize_posts(posts):
+    # One grouped COUNT for the whole page rather than one per post
+    comment_counts = {}
+    if posts:
+        comment_counts = dict(
+            db.session.query(PostComment.post_id, db.func.count(PostComment.id))
+            .filter(PostComment.post_id.in_([post.id for post in posts]))
+            .group_by(PostComment.post_id)
+            .all()
+        )
+
+    return [{
         'id': post.id,
         'title': post.title,
         'content': post.content,
         'post_type': post.post_type,
         'likes': post.likes,
-        'views': post.views,
+        'views': post.views + post_views.pending(post.id),
         'created_at': post.created_at.isoformat(),
         'author': {
             'id': post.user.id,
             'username': post.user.username
         },
-        'comments_count': post.comments.count()
-    } for post in posts])
+        'comments_count': comment_counts.get(post.id, 0)
+    } for post in posts]
+
+def overlay_post_counters(body):
+    # Likes and views change too often to invalidate the feed on, so cached
+    # pages get the current counts patched in: one primary-key lookup
+    posts = json.loads(body)
+    if not posts:
+        return body
+    counters = dict((post_id, (likes, views)) for post_id, likes, views in db.session.query(
+        CommunityPost.id, CommunityPost.likes, CommunityPost.views
+    ).filter(CommunityPost.id.in_([post['id'] for post in posts])))
+    for post in posts:
+        if post['id'] in counters:
+            likes, views = counters[post['id']]
+            post['likes'] = likes
+            post['views'] = views + post_views.pending(post['id'])
+    return dumps(posts)
+
+@api.route('/posts', methods=['GET'])
+@response_cache.cached('posts', headers=['X-Next-Cursor'], overlay=overlay_post_counters)
+def get_posts():
+    limit = request.args.get('limit', FEED_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, FEED_MAX_LIMIT))
+
+    # Authors are joined into the page query instead of lazy-loaded per post
+    query = CommunityPost.query.options(db.joinedload(CommunityPost.user))
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            created_at, last_id = decode_cursor(cursor, 'feed', is_datetime=True)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        query = query.filter(db.or_(
+            CommunityPost.created_at < created_at,
+            db.and_(CommunityPost.created_at == created_at, CommunityPost.id < last_id)))
+
+    posts = query.order_by(CommunityPost.created_at.desc(), CommunityPost.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = encode_cursor('feed', posts[-1].created_at, posts[-1].id)
+
+    response = jsonify(serialize_posts(posts))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+# Post search
+# Titles count double so a match in the title outranks one in the body
+SEARCH_TITLE_WEIGHT = 2
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+post_search_index = InvertedIndex()
 
-@app.route('/posts/<int:post_id>', methods=['GET'])
+def search_backend():
+    backend = current_app.config['SEARCH_BACKEND']
+    if backend == 'auto':
+        return 'fulltext' if db.engine.dialect.name == 'mysql' else 'memory'
+    return backend
+
+def ensure_search_index():
+    # Each search first indexes the posts and comments added since the last
+    # one, by whichever worker process. A full rebuild every
+    # SEARCH_INDEX_REFRESH seconds drops comments deleted by other workers.
+    index = post_search_index
+    with index.lock:
+        if index.stale(current_app.config['SEARCH_INDEX_REFRESH']):
+            index.clear()
+        posts = db.session.query(CommunityPost.id, CommunityPost.title, CommunityPost.content) \
+            .filter(CommunityPost.id > index.seen.get('post', 0)).order_by(CommunityPost.id)
+        for post_id, title, content in posts.yield_per(5000):
+            index.add(post_id, title, weight=SEARCH_TITLE_WEIGHT)
+            index.add(post_id, content)
+            index.seen['post'] = post_id
+        comments = db.session.query(PostComment.id, PostComment.post_id, PostComment.content) \
+            .filter(PostComment.id > index.seen.get('comment', 0)).order_by(PostComment.id)
+        for comment_id, post_id, content in comments.yield_per(5000):
+            index.add(post_id, content)
+            index.seen['comment'] = comment_id
+
+def unindex_comment(comment_id, post_id, content):
+    # Only comments the index has already seen were added to it
+    with post_search_index.lock:
+        seen = post_search_index.seen
+        if comment_id <= seen.get('comment', 0):
+            post_search_index.remove(post_id, content)
+        if comment_id == seen.get('comment'):
+            # SQLite hands the newest id out again once it is deleted
+            seen['comment'] = comment_id - 1
+
+def search_posts_fulltext(q, limit, offset):
+    matches = db.text('''
+        SELECT post_id, SUM(score) AS score FROM (
+            SELECT id AS post_id,
+                   MATCH (title, content) AGAINST (:q IN NATURAL LANGUAGE MODE) * :title_weight AS score
+            FROM community_post
+            WHERE MATCH (title, content) AGAINST (:q IN NATURAL LANGUAGE MODE)
+            UNION ALL
+            SELECT post_id, MATCH (content) AGAINST (:q IN NATURAL LANGUAGE MODE) AS score
+            FROM post_comment
+            WHERE MATCH (content) AGAINST (:q IN NATURAL LANGUAGE MODE)
+        ) matches
+        GROUP BY post_id
+        ORDER BY score DESC, post_id DESC
+        LIMIT :limit OFFSET :offset
+    ''')
+    return db.session.execute(matches, {'q': q, 'title_weight': SEARCH_TITLE_WEIGHT,
+                                        'limit': limit, 'offset': offset}).fetchall()
+
+@api.route('/posts/search', methods=['GET'])
+def search_posts():
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+
+    limit = request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    offset = max(0, request.args.get('offset', 0, type=int))
+
+    # Rank one extra hit to know whether another page exists
+    if search_backend() == 'fulltext':
+        hits = search_posts_fulltext(q, limit + 1, offset)
+    else:
+        ensure_search_index()
+        hits = post_search_index.search(q, limit + 1, offset)
+    has_more = len(hits) > limit
+    scores = {post_id: float(score) for post_id, score in hits[:limit]}
+
+    posts = CommunityPost.query.options(db.joinedload(CommunityPost.user)) \
+        .filter(CommunityPost.id.in_(scores)).all() if scores else []
+    posts.sort(key=lambda post: (scores[post.id], post.id), reverse=True)
+
+    results = serialize_posts(posts)
+    for result in results:
+        result['score'] = scores[result['id']]
+    return jsonify({
+        'posts': results,
+        'next_offset': offset + limit if has_more else None
+    })
+
+@api.route('/posts/<int:post_id>', methods=['GET'])
 def get_single_post(post_id):
     post = CommunityPost.query.get_or_404(post_id)
     
-    # Increment views counter
-    post.views += 1
-    db.session.commit()
+    # Increment views counter (buffered, flushed in batches)
+    post_views.increment(post.id)
     
     return jsonify({
         'id': post.id,
@@ -568,7 +2190,7 @@ def get_single_post(post_id):
         'content': post.content,
         'post_type': post.post_type,
         'likes': post.likes,
-        'views': post.views,
+        'views': post.views + post_views.pending(post.id),
         'created_at': post.created_at.isoformat(),
         'author': {
             'id': post.user.id,
@@ -577,9 +2199,10 @@ def get_single_post(post_id):
         'comments_count': post.comments.count()
     })
 
-@app.route('/posts/<int:post_id>/comments', methods=['POST'])
+@api.route('/posts/<int:post_id>/comments', methods=['POST'])
+@admission.limit(user=(0.2, 10), route=(50, 100))
 def add_comment(post_id):
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
 
     data = request.get_json()
@@ -589,12 +2212,24 @@ def add_comment(post_id):
     try:
         new_comment = PostComment(
             post_id=post_id,
-            user_id=session['user_id'],
+            user_id=current_user_id(),
             content=data['content']
         )
         
         db.session.add(new_comment)
         db.session.commit()
+        response_cache.invalidate('posts')
+        broker.publish(f'post:{post_id}', 'comment', {
+            'id': new_comment.id,
+            'post_id': post_id,
+            'content': new_comment.content,
+            'likes': new_comment.likes,
+            'created_at': new_comment.created_at.isoformat(),
+            'author': {
+                'id': new_comment.user.id,
+                'username': new_comment.user.username
+            }
+        })
         
         return jsonify({
             'id': new_comment.id,
@@ -604,14 +2239,10 @@ def add_comment(post_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
-@app.route('/posts/<int:post_id>/comments', methods=['GET'])
+@api.route('/posts/<int:post_id>/comments', methods=['GET'])
 def get_comments(post_id):
     comments = PostComment.query.filter_by(post_id=post_id).order_by(PostComment.created_at.asc()).all()
     
-    # Debug: Print current user session
-    current_user_id = session.get('user_id')
-    print(f"Current user ID in session: {current_user_id}")
-    
     comment_list = []
     for comment in comments:
         comment_data = {
@@ -625,63 +2256,242 @@ def get_comments(post_id):
             }
         }
         comment_list.append(comment_data)
-        print(f"Comment {comment.id}: author_id={comment.user.id}, current_user_id={current_user_id}")
     
+    logger.debug('Listed comments', extra={'post_id': post_id, 'comments': len(comment_list)})
     return jsonify(comment_list)
 
-@app.route('/posts/<int:post_id>/like', methods=['POST'])
+@api.route('/posts/<int:post_id>/like', methods=['POST'])
+@admission.limit(user=(1, 20), route=(200, 400))
 def like_post(post_id):
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    post = CommunityPost.query.get_or_404(post_id)
-    post.likes += 1
-    db.session.commit()
+    if not increment_column(CommunityPost, post_id, CommunityPost.likes):
+        abort(404)
     
     return jsonify({'message': 'Post liked successfully'})
 
-@app.route('/comments/<int:comment_id>/like', methods=['POST'])
+@api.route('/comments/<int:comment_id>/like', methods=['POST'])
+@admission.limit(user=(1, 20), route=(200, 400))
 def like_comment(comment_id):
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    comment = PostComment.query.get_or_404(comment_id)
-    comment.likes += 1
-    db.session.commit()
+    if not increment_column(PostComment, comment_id, PostComment.likes):
+        abort(404)
     
     return jsonify({'message': 'Comment liked successfully'})
 
-@app.route('/comments/<int:comment_id>', methods=['DELETE'])
+@api.route('/comments/<int:comment_id>', methods=['DELETE'])
 def delete_comment(comment_id):
-    if 'user_id' not in session:
+    if current_user_id() is None:
         return jsonify({'error': 'Unauthorized'}), 401
     
     comment = PostComment.query.get_or_404(comment_id)
     
     # Check if the user is the author of the comment
-    if comment.user_id != session['user_id']:
+    if comment.user_id != current_user_id():
         return jsonify({'error': 'You can only delete your own comments'}), 403
     
+    post_id, content = comment.post_id, comment.content
     db.session.delete(comment)
     db.session.commit()
+    response_cache.invalidate('posts')
+    unindex_comment(comment_id, post_id, content)
+    broker.publish(f'post:{post_id}', 'comment_deleted', {'id': comment_id, 'post_id': post_id})
     
     return jsonify({'message': 'Comment deleted successfully'})
 
+# Realtime streams (Server-Sent Events)
+def event_stream(channel):
+    if current_app.config['SSE_STREAM_URL']:
+        return redirect_to_stream_server()
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is None:
+        last_event_id = request.args.get('last_event_id', type=int)
+    subscription = broker.subscribe(channel, last_event_id)
+    heartbeat = current_app.config['SSE_HEARTBEAT']
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            for event in subscription.events(heartbeat=heartbeat):
+                if event is None:
+                    yield ': heartbeat\n\n'
+                    continue
+                yield sse_message(event)
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def redirect_to_stream_server():
+    # stream_server.py holds idle streams on one event loop instead of a
+    # worker thread each
+    base = current_app.config['SSE_STREAM_URL']
+    if base.startswith(':'):
+        base = f"{request.scheme}://{request.host.split(':')[0]}{base}"
+    query = request.query_string.decode()
+    return redirect(base.rstrip('/') + request.path + (f'?{query}' if query else ''), code=307)
+
+@api.route('/stream/messages', methods=['GET'])
+def stream_messages():
+    return event_stream('messages')
+
+@api.route('/stream/posts/<int:post_id>', methods=['GET'])
+def stream_post(post_id):
+    return event_stream(f'post:{post_id}')
+
+# Monitoring
+def metrics_allowed():
+    # The snapshot includes hosts, SQL text and query plans
+    token = current_app.config['METRICS_TOKEN']
+    if token and hmac.compare_digest(request.headers.get('X-Metrics-Token', '').encode(), token.encode()):
+        return True
+    user = current_user()
+    return user is not None and user['role'] == 'admin'
+
+@api.route('/api/metrics', methods=['GET'])
+@admission.exempt
+def get_metrics():
+    if not metrics_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({
+        'pool': pool_metrics.snapshot(),
+        'replicas': replicas.snapshot(),
+        'sql': sql_profiler.snapshot(),
+        'admission': admission.snapshot(),
+        'sse_subscribers': broker.subscriber_count()
+    })
+
 # Add CORS headers
-@app.after_request
+@api.after_app_request
 def after_request(response):
     origin = request.headers.get('Origin')
-    if origin in ["http://localhost:8000", "http://127.0.0.1:8000", "http://127.0.0.1:5000"]:
+    if origin in CORS_ORIGINS:
         response.headers.add('Access-Control-Allow-Origin', origin)
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
         response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
         response.headers.add('Access-Control-Allow-Credentials', 'true')
     return response
 
-def init_db():
-    with app.app_context():
-        db.create_all()
+# Schema management: run `flask migrate` on deploy instead of on every start
+# Derived tables filled from existing rows when migrate first creates them
+BACKFILLS = {'emission_rollup': rebuild_emission_rollups, 'heatmap_cell': rebuild_heatmap_cells}
+
+def migrate_schema(dry_run=False):
+    created = [table for table in BACKFILLS if not db.inspect(db.engine).has_table(table)]
+    statements = migrations.upgrade(db.engine, db.metadata, dry_run=dry_run)
+    statements += normalize_vehicle_catalog(dry_run)
+    for table in created:
+        statements.append(f'-- backfill {table}')
+        if not dry_run:
+            BACKFILLS[table]()
+    return statements
+
+# Free-text UserCar columns from before the vehicle catalog -> catalog kind
+LEGACY_CAR_COLUMNS = {'company': 'make', 'model': 'model', 'fuel_type': 'fuel_type', 'transmission': 'transmission'}
+
+def normalize_vehicle_catalog(dry_run=False):
+    # Interns the free-text values of a pre-catalog user_car table into the
+    # lookup tables (deduplicating spellings), fills in the id columns and
+    # drops the old columns. A no-op once they are gone.
+    table = db.Table('user_car', db.MetaData(), autoload_with=db.engine)
+    legacy = [name for name in LEGACY_CAR_COLUMNS if name in table.c]
+    if not legacy:
+        return []
+    indexes = [index for index in table.indexes if any(column.name in legacy for column in index.columns)]
+    statements = [f'-- fill user_car catalog ids from {", ".join(legacy)}']
+    statements += [str(DropIndex(index).compile(dialect=db.engine.dialect)).strip() for index in indexes]
+    statements += [f'ALTER TABLE user_car DROP COLUMN {name}' for name in legacy]
+    if dry_run:
+        return statements
+
+    def backfill(columns, ids_for):
+        with db.engine.connect() as conn:
+            values = conn.execute(db.select(*columns).distinct()).all()
+        for value in values:
+            try:
+                ids = ids_for(*value)
+            except ValueError:
+                continue  # blank names stay unset
+            with db.engine.begin() as conn:
+                conn.execute(table.update().where(*[column == v for column, v in zip(columns, value)]).values(**ids))
+
+    def make_and_model(company, model):
+        make_id = vehicle_catalog.intern('make', company)
+        return {'make_id': make_id, 'model_id': vehicle_catalog.intern('model', model, make_id)}
+
+    if 'company' in legacy and 'model' in legacy:
+        backfill([table.c.company, table.c.model], make_and_model)
+    for name in ('fuel_type', 'transmission'):
+        if name in legacy:
+            backfill([table.c[name]], lambda value, name=name: {f'{name}_id': vehicle_catalog.intern(name, value)})
+
+    with db.engine.begin() as conn:
+        for index in indexes:
+            conn.execute(DropIndex(index))
+        for name in legacy:
+            conn.execute(db.text(f'ALTER TABLE user_car DROP COLUMN {name}'))
+    return statements
+
+@api.cli.command('migrate')
+@click.option('--dry-run', is_flag=True, help='Print the DDL without running it')
+def migrate_command(dry_run):
+    statements = migrate_schema(dry_run)
+    for statement in statements:
+        print(statement if statement.startswith('--') else f'{statement};')
+    print('Schema is up to date' if not statements else
+          f"{len(statements)} statement(s) {'pending' if dry_run else 'applied'}")
+
+def create_app(config=None):
+    # config: settings applied on top of config_from_env(). Nothing here
+    # connects to a database, so a preloading server can fork right after.
+    app = Flask(__name__)
+    app.config.update(config_from_env())
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          engine_options_from_env(app.config['SQLALCHEMY_DATABASE_URI']))
+    CORS(app,
+         resources={r"/*": {
+             "origins": CORS_ORIGINS,
+             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+             "allow_headers": ["Content-Type", "Authorization"],
+             "expose_headers": ["X-Next-Cursor", "ETag", "X-Request-ID"],
+             "supports_credentials": True
+         }},
+         supports_credentials=True)
+
+    log_pipeline.init_app(app)
+    db.init_app(app)
+    replicas.init_app(app)
+    sql_profiler.init_app(app)
+    response_cache.init_app(app)
+    password_hasher.init_app(app)
+    token_signer.init_app(app)
+    if app.config['ADMISSION_MAX_CONCURRENT'] is None:
+        # Shed before requests start waiting on an exhausted pool
+        options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+        app.config['ADMISSION_MAX_CONCURRENT'] = options.get('pool_size', 0) + options.get('max_overflow', 0)
+    admission.init_app(app)
+    static_assets.max_age = app.config['STATIC_MAX_AGE']
+    if app.config['STATIC_PRECOMPRESS']:
+        static_assets.load()
+    post_views.flush_interval = app.config['VIEW_COUNTER_FLUSH_INTERVAL']
+    post_views.max_pending = app.config['VIEW_COUNTER_MAX_PENDING']
+    atexit.register(flush_counters, app)
+    leaderboard.configure(app.config['LEADERBOARD_WINDOWS'], app.config['LEADERBOARD_MIN_DISTANCE'],
+                          app.config['LEADERBOARD_REFRESH'])
+    broker.configure(TableEventLog(StreamEvent.__table__, lambda: db.get_engine(app)),
+                     app.config['SSE_POLL_INTERVAL'], app.config['SSE_RETENTION'])
+    app.register_blueprint(api)
+    return app
 
 if __name__ == '__main__':
-    init_db()  # Initialize the database when starting the app
+    # Development server; see wsgi.py for production
+    app = create_app()
+    static_assets.reload = True
     app.run(debug=True)
\ No newline at end of file
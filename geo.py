@@ -0,0 +1,89 @@
+# geo.py - Geohash, encoded polylines and vectorized grid binning for the heatmap
+import numpy as np
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(lat, lng, precision=8):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    bits, bit_count, even, chars = 0, 0, True, []
+    while len(chars) < precision:
+        value, bounds = (lng, lng_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            bounds[0] = mid
+        else:
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def decode_polyline(encoded, precision=5):
+    # Google encoded polyline format -> [(lat, lng), ...]
+    points, index, lat, lng = [], 0, 0, 0
+    factor = 10 ** precision
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift, result = 0, 0
+            while True:
+                if index >= len(encoded):
+                    raise ValueError('Truncated polyline')
+                byte = ord(encoded[index]) - 63
+                index += 1
+                if byte < 0 or byte > 63:
+                    raise ValueError('Invalid polyline character')
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / factor, lng / factor))
+    return points
+
+
+def validate_coordinates(lat, lng):
+    lat, lng = float(lat), float(lng)
+    if not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        raise ValueError('Coordinates out of range')
+    return lat, lng
+
+
+def grid_cell_size(zoom, cells_per_tile=4):
+    # Cell width in degrees: a fixed number of cells per web-map tile width
+    return 360.0 / (2 ** zoom) / cells_per_tile
+
+
+def grid_cells(lats, lngs, cell_size):
+    # Row and column of each point in a regular lat/lng grid
+    return (np.floor((lats + 90.0) / cell_size).astype(np.int64),
+            np.floor((lngs + 180.0) / cell_size).astype(np.int64))
+
+
+def cell_centres(rows, cols, cell_size):
+    return (rows + 0.5) * cell_size - 90.0, (cols + 0.5) * cell_size - 180.0
+
+
+def bin_points(lats, lngs, weights, groups, cell_size):
+    # Sum weights into a regular lat/lng grid; returns cell rows, columns,
+    # sums and the number of distinct groups (e.g. trips, as non-negative
+    # ints) per cell
+    if len(lats) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0), empty
+    n_cols = int(np.ceil(360.0 / cell_size)) + 1
+    rows, cols = grid_cells(lats, lngs, cell_size)
+    cells, inverse = np.unique(rows * n_cols + cols, return_inverse=True)
+    sums = np.bincount(inverse, weights=weights)
+    n_groups = int(groups.max()) + 1
+    cell_groups = np.unique(inverse * n_groups + groups)
+    counts = np.bincount(cell_groups // n_groups, minlength=len(cells))
+    return cells // n_cols, cells % n_cols, sums, counts
@@ -0,0 +1,49 @@
+# gunicorn.conf.py - Preforked production server settings from the environment
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.environ.get('WEB_BIND', f"0.0.0.0:{os.environ.get('PORT', 5000)}")
+workers = int(os.environ.get('WEB_WORKERS') or multiprocessing.cpu_count() * 2 + 1)
+# Threads per worker; each request holds one, including its DB waits
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+# Recycle workers after this many requests (0 = never)
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+# An optional password hashing pool is per worker; keep the total across
+# workers to about one hashing process per CPU
+hash_workers = int(os.environ.get('PASSWORD_HASH_WORKERS') or 0)
+if hash_workers:
+    os.environ['PASSWORD_HASH_WORKERS'] = str(max(1, min(hash_workers, multiprocessing.cpu_count() // workers)))
+
+# Server-Sent Events run in stream_server.py, started and stopped with the
+# master, so idle streams do not hold worker threads. The workers redirect
+# /stream/* to it unless SSE_STREAM_URL says otherwise; an empty
+# STREAM_BIND leaves the streams on the workers.
+stream_bind = os.environ.get('STREAM_BIND', '0.0.0.0:5001')
+if stream_bind and not os.environ.get('SSE_STREAM_URL'):
+    os.environ['SSE_STREAM_URL'] = ':' + stream_bind.rpartition(':')[2]
+
+# Import the app once in the master and fork the workers from it, so they
+# start without re-importing and share its memory. create_app() opens no
+# database connections, so nothing socket-backed is shared across forks.
+preload_app = os.environ.get('WEB_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+
+def when_ready(server):
+    if stream_bind:
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stream_server.py')
+        server.stream_server = subprocess.Popen([sys.executable, script], env={**os.environ, 'STREAM_BIND': stream_bind})
+
+
+def on_exit(server):
+    stream_server = getattr(server, 'stream_server', None)
+    if stream_server is not None:
+        stream_server.terminate()
+        stream_server.wait(graceful_timeout)
@@ -0,0 +1,217 @@
+# leaderboard.py - Incrementally maintained CO2-per-km rankings over rolling windows
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+
+class RankedSet:
+    # Indexable skip list: O(log n) insert, remove, rank and positional access
+    MAX_LEVEL = 32
+
+    def __init__(self, seed=None):
+        self._random = random.Random(seed)
+        self._head = [None, [None] * self.MAX_LEVEL, [1] * self.MAX_LEVEL]  # key, next, width
+        self._level = 1
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and self._random.random() < 0.5:
+            level += 1
+        return level
+
+    def _path(self, key):
+        # Last node before `key` on every level, and the rank of each
+        chain, ranks = [None] * self.MAX_LEVEL, [0] * self.MAX_LEVEL
+        node, rank = self._head, 0
+        for level in reversed(range(self._level)):
+            while node[1][level] is not None and node[1][level][0] < key:
+                rank += node[2][level]
+                node = node[1][level]
+            chain[level], ranks[level] = node, rank
+        return chain, ranks
+
+    def insert(self, key):
+        chain, ranks = self._path(key)
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                chain[i], ranks[i] = self._head, 0
+                self._head[2][i] = self._size + 1
+            self._level = level
+        node = [key, [None] * level, [0] * level]
+        rank = ranks[0] + 1
+        for i in range(level):
+            prev = chain[i]
+            node[1][i], prev[1][i] = prev[1][i], node
+            node[2][i] = prev[2][i] - (rank - ranks[i]) + 1
+            prev[2][i] = rank - ranks[i]
+        for i in range(level, self._level):
+            chain[i][2][i] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain, _ = self._path(key)
+        node = chain[0][1][0]
+        if node is None or node[0] != key:
+            raise KeyError(key)
+        for i in range(self._level):
+            prev = chain[i]
+            if prev[1][i] is node:
+                prev[1][i] = node[1][i]
+                prev[2][i] += node[2][i] - 1
+            else:
+                prev[2][i] -= 1
+        self._size -= 1
+
+    def rank(self, key):
+        # 0-based position of `key`, which must be present
+        chain, ranks = self._path(key)
+        node = chain[0][1][0]
+        if node is None or node[0] != key:
+            raise KeyError(key)
+        return ranks[0]
+
+    def slice(self, start, stop):
+        # Keys at positions [start, stop)
+        node, position = self._head, -1
+        for level in reversed(range(self._level)):
+            while node[1][level] is not None and position + node[2][level] <= start:
+                position += node[2][level]
+                node = node[1][level]
+        node = node if position == start else node[1][0]
+        keys = []
+        while node is not None and len(keys) < stop - start:
+            keys.append(node[0])
+            node = node[1][0]
+        return keys
+
+
+class Ranking:
+    # One window's per-user totals and their ordering. Keys sort greenest
+    # first: lowest CO2 per km, then longest distance, then user id.
+    def __init__(self, min_distance):
+        self.min_distance = min_distance
+        self.totals = defaultdict(lambda: [0.0, 0.0])  # user_id -> [co2, distance]
+        self.keys = {}
+        self.order = RankedSet()
+
+    def _key(self, user_id):
+        co2, distance = self.totals[user_id]
+        if distance < self.min_distance:
+            return None
+        return (co2 / distance, -distance, user_id)
+
+    def add(self, user_id, co2, distance):
+        old = self.keys.pop(user_id, None)
+        if old is not None:
+            self.order.remove(old)
+        totals = self.totals[user_id]
+        totals[0] += co2
+        totals[1] += distance
+        key = self._key(user_id)
+        if key is not None:
+            self.keys[user_id] = key
+            self.order.insert(key)
+
+    def entry(self, user_id, position=None):
+        co2, distance = self.totals.get(user_id, (0.0, 0.0))
+        return {
+            'rank': position + 1 if position is not None else None,
+            'user_id': user_id,
+            'co2_per_km': co2 / distance if distance else None,
+            'co2_emissions': co2,
+            'distance': distance
+        }
+
+
+class Leaderboard:
+    def __init__(self, windows=(7, 30, 0), min_distance=50.0, refresh_interval=300):
+        self.lock = threading.RLock()
+        self.configure(windows, min_distance, refresh_interval)
+
+    def configure(self, windows, min_distance, refresh_interval):
+        # windows are in days; 0 means all time. Drops the loaded rankings.
+        with self.lock:
+            self.windows = tuple(windows)
+            self.min_distance = min_distance
+            self.refresh_interval = refresh_interval
+            self.ready = False
+            self.loaded_at = 0.0
+            self.rolling_days = max((w for w in self.windows if w), default=0)
+            self._reset(datetime.utcnow().date())
+
+    def _reset(self, today):
+        self.today = today
+        self._daily = defaultdict(lambda: defaultdict(lambda: [0.0, 0.0]))  # user -> day -> totals
+        self.rankings = {window: Ranking(self.min_distance) for window in self.windows}
+
+    def stale(self):
+        return not self.ready or time.monotonic() - self.loaded_at > self.refresh_interval
+
+    def load(self, daily_rows, all_time_rows):
+        # daily_rows: (user_id, day, co2, distance) covering the longest rolling
+        # window; all_time_rows: (user_id, co2, distance)
+        with self.lock:
+            self._reset(datetime.utcnow().date())
+            for user_id, day, co2, distance in daily_rows:
+                self._add_rolling(user_id, day, co2, distance)
+            if 0 in self.rankings:
+                for user_id, co2, distance in all_time_rows:
+                    self.rankings[0].add(user_id, co2, distance)
+            self.ready = True
+            self.loaded_at = time.monotonic()
+
+    def _add_rolling(self, user_id, day, co2, distance):
+        age = (self.today - day).days
+        if age >= self.rolling_days:
+            return
+        totals = self._daily[user_id][day]
+        totals[0] += co2
+        totals[1] += distance
+        for window, ranking in self.rankings.items():
+            if window and age < window:
+                ranking.add(user_id, co2, distance)
+
+    def _advance(self):
+        # Days only fall out of rolling windows when the date changes, so
+        # rebuild those windows from the daily buckets once per day
+        today = datetime.utcnow().date()
+        if today == self.today:
+            return
+        daily, all_time = self._daily, self.rankings.get(0)
+        self._reset(today)
+        if all_time is not None:
+            self.rankings[0] = all_time
+        for user_id, days in daily.items():
+            for day, (co2, distance) in days.items():
+                self._add_rolling(user_id, day, co2, distance)
+
+    def record(self, user_id, day, co2, distance):
+        with self.lock:
+            if not self.ready:
+                return
+            self._advance()
+            self._add_rolling(user_id, day, co2, distance)
+            if 0 in self.rankings:
+                self.rankings[0].add(user_id, co2, distance)
+
+    def top(self, window, limit, offset=0):
+        with self.lock:
+            self._advance()
+            ranking = self.rankings[window]
+            keys = ranking.order.slice(offset, offset + limit)
+            return len(ranking.order), [ranking.entry(key[2], offset + i) for i, key in enumerate(keys)]
+
+    def standing(self, window, user_id):
+        with self.lock:
+            self._advance()
+            ranking = self.rankings[window]
+            key = ranking.keys.get(user_id)
+            position = ranking.order.rank(key) if key is not None else None
+            return len(ranking.order), ranking.entry(user_id, position)
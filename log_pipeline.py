@@ -0,0 +1,147 @@
+# log_pipeline.py - Queue-backed JSON logging so request threads never wait on log I/O
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+# LogRecord attributes that aren't user-supplied extras
+RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def parse_levels(spec):
+    # "sql_profiler=DEBUG,werkzeug=WARNING" -> {'sql_profiler': 10, 'werkzeug': 30}
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, level = item.partition('=')
+        level = logging.getLevelName(level.strip().upper())
+        if not isinstance(level, int):
+            raise ValueError(f'Unknown log level in LOG_LEVELS: {item}')
+        levels[name.strip()] = level
+    return levels
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    # Runs on the calling thread, before the record is queued, because the
+    # listener thread has no request context to read from
+    def __init__(self, user_id=None, debug_sample_rate=1.0):
+        super().__init__()
+        self.user_id = user_id
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0:
+            if random.random() >= self.debug_sample_rate:
+                return False
+            record.sample_rate = self.debug_sample_rate
+        if has_request_context() and 'request_id' in g:
+            record.request_id = g.request_id
+            record.elapsed_ms = round((time.perf_counter() - g.log_request_start) * 1000, 2)
+            if self.user_id is not None:
+                record.user_id = self.user_id()
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    # A full queue drops the record instead of blocking the request thread
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    def __init__(self, app=None, user_id=None):
+        self.user_id = user_id
+        self.listener = None
+        self.handler = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOG_LEVEL', 'INFO')
+        app.config.setdefault('LOG_LEVELS', '')
+        app.config.setdefault('LOG_QUEUE_SIZE', 10000)
+        app.config.setdefault('LOG_DEBUG_SAMPLE_RATE', 1.0)
+        app.config.setdefault('LOG_REQUESTS', False)
+        self.shutdown()
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JSONFormatter())
+        self.handler = DroppingQueueHandler(queue.Queue(maxsize=app.config['LOG_QUEUE_SIZE']))
+        self.handler.addFilter(RequestContextFilter(self.user_id, app.config['LOG_DEBUG_SAMPLE_RATE']))
+        self.listener = QueueListener(self.handler.queue, output)
+
+        root = logging.getLogger()
+        root.handlers = [self.handler]
+        root.setLevel(app.config['LOG_LEVEL'].upper())
+        for name, level in parse_levels(app.config['LOG_LEVELS']).items():
+            logging.getLogger(name).setLevel(level)
+        # Let app.logger propagate to the queue instead of writing to stderr itself
+        app.logger.removeHandler(default_handler)
+
+        self.log_requests = app.config['LOG_REQUESTS']
+        self.access_logger = logging.getLogger('access')
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        self.listener.start()
+        atexit.register(self.shutdown)
+
+    def _start_request(self):
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.log_request_start = time.perf_counter()
+
+    def _finish_request(self, response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+            if self.log_requests:
+                self.access_logger.info('%s %s %s', request.method, request.path, response.status_code,
+                                        extra={'method': request.method, 'path': request.path,
+                                               'status': response.status_code})
+        return response
+
+    def _after_fork(self):
+        # A forked worker (e.g. under a preloading server) inherits the queue
+        # but not the listener thread, so give it its own
+        if self.listener is not None:
+            self.handler.queue = queue.Queue(maxsize=self.handler.queue.maxsize)
+            self.listener = QueueListener(self.handler.queue, *self.listener.handlers)
+            self.listener.start()
+
+    def shutdown(self):
+        # Drains whatever is still queued
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
@@ -0,0 +1,52 @@
+# migrations.py - Bring an existing database up to date with the models, additively
+from sqlalchemy import DDL, inspect
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+
+
+def applies_to(index, dialect):
+    # Indexes can be limited to some databases with info={'dialects': (...)},
+    # e.g. MySQL FULLTEXT indexes
+    dialects = index.info.get('dialects')
+    return dialects is None or dialect.name in dialects
+
+
+def pending_changes(engine, metadata):
+    # DDL for every table, column and index in `metadata` that the database
+    # lacks. Nothing is dropped or altered, so it is safe to run repeatedly.
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    changes = []
+    for table in metadata.sorted_tables:
+        table_indexes = [index for index in table.indexes if applies_to(index, engine.dialect)]
+        if table.name not in existing:
+            changes.append(CreateTable(table))
+            changes.extend(CreateIndex(index) for index in table_indexes)
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                spec = CreateColumn(column).compile(dialect=engine.dialect)
+                table_name = engine.dialect.identifier_preparer.format_table(table)
+                changes.append(DDL(f'ALTER TABLE {table_name} ADD COLUMN {spec}'.replace('%', '%%')))
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        changes.extend(CreateIndex(index) for index in table_indexes if index.name not in indexes)
+    return changes
+
+
+def upgrade(engine, metadata, dry_run=False):
+    # Returns the DDL statements as SQL strings, after running them unless
+    # dry_run. New tables fire the same before_create/after_create events as
+    # under create_all(), so DDL attached to them runs too (it is not part of
+    # the returned list).
+    changes = pending_changes(engine, metadata)
+    statements = [str(change.compile(dialect=engine.dialect)).strip() for change in changes]
+    if not dry_run and changes:
+        created = [change.element for change in changes if isinstance(change, CreateTable)]
+        with engine.begin() as conn:
+            for table in created:
+                table.dispatch.before_create(table, conn, checkfirst=False, _ddl_runner=None)
+            for change in changes:
+                conn.execute(change)
+            for table in created:
+                table.dispatch.after_create(table, conn, checkfirst=False, _ddl_runner=None)
+    return statements
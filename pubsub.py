@@ -0,0 +1,190 @@
+# pubsub.py - Publish/subscribe with replay for Server-Sent Events, relayed
+# through a shared event log so every process sees every event
+import json
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+Event = namedtuple('Event', ['id', 'channel', 'type', 'data'])
+
+logger = logging.getLogger(__name__)
+
+
+def sse_message(event):
+    return f'id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.data)}\n\n'
+
+
+class TableEventLog:
+    # Events stored as rows of `table` (id, channel, event_type, data,
+    # created_at). The autoincrement id is the SSE event id, so ids are
+    # ordered across processes and survive restarts. `engine` is a callable
+    # returning the primary engine.
+    def __init__(self, table, engine):
+        self.table = table
+        self.engine = engine
+
+    def append(self, channel, event_type, data):
+        with self.engine().begin() as conn:
+            result = conn.execute(self.table.insert().values(
+                channel=channel, event_type=event_type, data=json.dumps(data), created_at=datetime.utcnow()))
+        return result.inserted_primary_key[0]
+
+    def read(self, after_id, channel=None, until_id=None, limit=500):
+        table = self.table
+        query = select(table.c.id, table.c.channel, table.c.event_type, table.c.data).where(table.c.id > after_id)
+        if channel is not None:
+            query = query.where(table.c.channel == channel)
+        if until_id is not None:
+            query = query.where(table.c.id <= until_id)
+        with self.engine().connect() as conn:
+            rows = conn.execute(query.order_by(table.c.id).limit(limit)).all()
+        return [Event(row.id, row.channel, row.event_type, json.loads(row.data)) for row in rows]
+
+    def latest_id(self):
+        with self.engine().connect() as conn:
+            return conn.execute(select(func.max(self.table.c.id))).scalar() or 0
+
+    def prune(self, before):
+        # The newest row always stays so the autoincrement counter never
+        # falls back and reissues ids
+        latest = self.latest_id()
+        with self.engine().begin() as conn:
+            conn.execute(self.table.delete().where(self.table.c.created_at < before, self.table.c.id < latest))
+
+
+class Subscription:
+    def __init__(self, broker, channel, max_queue):
+        self.broker = broker
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.closed = False
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A client this far behind reconnects and resumes via Last-Event-ID
+            self.closed = True
+
+    def events(self, heartbeat=15.0):
+        # Yields events as they arrive, or None every `heartbeat` seconds of
+        # silence so the caller can keep the connection alive
+        while not self.closed:
+            try:
+                yield self.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield None
+
+    def close(self):
+        self.closed = True
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    # publish() appends to the shared log. Each process with subscribers
+    # runs one poller thread that reads new events from the log and fans
+    # them out to its own subscribers, so a stream sees events published by
+    # any worker.
+    def __init__(self, log=None, max_queue=1000, poll_interval=0.5, gap_timeout=2.0, retention=3600,
+                 batch_size=500):
+        self.log = log
+        self.max_queue = max_queue
+        self.poll_interval = poll_interval
+        # Ids can become visible out of order when inserts commit out of
+        # order; a missing id is waited for this long before it is skipped
+        self.gap_timeout = gap_timeout
+        self.retention = retention
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._subscribers = {}   # channel -> set of subscriptions
+        self._position = 0       # id of the last event fanned out
+        self._gap = None         # (first missing id, when it was noticed)
+        self._poller = None
+
+    def configure(self, log, poll_interval=0.5, retention=3600):
+        self.log = log
+        self.poll_interval = poll_interval
+        self.retention = retention
+
+    def publish(self, channel, event_type, data):
+        event_id = self.log.append(channel, event_type, data)
+        # Local subscribers get it without waiting out the poll interval
+        self._wakeup.set()
+        return event_id
+
+    def subscribe(self, channel, last_event_id=None, factory=Subscription):
+        subscription = factory(self, channel, self.max_queue)
+        with self._lock:
+            # Threads do not survive a fork, so a forked worker starts its own
+            if self._poller is None or not self._poller.is_alive():
+                self._start()
+            self._subscribers.setdefault(channel, set()).add(subscription)
+            if last_event_id is not None:
+                # Replays up to where the poller has got; it delivers the rest
+                for event in self.log.read(last_event_id, channel, until_id=self._position, limit=self.max_queue):
+                    subscription.deliver(event)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _start(self):
+        self._position = self.log.latest_id()
+        self._gap = None
+        self._poller = threading.Thread(target=self._run, name='sse-poller', daemon=True)
+        self._poller.start()
+
+    def _run(self):
+        next_prune = time.monotonic()
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            with self._lock:
+                # Stops with the last stream; the next subscriber restarts it
+                if not self._subscribers:
+                    self._poller = None
+                    return
+            try:
+                self.poll()
+                if time.monotonic() >= next_prune:
+                    self.log.prune(datetime.utcnow() - timedelta(seconds=self.retention))
+                    next_prune = time.monotonic() + self.retention / 10
+            except Exception:
+                logger.exception('SSE event poll failed')
+
+    def poll(self):
+        events = self._ready(self.log.read(self._position, limit=self.batch_size))
+        if not events:
+            return
+        with self._lock:
+            for event in events:
+                for subscription in self._subscribers.get(event.channel, ()):
+                    subscription.deliver(event)
+            self._position = events[-1].id
+
+    def _ready(self, events):
+        # The events up to the first unexplained gap in the ids
+        expected = self._position + 1
+        for index, event in enumerate(events):
+            if event.id != expected:
+                if self._gap is None or self._gap[0] != expected:
+                    self._gap = (expected, time.monotonic())
+                if time.monotonic() - self._gap[1] < self.gap_timeout:
+                    return events[:index]
+            expected = event.id + 1
+        return events
@@ -0,0 +1,119 @@
+# response_cache.py - Cached GET responses with strong ETags and write invalidation
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request
+
+
+class MemoryBackend:
+    # In-process LRU with per-entry TTL. A shared backend (e.g. Redis) only
+    # needs the same get/set/delete/incr methods to be swapped in.
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def incr(self, key):
+        with self._lock:
+            value = self._data.get(key, (0, None))[0] + 1
+            self._data[key] = (value, None)
+            self._data.move_to_end(key)
+            return value
+
+
+class ResponseCache:
+    # Cached entries are keyed by namespace generation + full request path,
+    # so invalidate(namespace) makes every cached variant unreachable at once.
+    # With the default MemoryBackend both the entries and the generations are
+    # per process: a write invalidates only the worker that handled it, and
+    # the others serve their copy for up to RESPONSE_CACHE_TTL seconds.
+    def __init__(self, app=None, backend=None, before_fill=None):
+        # before_fill: called before a miss is rendered, e.g. to read from the
+        # primary so nobody is served a cached body older than their own writes
+        self.backend = backend
+        self.before_fill = before_fill
+        self.ttl = 30
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE_TTL', 30)
+        app.config.setdefault('RESPONSE_CACHE_SIZE', 1024)
+        self.ttl = app.config['RESPONSE_CACHE_TTL']
+        if self.backend is None:
+            self.backend = MemoryBackend(app.config['RESPONSE_CACHE_SIZE'])
+
+    def _generation(self, namespace):
+        return self.backend.get('gen:' + namespace) or 0
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            self.backend.incr('gen:' + namespace)
+
+    def cached(self, namespace, headers=(), overlay=None):
+        # headers: response headers worth replaying from the cached entry.
+        # overlay: called with a cached body before it is served, to patch in
+        # values that change too often to invalidate on (e.g. like counts);
+        # the ETag is taken over the patched body.
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.ttl <= 0:
+                    return view(*args, **kwargs)
+                key = f'resp:{namespace}:{self._generation(namespace)}:{request.full_path}'
+                entry = self.backend.get(key)
+                if entry is not None and overlay is not None:
+                    body = overlay(entry['body'])
+                    entry = {**entry, 'body': body, 'etag': hashlib.sha1(body).hexdigest()}
+                elif entry is None:
+                    if self.before_fill is not None:
+                        self.before_fill()
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data()
+                    entry = {
+                        'body': body,
+                        'etag': hashlib.sha1(body).hexdigest(),
+                        'mimetype': response.mimetype,
+                        'headers': {name: response.headers[name] for name in headers if name in response.headers}
+                    }
+                    self.backend.set(key, entry, self.ttl)
+
+                response = Response(entry['body'], mimetype=entry['mimetype'], headers=entry['headers'])
+                response.set_etag(entry['etag'])
+                # Clients keep the body but revalidate with If-None-Match each time
+                response.headers['Cache-Control'] = 'no-cache'
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
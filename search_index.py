@@ -0,0 +1,106 @@
+# search_index.py - In-process inverted index with BM25 ranking
+import heapq
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Posting lists shorter than this are always scored in full
+COMMON_TERM_MIN_POSTINGS = 1000
+
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 'in', 'into',
+    'is', 'it', 'no', 'not', 'of', 'on', 'or', 'so', 'such', 'that', 'the', 'their',
+    'then', 'there', 'these', 'they', 'this', 'to', 'was', 'will', 'with', 'i', 'you'
+))
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall((text or '').lower())
+            if len(token) > 1 and token not in STOPWORDS]
+
+
+class InvertedIndex:
+    # Documents are built up from text fragments (a post's title, body and
+    # each comment), so fragments can be added and removed incrementally.
+    def __init__(self, k1=1.2, b=0.75, common_term_ratio=0.05):
+        self.k1 = k1
+        self.b = b
+        self.common_term_ratio = common_term_ratio
+        self.postings = defaultdict(dict)   # term -> {doc_id: term frequency}
+        self.doc_lengths = {}               # doc_id -> number of indexed tokens
+        self.total_length = 0
+        self.seen = {}                      # source -> highest row id indexed
+        self.loaded_at = None
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def clear(self):
+        # Empties the index ahead of a rebuild
+        with self.lock:
+            self.postings.clear()
+            self.doc_lengths.clear()
+            self.total_length = 0
+            self.seen = {}
+            self.loaded_at = time.monotonic()
+
+    def stale(self, refresh_interval):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > refresh_interval
+
+    def add(self, doc_id, text, weight=1):
+        counts = Counter(tokenize(text))
+        with self.lock:
+            for term, count in counts.items():
+                postings = self.postings[term]
+                postings[doc_id] = postings.get(doc_id, 0) + count * weight
+            length = sum(counts.values()) * weight
+            self.doc_lengths[doc_id] = self.doc_lengths.get(doc_id, 0) + length
+            self.total_length += length
+
+    def remove(self, doc_id, text, weight=1):
+        counts = Counter(tokenize(text))
+        with self.lock:
+            for term, count in counts.items():
+                postings = self.postings.get(term)
+                if not postings or doc_id not in postings:
+                    continue
+                postings[doc_id] -= count * weight
+                if postings[doc_id] <= 0:
+                    del postings[doc_id]
+                    if not postings:
+                        del self.postings[term]
+            if doc_id in self.doc_lengths:
+                length = min(sum(counts.values()) * weight, self.doc_lengths[doc_id])
+                self.doc_lengths[doc_id] -= length
+                self.total_length -= length
+
+    def search(self, query, limit=20, offset=0):
+        # Returns [(doc_id, score)] best first, ties broken by newest id
+        terms = set(tokenize(query))
+        with self.lock:
+            n_docs = len(self.doc_lengths)
+            if not terms or not n_docs:
+                return []
+            avg_length = self.total_length / n_docs or 1
+            k1, b, doc_lengths = self.k1, self.b, self.doc_lengths
+            scores = defaultdict(float)
+            # Rarest terms first. Once they have produced candidates, very
+            # common terms (low idf) only re-rank those candidates instead of
+            # walking their huge posting lists.
+            term_postings = sorted((self.postings[term] for term in terms if term in self.postings), key=len)
+            for postings in term_postings:
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                if scores and len(postings) > max(self.common_term_ratio * n_docs, COMMON_TERM_MIN_POSTINGS):
+                    matches = [(doc_id, postings[doc_id]) for doc_id in list(scores) if doc_id in postings]
+                else:
+                    matches = postings.items()
+                for doc_id, tf in matches:
+                    norm = k1 * (1 - b + b * doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] += idf * tf * (k1 + 1) / (tf + norm)
+        top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return top[offset:]
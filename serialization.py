@@ -0,0 +1,116 @@
+# serialization.py - Declarative response schemas compiled to row -> dict functions
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder produces the same JSON
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(payload):
+    # datetimes and dates are left to the encoder; orjson and _default both
+    # emit them in isoformat()
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, default=_default, separators=(',', ':')).encode()
+
+
+def json_response(payload, status=200, headers=None):
+    return Response(dumps(payload), status=status, headers=headers, mimetype='application/json')
+
+
+def parse_fields(value):
+    # "?fields=id,price" -> ['id', 'price']; None means every field
+    if not value:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class Field:
+    def __init__(self, name, column, decode=None):
+        # Dotted names ("vehicle.model") nest in the output; decode maps the
+        # column value to the output value (e.g. a lookup id to its name)
+        self.name = name
+        self.column = column
+        self.decode = decode
+
+
+class Projection:
+    def __init__(self, fields):
+        self.fields = fields
+        self.columns = [field.column for field in fields]
+        self.serialize = self._compile()
+
+    def _compile(self):
+        # Generates `def serialize(row): return {'id': row[0], ...}` so each
+        # row costs one dict display rather than a loop over the schema
+        tree = {}
+        for index, field in enumerate(self.fields):
+            node = tree
+            *parents, leaf = field.name.split('.')
+            for parent in parents:
+                node = node.setdefault(parent, {})
+            node[leaf] = index
+
+        namespace = {f'decode_{index}': field.decode
+                     for index, field in enumerate(self.fields) if field.decode is not None}
+
+        def value(index):
+            return f'decode_{index}(row[{index}])' if f'decode_{index}' in namespace else f'row[{index}]'
+
+        def literal(node):
+            return '{' + ', '.join(
+                f'{key!r}: ' + (literal(child) if isinstance(child, dict) else value(child))
+                for key, child in node.items()) + '}'
+
+        exec(compile(f'def serialize(row):\n    return {literal(tree)}\n', '<projection>', 'exec'), namespace)
+        return namespace['serialize']
+
+    def columns_for(self, entities):
+        # The projected columns with mapped classes swapped per `entities`,
+        # e.g. {Trip: TripArchive} to run the same projection on an alias
+        return [getattr(entities.get(column.class_, column.class_), column.key) for column in self.columns]
+
+    def many(self, rows):
+        serialize = self.serialize
+        return [serialize(row) for row in rows]
+
+
+class Schema:
+    def __init__(self, *fields):
+        self.fields = fields
+        self._projections = {}
+
+    def select(self, names=None):
+        # Projection for the requested field names; "vehicle" selects every
+        # vehicle.* field. Unknown names raise ValueError.
+        key = tuple(names) if names else None
+        projection = self._projections.get(key)
+        if projection is None:
+            if names is None:
+                fields = list(self.fields)
+            else:
+                wanted = set(names)
+                fields = [field for field in self.fields
+                          if field.name in wanted or field.name.split('.', 1)[0] in wanted]
+                known = {field.name for field in self.fields} | {field.name.split('.', 1)[0] for field in self.fields}
+                unknown = sorted(wanted - known)
+                if unknown:
+                    raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+            projection = Projection(fields)
+            # Bounded, since the key comes straight from the query string
+            if len(self._projections) < 256:
+                self._projections[key] = projection
+        return projection
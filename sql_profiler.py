@@ -0,0 +1,133 @@
+# sql_profiler.py - Opt-in per-request query counting and slow-query log
+import heapq
+import itertools
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class SQLProfiler:
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.endpoints = defaultdict(lambda: {'requests': 0, 'queries': 0, 'db_ms': 0.0, 'total_ms': 0.0})
+        # Min-heap of (duration_ms, seq, entry): the slowest queries seen,
+        # where a new one only displaces the fastest kept
+        self.slow_queries = []
+        self.slow_query_log_size = 50
+        self._seq = itertools.count()
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_PROFILING', False)
+        app.config.setdefault('SLOW_REQUEST_MS', 500)
+        app.config.setdefault('SLOW_QUERY_MS', 100)
+        app.config.setdefault('SLOW_QUERY_LOG_SIZE', 50)
+        if not app.config['SQL_PROFILING']:
+            return
+
+        self.enabled = True
+        self.app = app
+        self.slow_request_ms = app.config['SLOW_REQUEST_MS']
+        self.slow_query_ms = app.config['SLOW_QUERY_MS']
+        self.slow_query_log_size = app.config['SLOW_QUERY_LOG_SIZE']
+
+        # Listening on the Engine class covers engines created lazily later
+        if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['query_start'].pop()) * 1000
+        if conn.info.get('explaining'):
+            return
+        if has_request_context() and 'sql_queries' in g:
+            g.sql_queries += 1
+            g.sql_ms += elapsed_ms
+        if elapsed_ms >= self.slow_query_ms and self._would_keep(elapsed_ms):
+            self._record_slow_query(conn, statement, parameters, context, executemany, elapsed_ms)
+
+    def _would_keep(self, elapsed_ms):
+        # Checked before paying for an EXPLAIN
+        with self._lock:
+            return (len(self.slow_queries) < self.slow_query_log_size or
+                    elapsed_ms > self.slow_queries[0][0])
+
+    def _record_slow_query(self, conn, statement, parameters, context, executemany, elapsed_ms):
+        explain = None
+        if context is not None and context.execution_options.get('stream_results'):
+            # A server-side cursor (yield_per) is still being read; running
+            # EXPLAIN on its connection would make the driver (e.g. PyMySQL)
+            # discard the rest of the stream
+            explain = 'skipped: streamed result'
+        elif not executemany and statement.lstrip()[:6].upper() == 'SELECT':
+            prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+            conn.info['explaining'] = True
+            try:
+                explain = [list(row) for row in conn.exec_driver_sql(prefix + statement, parameters)]
+            except Exception as e:
+                explain = f'unavailable: {e}'
+            finally:
+                conn.info['explaining'] = False
+        entry = {
+            'statement': statement,
+            'duration_ms': round(elapsed_ms, 2),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'explain': explain,
+            'at': time.time()
+        }
+        item = (entry['duration_ms'], next(self._seq), entry)
+        with self._lock:
+            if len(self.slow_queries) < self.slow_query_log_size:
+                heapq.heappush(self.slow_queries, item)
+            elif item > self.slow_queries[0]:
+                heapq.heapreplace(self.slow_queries, item)
+
+    def _start_request(self):
+        g.sql_queries = 0
+        g.sql_ms = 0.0
+        g.request_start = time.perf_counter()
+
+    def _finish_request(self, response):
+        if 'request_start' not in g:
+            return response
+        total_ms = (time.perf_counter() - g.request_start) * 1000
+        endpoint = request.endpoint or request.path
+
+        response.headers.add('Server-Timing', f'db;dur={g.sql_ms:.1f};desc="{g.sql_queries} queries"')
+        response.headers.add('Server-Timing', f'app;dur={total_ms:.1f}')
+
+        with self._lock:
+            stats = self.endpoints[endpoint]
+            stats['requests'] += 1
+            stats['queries'] += g.sql_queries
+            stats['db_ms'] += g.sql_ms
+            stats['total_ms'] += total_ms
+
+        if total_ms >= self.slow_request_ms:
+            self.app.logger.warning('Slow request %s %s: %.1f ms total, %d queries, %.1f ms in DB',
+                                    request.method, request.path, total_ms, g.sql_queries, g.sql_ms)
+        return response
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {
+                name: {
+                    'requests': stats['requests'],
+                    'queries_per_request': stats['queries'] / stats['requests'],
+                    'db_ms_per_request': stats['db_ms'] / stats['requests'],
+                    'total_ms_per_request': stats['total_ms'] / stats['requests']
+                } for name, stats in self.endpoints.items()
+            }
+            slowest = [entry for _, _, entry in sorted(self.slow_queries, reverse=True)]
+        return {'enabled': self.enabled, 'endpoints': endpoints, 'slow_queries': slowest}
@@ -0,0 +1,96 @@
+# static_assets.py - In-memory, precompressed static files with content-hashed ETags
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip alone covers every browser
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {'.html', '.css', '.js', '.mjs', '.svg', '.json', '.txt', '.xml'}
+MIN_COMPRESS_SIZE = 512
+SKIP_DIRS = {'__pycache__', 'node_modules', 'benchmarks'}
+
+
+class Asset:
+    def __init__(self, path, extension):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.digest = hashlib.sha256(body).hexdigest()[:20]
+        # encoding -> body; only kept when compression actually saves bytes
+        self.variants = {'identity': body}
+        if extension in COMPRESSIBLE_EXTENSIONS and len(body) >= MIN_COMPRESS_SIZE:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants['br'] = compressed
+
+    def negotiate(self, accept_encodings):
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accept_encodings[encoding]:
+                return encoding
+        return 'identity'
+
+
+class AssetStore:
+    def __init__(self, root, max_age=300, reload=False):
+        self.root = os.path.abspath(root)
+        self.max_age = max_age
+        # reload: stat files per request and rebuild changed ones (development)
+        self.reload = reload
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def load(self, extensions=COMPRESSIBLE_EXTENSIONS):
+        for directory, dirs, files in os.walk(self.root):
+            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in SKIP_DIRS]
+            for name in files:
+                extension = os.path.splitext(name)[1].lower()
+                if extension in extensions:
+                    path = os.path.join(directory, name)
+                    key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                    self._assets[key] = Asset(path, extension)
+        return self
+
+    def get(self, filename):
+        asset = self._assets.get(filename)
+        if asset is not None and self.reload:
+            try:
+                mtime = os.path.getmtime(asset.path)
+            except OSError:
+                with self._lock:
+                    self._assets.pop(filename, None)
+                return None
+            if mtime != asset.mtime:
+                asset = Asset(asset.path, os.path.splitext(asset.path)[1].lower())
+                with self._lock:
+                    self._assets[filename] = asset
+        return asset
+
+    def response(self, filename):
+        # None when the file isn't preloaded, so the caller can fall back
+        asset = self.get(filename)
+        if asset is None:
+            return None
+        encoding = asset.negotiate(request.accept_encodings)
+        response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        if len(asset.variants) > 1:
+            response.headers['Vary'] = 'Accept-Encoding'
+        # Strong ETags must differ per representation
+        response.set_etag(asset.digest if encoding == 'identity' else f'{asset.digest}-{encoding}')
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        return response.make_conditional(request)
@@ -0,0 +1,134 @@
+# stream_server.py - Serves the /stream/* Server-Sent Events endpoints from a
+# single asyncio loop, so an idle client costs a socket and a queue instead
+# of a server thread. Run alongside gunicorn: python stream_server.py
+import asyncio
+import os
+from functools import partial
+from urllib.parse import parse_qs, urlsplit
+
+from werkzeug.exceptions import HTTPException
+
+from flask_backend_sql import CORS_ORIGINS, broker, create_app
+from pubsub import Subscription, sse_message
+
+CHANNELS = {
+    'api.stream_messages': lambda: 'messages',
+    'api.stream_post': lambda post_id: f'post:{post_id}'
+}
+HEADER_TIMEOUT = 10
+MAX_HEADER_LINES = 100
+
+
+class AsyncSubscription(Subscription):
+    # Events arrive on the broker's poller thread and are handed to the loop
+    def __init__(self, broker, channel, max_queue, loop):
+        super().__init__(broker, channel, max_queue)
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.loop = loop
+
+    def deliver(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            self.closed = True  # the loop has shut down
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.closed = True
+
+    async def events(self, heartbeat=15.0):
+        while not self.closed:
+            try:
+                yield await asyncio.wait_for(self.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+
+async def read_request(reader):
+    request_line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+        if line in (b'\r\n', b'\n', b''):
+            return method, target, headers
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    raise ValueError('Too many headers')
+
+
+def response_head(status, headers):
+    lines = [f'HTTP/1.1 {status}'] + [f'{name}: {value}' for name, value in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+def cors_headers(request_headers):
+    origin = request_headers.get('origin')
+    if origin not in CORS_ORIGINS:
+        return {}
+    return {'Access-Control-Allow-Origin': origin, 'Access-Control-Allow-Credentials': 'true', 'Vary': 'Origin'}
+
+
+def parse_last_event_id(headers, query):
+    value = headers.get('last-event-id') or parse_qs(query).get('last_event_id', [None])[0]
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+async def handle(adapter, heartbeat, reader, writer):
+    loop = asyncio.get_running_loop()
+    subscription = None
+    try:
+        method, target, headers = await read_request(reader)
+        url = urlsplit(target)
+        try:
+            endpoint, args = adapter.match(url.path, method=method)
+        except HTTPException as error:
+            writer.write(response_head(f'{error.code} {error.name}', {'Content-Length': '0', 'Connection': 'close'}))
+            return
+        if endpoint not in CHANNELS:
+            writer.write(response_head('404 Not Found', {'Content-Length': '0', 'Connection': 'close'}))
+            return
+        # The broker reads the replay from the database; keep that off the loop
+        subscription = await loop.run_in_executor(
+            None, partial(broker.subscribe, CHANNELS[endpoint](**args), parse_last_event_id(headers, url.query),
+                          partial(AsyncSubscription, loop=loop)))
+        writer.write(response_head('200 OK', {
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            'Connection': 'close',
+            **cors_headers(headers)
+        }) + b'retry: 3000\n\n')
+        await writer.drain()
+        async for event in subscription.events(heartbeat=heartbeat):
+            writer.write(b': heartbeat\n\n' if event is None else sse_message(event).encode())
+            await writer.drain()
+    except (ConnectionError, asyncio.TimeoutError, ValueError):
+        pass
+    finally:
+        if subscription is not None:
+            await loop.run_in_executor(None, subscription.close)
+        writer.close()
+
+
+async def serve(app, host, port):
+    adapter = app.url_map.bind('')
+    server = await asyncio.start_server(partial(handle, adapter, app.config['SSE_HEARTBEAT']), host, port,
+                                        backlog=1024)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    app = create_app()
+    host, _, port = os.environ.get('STREAM_BIND', '0.0.0.0:5001').rpartition(':')
+    asyncio.run(serve(app, host or '0.0.0.0', int(port)))
+
+
+if __name__ == '__main__':
+    main()
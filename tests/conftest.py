@@ -0,0 +1,35 @@
+# conftest.py - App and client fixtures backed by a fresh SQLite file per test
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flask_backend_sql as backend
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = backend.create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'),
+        'RESPONSE_CACHE_TTL': 0,
+        'PASSWORD_HASH_WORKERS': 0,
+        'ADMISSION_CONTROL': False,
+        'LOG_LEVEL': 'WARNING'
+    })
+    # Process-wide caches would otherwise carry rows over from earlier tests
+    backend.user_profiles.clear()
+    backend.vehicle_catalog.clear()
+    with app.app_context():
+        backend.migrate_schema()
+    yield app
+    with app.app_context():
+        backend.db.session.remove()
+        backend.db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
@@ -0,0 +1,130 @@
+# test_archival.py - Rotation moves whole months behind the watermark and reads merge both tiers
+import json
+from datetime import datetime, timedelta
+
+import flask_backend_sql as backend
+from archival import month_start
+
+TRIPS = 24
+HOT_MONTHS = 3
+
+
+def seed(app, client):
+    # Trips ten days apart going back eight months, ids ascending with age
+    # descending, each with an emission record; plus unlinked records
+    assert client.post('/register', json={
+        'username': 'alice', 'email': 'alice@example.com', 'password': 'secret123'}).status_code == 201
+    vehicle_id = client.post('/api/vehicles', json={
+        'company': 'Toyota', 'model': 'Prius', 'year': 2020, 'price': 1, 'mileage': 20,
+        'fuel_type': 'Petrol', 'transmission': 'Automatic', 'type': 'car'}).get_json()['id']
+    rows = [{'start_location': 'A', 'end_location': 'B', 'distance': 10 + i, 'vehicle_id': vehicle_id,
+             'start_time': '2026-01-01T10:00:00', 'end_time': '2026-01-01T11:00:00',
+             'emissions': {'co2_emissions': float(i), 'fuel_consumed': 1}} for i in range(TRIPS)]
+    assert client.post('/trips/bulk', json=rows).get_json()['inserted'] == TRIPS
+    assert client.post('/emissions/bulk', json=[
+        {'vehicle_id': vehicle_id, 'co2_emissions': 1, 'distance': 1, 'fuel_consumed': 1,
+         'record_date': '2026-01-01'} for _ in range(TRIPS)]).get_json()['inserted'] == TRIPS
+
+    now = datetime.utcnow().replace(microsecond=0)
+    trips, emissions = backend.Trip.__table__, backend.EmissionRecord.__table__
+    with app.app_context(), backend.db.engine.begin() as conn:
+        trip_ids = conn.execute(backend.db.select(trips.c.id).order_by(trips.c.id)).scalars().all()
+        for age, trip_id in enumerate(reversed(trip_ids)):
+            created_at = now - timedelta(days=10 * age, minutes=1)
+            conn.execute(trips.update().where(trips.c.id == trip_id).values(
+                created_at=created_at, start_time=created_at, end_time=created_at + timedelta(hours=1)))
+            conn.execute(emissions.update().where(emissions.c.trip_id == trip_id).values(
+                record_date=created_at.date()))
+        unlinked = conn.execute(backend.db.select(emissions.c.id).where(emissions.c.trip_id.is_(None))
+                                .order_by(emissions.c.id)).scalars().all()
+        for age, emission_id in enumerate(reversed(unlinked)):
+            conn.execute(emissions.update().where(emissions.c.id == emission_id).values(
+                record_date=(now - timedelta(days=10 * age + 5)).date()))
+
+
+def ids_of(entity, app):
+    with app.app_context():
+        return {row.id for row in backend.db.session.query(entity.id)}
+
+
+def rotate(app, hot_months=HOT_MONTHS):
+    with app.app_context():
+        return backend.rotate_archives(hot_months)
+
+
+def test_rotation_moves_old_rows_and_advances_watermark(app, client):
+    seed(app, client)
+    all_trips, all_emissions = ids_of(backend.Trip, app), ids_of(backend.EmissionRecord, app)
+    cutoff, moved_emissions, moved_trips = rotate(app)
+    assert cutoff == month_start(datetime.utcnow(), HOT_MONTHS)
+
+    hot_trips, archived_trips = ids_of(backend.Trip, app), ids_of(backend.TripArchive, app)
+    hot_emissions, archived_emissions = ids_of(backend.EmissionRecord, app), ids_of(backend.EmissionRecordArchive, app)
+    assert moved_trips == len(archived_trips) > 0 and moved_emissions == len(archived_emissions) > 0
+    assert hot_trips | archived_trips == all_trips and not hot_trips & archived_trips
+    assert hot_emissions | archived_emissions == all_emissions and not hot_emissions & archived_emissions
+
+    with app.app_context():
+        session = backend.db.session
+        assert all(row.created_at < cutoff for row in session.query(backend.TripArchive.created_at))
+        assert all(row.created_at >= cutoff for row in session.query(backend.Trip.created_at))
+        # An emission record is in the same tier as its trip
+        assert {row.trip_id for row in session.query(backend.EmissionRecordArchive.trip_id)} - {None} <= archived_trips
+        assert {row.trip_id for row in session.query(backend.EmissionRecord.trip_id)} - {None} <= hot_trips
+        assert {backend.archive_watermark(table) for table in
+                (backend.Trip.__table__, backend.EmissionRecord.__table__)} == {cutoff}
+
+    # Keeping more months hot later never moves the watermark back
+    assert rotate(app, HOT_MONTHS + 2)[1:] == (0, 0)
+    with app.app_context():
+        assert backend.archive_watermark(backend.Trip.__table__) == cutoff
+
+
+def test_trips_merge_newest_first_across_the_watermark(app, client):
+    seed(app, client)
+    before = client.get('/trips').get_json()
+    rotate(app)
+    after = client.get('/trips').get_json()
+    assert after == before
+    assert len({trip['id'] for trip in after}) == TRIPS
+    assert [trip['start_time'] for trip in after] == sorted((trip['start_time'] for trip in after), reverse=True)
+    # A page that ends just past the boundary, and one that ends before it
+    hot = len(ids_of(backend.Trip, app))
+    for limit in (hot - 1, hot + 2):
+        assert client.get(f'/trips?limit={limit}').get_json() == before[:limit]
+
+
+def test_emissions_merge_newest_first_across_the_watermark(app, client):
+    seed(app, client)
+    before = client.get('/emissions').get_json()
+    rotate(app)
+    after = client.get('/emissions').get_json()
+    assert sorted(after, key=lambda row: row['id']) == sorted(before, key=lambda row: row['id'])
+    assert len({row['id'] for row in after}) == 2 * TRIPS
+    assert [row['record_date'] for row in after] == sorted((row['record_date'] for row in after), reverse=True)
+    hot = len(ids_of(backend.EmissionRecord, app))
+    for limit in (hot - 1, hot + 2):
+        page = client.get(f'/emissions?limit={limit}').get_json()
+        assert [row['record_date'] for row in page] == [row['record_date'] for row in after[:limit]]
+        assert len({row['id'] for row in page}) == limit
+    # A range starting after the watermark only sees hot rows
+    with app.app_context():
+        watermark = backend.archive_watermark(backend.EmissionRecord.__table__).date()
+    recent = client.get(f'/emissions?from={watermark.isoformat()}').get_json()
+    assert {row['id'] for row in recent} <= ids_of(backend.EmissionRecord, app)
+    assert recent == [row for row in after if row['record_date'] >= watermark.isoformat()]
+
+
+def test_exports_stream_archive_then_hot_rows_once(app, client):
+    seed(app, client)
+    rotate(app)
+    for name, hot, archive, count in (('trips', backend.Trip, backend.TripArchive, TRIPS),
+                                      ('emissions', backend.EmissionRecord, backend.EmissionRecordArchive,
+                                       2 * TRIPS)):
+        response = client.get(f'/api/export/{name}')
+        assert response.status_code == 200
+        ids = [json.loads(line)['id'] for line in response.get_data(as_text=True).splitlines()]
+        assert ids == sorted(ids_of(archive, app)) + sorted(ids_of(hot, app))
+        assert len(set(ids)) == count
+        csv_lines = client.get(f'/api/export/{name}?format=csv').get_data(as_text=True).splitlines()
+        assert [int(line.split(',')[0]) for line in csv_lines[1:]] == ids
@@ -0,0 +1,41 @@
+# test_auth_tokens.py - Signed tokens stop working as soon as they are revoked in any process
+import flask_backend_sql as backend
+
+
+def login_token(app, client):
+    app.config['AUTH_MODE'] = 'token'
+    assert client.post('/register', json={
+        'username': 'alice', 'email': 'alice@example.com', 'password': 'secret123'}).status_code == 201
+    response = client.post('/login', json={'username': 'alice', 'password': 'secret123'})
+    return {'Authorization': 'Bearer ' + response.get_json()['token']}
+
+
+def update_user_elsewhere(app, **values):
+    # A plain UPDATE, as another worker's write looks to this process: the
+    # ORM listeners that clear the local profile cache do not run
+    table = backend.User.__table__
+    with app.app_context(), backend.db.engine.begin() as conn:
+        conn.execute(table.update().where(table.c.username == 'alice').values(**values))
+
+
+def test_logout_revokes_the_token(app, client):
+    headers = login_token(app, client)
+    assert client.get('/check_login', headers=headers).status_code == 200
+    assert client.post('/logout', headers=headers).status_code == 200
+    assert client.get('/check_login', headers=headers).status_code == 401
+
+
+def test_revocation_in_another_process_applies_at_once(app, client):
+    headers = login_token(app, client)
+    assert client.get('/check_login', headers=headers).status_code == 200
+    update_user_elsewhere(app, token_version=backend.User.__table__.c.token_version + 1)
+    assert client.get('/check_login', headers=headers).status_code == 401
+
+
+def test_role_change_in_another_process_applies_at_once(app, client):
+    headers = login_token(app, client)
+    update_user_elsewhere(app, role='admin')
+    assert client.get('/api/metrics', headers=headers).status_code == 200
+    update_user_elsewhere(app, role='customer')
+    assert client.get('/check_login', headers=headers).get_json()['user']['role'] == 'customer'
+    assert client.get('/api/metrics', headers=headers).status_code == 403
@@ -0,0 +1,70 @@
+# test_bulk_ingest.py - Bulk trip and emission uploads insert the good rows and report the rest
+import json
+
+import flask_backend_sql as backend
+
+
+def register(client, username):
+    assert client.post('/register', json={
+        'username': username, 'email': f'{username}@example.com', 'password': 'secret123'}).status_code == 201
+    return client.post('/api/vehicles', json={
+        'company': 'Toyota', 'model': 'Prius', 'year': 2020, 'price': 1, 'mileage': 20,
+        'fuel_type': 'Petrol', 'transmission': 'Automatic', 'type': 'car'}).get_json()['id']
+
+
+def trip_row(vehicle_id, **values):
+    return {'start_location': 'A', 'end_location': 'B', 'distance': 10, 'vehicle_id': vehicle_id,
+            'start_time': '2026-01-01T10:00:00', 'end_time': '2026-01-01T11:00:00', **values}
+
+
+def emission_row(vehicle_id, **values):
+    return {'vehicle_id': vehicle_id, 'co2_emissions': 2.5, 'distance': 10, 'fuel_consumed': 1,
+            'record_date': '2026-01-01', **values}
+
+
+def test_partial_failure_reports_each_bad_row(app, client):
+    vehicle_id = register(client, 'alice')
+    rows = [trip_row(vehicle_id), trip_row(vehicle_id, distance='far'), trip_row(vehicle_id + 100),
+            {'start_location': 'A'}, trip_row(vehicle_id)]
+    body = client.post('/trips/bulk', json=rows).get_json()
+    assert (body['received'], body['inserted'], body['failed']) == (5, 2, 3)
+    assert [error['row'] for error in body['errors']] == [1, 2, 3]
+    with app.app_context():
+        assert backend.Trip.query.count() == 2
+
+
+def test_emissions_only_link_to_the_callers_trips(app, client):
+    other = app.test_client()
+    other_vehicle = register(other, 'bob')
+    assert other.post('/trips/bulk', json=[trip_row(other_vehicle)]).status_code == 201
+    vehicle_id = register(client, 'alice')
+    assert client.post('/trips/bulk', json=[trip_row(vehicle_id)]).status_code == 201
+    with app.app_context():
+        own_trip, others_trip = [trip.id for trip in backend.Trip.query.order_by(backend.Trip.user_id.desc())]
+
+    body = client.post('/emissions/bulk', json=[
+        emission_row(vehicle_id, trip_id=own_trip), emission_row(vehicle_id, trip_id=others_trip),
+        emission_row(vehicle_id, trip_id=999), emission_row(vehicle_id)]).get_json()
+    assert (body['inserted'], [error['row'] for error in body['errors']]) == (2, [1, 2])
+    response = client.post('/emissions', json=emission_row(vehicle_id, trip_id=others_trip))
+    assert response.status_code == 400
+
+
+def test_empty_batch_is_a_no_op(client):
+    register(client, 'alice')
+    for path in ('/trips/bulk', '/emissions/bulk'):
+        response = client.post(path, json=[])
+        assert response.status_code == 200 and response.get_json()['inserted'] == 0
+
+
+def test_ndjson_is_capped_by_rows_and_bytes(app, client):
+    vehicle_id = register(client, 'alice')
+    line = json.dumps(emission_row(vehicle_id)) + '\n'
+    response = client.post('/emissions/bulk', data=line * 3, content_type='application/x-ndjson')
+    assert response.get_json()['inserted'] == 3
+    response = client.post('/emissions/bulk', data=line * (backend.BULK_MAX_ROWS + 1),
+                           content_type='application/x-ndjson')
+    assert response.status_code == 400 and 'Too many rows' in response.get_json()['error']
+    app.config['MAX_CONTENT_LENGTH'] = len(line) * 2
+    response = client.post('/emissions/bulk', data=line * 3, content_type='application/x-ndjson')
+    assert response.status_code == 413
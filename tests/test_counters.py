@@ -0,0 +1,57 @@
+# test_counters.py - View and like counts stay exact under concurrent requests
+from concurrent.futures import ThreadPoolExecutor
+
+import flask_backend_sql as backend
+
+THREADS = 8
+VIEWS_PER_THREAD = 200
+LIKES_PER_THREAD = 50
+
+
+def seed_post(client):
+    response = client.post('/register', json={
+        'username': 'alice', 'email': 'alice@example.com', 'password': 'secret123'})
+    assert response.status_code == 201
+    response = client.post('/posts', json={'title': 'Counters', 'content': 'Body', 'post_type': 'tip'})
+    assert response.status_code == 201
+    post_id = response.get_json()['id']
+    response = client.post(f'/posts/{post_id}/comments', json={'content': 'Comment'})
+    assert response.status_code == 201
+    return post_id, response.get_json()['id']
+
+
+def run_threads(app, work):
+    # One client per thread, each logged in as the seeded user
+    def worker(_):
+        client = app.test_client()
+        assert client.post('/login', json={'username': 'alice', 'password': 'secret123'}).status_code == 200
+        return work(client)
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        return list(pool.map(worker, range(THREADS)))
+
+
+def test_concurrent_views_are_all_counted(app, client):
+    post_id, _ = seed_post(client)
+
+    def view(client):
+        return sum(client.get(f'/posts/{post_id}').status_code == 200 for _ in range(VIEWS_PER_THREAD))
+
+    assert sum(run_threads(app, view)) == THREADS * VIEWS_PER_THREAD
+    backend.flush_counters(app)
+    with app.app_context():
+        assert backend.db.session.get(backend.CommunityPost, post_id).views == THREADS * VIEWS_PER_THREAD
+
+
+def test_concurrent_likes_are_all_counted(app, client):
+    post_id, comment_id = seed_post(client)
+
+    def like(client):
+        return sum(client.post(f'/posts/{post_id}/like').status_code == 200 and
+                   client.post(f'/comments/{comment_id}/like').status_code == 200
+                   for _ in range(LIKES_PER_THREAD))
+
+    assert sum(run_threads(app, like)) == THREADS * LIKES_PER_THREAD
+    with app.app_context():
+        assert backend.db.session.get(backend.CommunityPost, post_id).likes == THREADS * LIKES_PER_THREAD
+        assert backend.db.session.get(backend.PostComment, comment_id).likes == THREADS * LIKES_PER_THREAD
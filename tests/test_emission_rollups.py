@@ -0,0 +1,83 @@
+# test_emission_rollups.py - The emissions summary matches aggregating emission_record directly
+import random
+from collections import defaultdict
+from datetime import date, timedelta
+
+import pytest
+
+import flask_backend_sql as backend
+
+
+def add_vehicle(client, model):
+    return client.post('/api/vehicles', json={
+        'company': 'Toyota', 'model': model, 'year': 2020, 'price': 1, 'mileage': 20,
+        'fuel_type': 'Petrol', 'transmission': 'Automatic', 'type': 'car'}).get_json()['id']
+
+
+def seed_emissions(client, username, count=120):
+    assert client.post('/register', json={
+        'username': username, 'email': f'{username}@example.com', 'password': 'secret123'}).status_code == 201
+    vehicles = [add_vehicle(client, 'Prius'), add_vehicle(client, 'Corolla')]
+    rng = random.Random(username)
+    rows = [{'vehicle_id': rng.choice(vehicles), 'co2_emissions': round(rng.uniform(0.5, 9), 3),
+             'distance': round(rng.uniform(1, 80), 2), 'fuel_consumed': round(rng.uniform(0.1, 6), 3),
+             'record_date': (date(2025, 11, 20) + timedelta(days=rng.randrange(100))).isoformat()}
+            for _ in range(count)]
+    # Both write paths feed the rollups
+    assert client.post('/emissions/bulk', json=rows[1:]).get_json()['inserted'] == count - 1
+    assert client.post('/emissions', json={**rows[0], 'trip_id': None}).status_code == 201
+    return vehicles
+
+
+def expected_periods(app, username, granularity, vehicle_id=None):
+    with app.app_context():
+        query = backend.db.session.query(
+            backend.EmissionRecord.record_date, backend.EmissionRecord.co2_emissions,
+            backend.EmissionRecord.distance, backend.EmissionRecord.fuel_consumed
+        ).join(backend.User, backend.User.id == backend.EmissionRecord.user_id) \
+            .filter(backend.User.username == username)
+        if vehicle_id is not None:
+            query = query.filter(backend.EmissionRecord.vehicle_id == vehicle_id)
+        totals = defaultdict(lambda: [0.0, 0.0, 0.0, 0])
+        for record_date, co2, distance, fuel in query:
+            total = totals[backend.rollup_period(record_date, granularity)]
+            total[0] += co2
+            total[1] += distance
+            total[2] += fuel
+            total[3] += 1
+    return [(period.isoformat(), round(co2, 6), round(distance, 6), round(fuel, 6), count)
+            for period, (co2, distance, fuel, count) in sorted(totals.items())]
+
+
+def summary_periods(client, **params):
+    response = client.get('/api/emissions/summary', query_string=params)
+    assert response.status_code == 200
+    return [(row['period'], round(row['co2_emissions'], 6), round(row['distance'], 6),
+             round(row['fuel_consumed'], 6), row['records']) for row in response.get_json()['periods']]
+
+
+@pytest.mark.parametrize('granularity', backend.ROLLUP_GRANULARITIES)
+def test_summary_matches_emission_records(app, client, granularity):
+    seed_emissions(app.test_client(), 'bob', count=40)
+    vehicles = seed_emissions(client, 'alice')
+    expected = expected_periods(app, 'alice', granularity)
+    assert summary_periods(client, granularity=granularity) == expected
+    assert summary_periods(client, granularity=granularity, vehicle_id=vehicles[1]) == \
+        expected_periods(app, 'alice', granularity, vehicles[1])
+    # from is widened to the start of its period, to is inclusive
+    assert summary_periods(client, granularity=granularity, **{'from': '2025-12-15', 'to': '2026-01-31'}) == [
+        period for period in expected if backend.rollup_period(date(2025, 12, 15), granularity).isoformat()
+        <= period[0] <= '2026-01-31']
+
+
+def test_migrate_backfills_rollups(app, client):
+    seed_emissions(client, 'alice')
+    expected = {granularity: summary_periods(client, granularity=granularity)
+                for granularity in backend.ROLLUP_GRANULARITIES}
+    with app.app_context():
+        backend.EmissionRollup.__table__.drop(backend.db.engine)
+        statements = backend.migrate_schema()
+    assert '-- backfill emission_rollup' in statements
+    for granularity in backend.ROLLUP_GRANULARITIES:
+        assert summary_periods(client, granularity=granularity) == expected[granularity]
+        assert expected[granularity] == expected_periods(app, 'alice', granularity)
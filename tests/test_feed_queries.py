@@ -0,0 +1,75 @@
+# test_feed_queries.py - The community feed costs the same number of queries at any size
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import flask_backend_sql as backend
+
+
+def seed_posts(count, comments_per_post=3):
+    db = backend.db
+    authors = [backend.User(username=f'author{i}', email=f'author{i}@example.com', password_hash='x')
+               for i in range(count)]
+    db.session.add_all(authors)
+    db.session.flush()
+    posts = [backend.CommunityPost(user_id=author.id, title=f'Post {i}', content='Body', post_type='tip')
+             for i, author in enumerate(authors)]
+    db.session.add_all(posts)
+    db.session.flush()
+    db.session.add_all(backend.PostComment(post_id=post.id, user_id=post.user_id, content='Comment')
+                       for post in posts for _ in range(comments_per_post))
+    db.session.commit()
+
+
+def get_counting_queries(client, path):
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', count)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return response, len(statements)
+
+
+@pytest.mark.parametrize('count', [1, 10, 40])
+def test_feed_query_count_is_constant(app, client, count):
+    with app.app_context():
+        seed_posts(count)
+    response, queries = get_counting_queries(client, '/posts')
+    posts = response.get_json()
+    assert len(posts) == count
+    assert all(post['comments_count'] == 3 and post['author']['username'] for post in posts)
+    # The page with its authors joined, then one grouped comment count
+    assert queries == 2
+
+
+def test_feed_next_page_query_count(app, client):
+    with app.app_context():
+        seed_posts(30)
+    first, _ = get_counting_queries(client, '/posts?limit=10')
+    response, queries = get_counting_queries(client, f"/posts?limit=10&cursor={first.headers['X-Next-Cursor']}")
+    ids = [post['id'] for post in first.get_json() + response.get_json()]
+    assert len(ids) == len(set(ids)) == 20
+    assert queries == 2
+
+
+def test_cached_feed_shows_current_like_counts(app, client):
+    backend.response_cache.ttl = 30
+    assert client.post('/register', json={
+        'username': 'alice', 'email': 'alice@example.com', 'password': 'secret123'}).status_code == 201
+    post_id = client.post('/posts', json={'title': 'Liked', 'content': 'Body', 'post_type': 'tip'}).get_json()['id']
+    first = client.get('/posts')
+    assert first.get_json()[0]['likes'] == 0
+    for _ in range(2):
+        assert client.post(f'/posts/{post_id}/like').status_code == 200
+    # Served from the cache with only the counters looked up
+    response, queries = get_counting_queries(client, '/posts')
+    assert queries == 1
+    assert response.get_json()[0]['likes'] == 2
+    assert response.headers['ETag'] != first.headers['ETag']
+    assert client.get('/posts', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
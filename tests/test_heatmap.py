@@ -0,0 +1,53 @@
+# test_heatmap.py - The heatmap cell aggregate matches binning every trip from scratch
+import random
+
+import numpy as np
+
+import flask_backend_sql as backend
+import geo
+
+
+def seed_trips(client, count=30):
+    assert client.post('/register', json={
+        'username': 'alice', 'email': 'alice@example.com', 'password': 'secret123'}).status_code == 201
+    vehicle_id = client.post('/api/vehicles', json={
+        'company': 'Toyota', 'model': 'Prius', 'year': 2020, 'price': 1, 'mileage': 20,
+        'fuel_type': 'Petrol', 'transmission': 'Automatic', 'type': 'car'}).get_json()['id']
+    rng = random.Random(7)
+    rows = []
+    for i in range(count):
+        lat, lng = 51.5 + rng.uniform(-0.03, 0.03), -0.1 + rng.uniform(-0.03, 0.03)
+        rows.append({'start_location': 'A', 'end_location': 'B', 'distance': 10, 'vehicle_id': vehicle_id,
+                     'start_time': '2026-01-01T10:00:00', 'end_time': '2026-01-01T11:00:00',
+                     'start_lat': lat, 'start_lng': lng, 'end_lat': lat + 0.01, 'end_lng': lng - 0.01,
+                     'emissions': {'co2_emissions': rng.uniform(1, 5), 'fuel_consumed': 1}})
+    assert client.post('/trips/bulk', json=rows).get_json()['inserted'] == count
+    return rows
+
+
+def expected_cells(rows, zoom, min_trips):
+    points = [(lat, lng, row['emissions']['co2_emissions'] / 2, index) for index, row in enumerate(rows)
+              for lat, lng in ((row['start_lat'], row['start_lng']), (row['end_lat'], row['end_lng']))]
+    lats, lngs, weights, trips = (np.array(column) for column in zip(*points))
+    cell_size = geo.grid_cell_size(zoom)
+    cell_rows, cell_cols, co2, counts = geo.bin_points(lats, lngs, weights, trips, cell_size)
+    keep = counts >= min_trips
+    return sorted(zip(*(np.round(values, 6).tolist() for values in
+                        (*geo.cell_centres(cell_rows[keep], cell_cols[keep], cell_size), co2[keep]))))
+
+
+def heatmap_cells(app, zoom):
+    backend.heatmap_cache.clear()
+    with app.app_context():
+        return sorted(zip(*(np.round(values, 6).tolist() for values in backend.heatmap_grid(zoom))))
+
+
+def test_cells_match_binning_all_trips(app, client):
+    rows = seed_trips(client)
+    min_trips = app.config['HEATMAP_MIN_TRIPS']
+    for zoom in (0, 10, 12, 14):
+        assert heatmap_cells(app, zoom) == expected_cells(rows, zoom, min_trips)
+    with app.app_context():
+        backend.rebuild_heatmap_cells()
+    assert heatmap_cells(app, 12) == expected_cells(rows, 12, min_trips)
+    assert client.get('/api/heatmap?zoom=12').status_code == 200
@@ -0,0 +1,87 @@
+# test_keyset_pagination.py - Cursor pages cover every row once, ties broken by id
+import pytest
+
+import flask_backend_sql as backend
+
+PRICES = [5000, 7000, 5000, 9000, 7000, 5000, 5000, 7000, 9000, 5000, 6000]
+
+
+def seed_cars(app, client):
+    assert client.post('/register', json={
+        'username': 'alice', 'email': 'alice@example.com', 'password': 'secret123'}).status_code == 201
+    for i, price in enumerate(PRICES):
+        assert client.post('/api/vehicles', json={
+            'company': 'Toyota', 'model': f'Model {i % 3}', 'year': 2010 + i % 4, 'price': price, 'mileage': 20,
+            'fuel_type': 'Petrol', 'transmission': 'Automatic', 'type': 'car'}).status_code == 201
+    # Several cars share a created_at, as rows from one bulk import would
+    with app.app_context():
+        cars = backend.UserCar.query.order_by(backend.UserCar.id).all()
+        for car in cars:
+            car.created_at = cars[car.id % 2].created_at
+        backend.db.session.commit()
+        return [(car.id, car.price, car.year, car.created_at.isoformat()) for car in cars]
+
+
+def all_pages(client, path, **params):
+    pages, cursor = [], None
+    while True:
+        query = dict(params, **({'cursor': cursor} if cursor else {}))
+        body = client.get(path, query_string=query).get_json()
+        pages.append([car['id'] for car in body['vehicles']])
+        cursor = body['next_cursor']
+        if not cursor:
+            return pages
+
+
+@pytest.mark.parametrize('sort, key, descending', [
+    ('price_asc', lambda car: car[1], False),
+    ('price_desc', lambda car: car[1], True),
+    ('year_desc', lambda car: car[2], True),
+    ('newest', lambda car: car[3], True),
+])
+def test_pages_follow_sort_then_id(app, client, sort, key, descending):
+    cars = seed_cars(app, client)
+    expected = [car[0] for car in sorted(cars, key=lambda car: (key(car), car[0]), reverse=descending)]
+    pages = all_pages(client, '/api/marketplace/search', sort=sort, limit=3)
+    assert [len(page) for page in pages] == [3, 3, 3, 2]
+    assert [car_id for page in pages for car_id in page] == expected
+
+
+def test_cursor_with_filters_and_header_variant(app, client):
+    cars = seed_cars(app, client)
+    expected = [car[0] for car in sorted(cars, key=lambda car: (car[1], car[0])) if 5000 <= car[1] <= 7000]
+    pages = all_pages(client, '/api/marketplace/search', sort='price_asc', min_price=5000, max_price=7000, limit=4)
+    assert [car_id for page in pages for car_id in page] == expected
+
+    first = client.get('/api/marketplace/vehicles?sort=price_asc&limit=4')
+    second = client.get(f"/api/marketplace/vehicles?sort=price_asc&limit=4&cursor={first.headers['X-Next-Cursor']}")
+    assert [car['id'] for car in first.get_json() + second.get_json()] == \
+        [car[0] for car in sorted(cars, key=lambda car: (car[1], car[0]))][:8]
+
+
+def test_invalid_or_mismatched_cursor_is_rejected(app, client):
+    seed_cars(app, client)
+    cursor = client.get('/api/marketplace/search?sort=price_asc&limit=2').get_json()['next_cursor']
+    assert client.get(f'/api/marketplace/search?sort=price_desc&cursor={cursor}').status_code == 400
+    assert client.get('/api/marketplace/search?cursor=not-a-cursor').status_code == 400
+    assert client.get('/api/marketplace/search?sort=cheapest').status_code == 400
+
+
+def test_feed_pages_break_created_at_ties_by_id(app, client):
+    assert client.post('/register', json={
+        'username': 'alice', 'email': 'alice@example.com', 'password': 'secret123'}).status_code == 201
+    ids = [client.post('/posts', json={'title': f'Post {i}', 'content': 'Body', 'post_type': 'tip'}).get_json()['id']
+           for i in range(7)]
+    with app.app_context():
+        posts = backend.CommunityPost.query.all()
+        for post in posts:
+            post.created_at = posts[0].created_at
+        backend.db.session.commit()
+    seen, cursor = [], None
+    while True:
+        response = client.get('/posts', query_string={'limit': 3, **({'cursor': cursor} if cursor else {})})
+        seen += [post['id'] for post in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    assert seen == sorted(ids, reverse=True)
@@ -0,0 +1,58 @@
+# test_leaderboard.py - The skip list ranks like a sorted list through inserts and removals
+import bisect
+import random
+
+import pytest
+
+from leaderboard import RankedSet, Ranking
+
+
+def assert_matches(ranked, expected):
+    assert len(ranked) == len(expected)
+    assert ranked.slice(0, len(expected)) == expected
+    for position, key in enumerate(expected):
+        assert ranked.rank(key) == position
+    for start, stop in ((0, 1), (3, 9), (max(0, len(expected) - 2), len(expected) + 5)):
+        assert ranked.slice(start, stop) == expected[start:stop]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_inserts_and_removals_match_sorted_list(seed):
+    rng = random.Random(seed)
+    ranked, expected = RankedSet(seed=seed), []
+    for step in range(2000):
+        if expected and rng.random() < 0.4:
+            key = expected.pop(rng.randrange(len(expected)))
+            ranked.remove(key)
+        else:
+            key = (rng.random(), step)
+            bisect.insort(expected, key)
+            ranked.insert(key)
+        if step % 250 == 0:
+            assert_matches(ranked, expected)
+    assert_matches(ranked, expected)
+
+
+def test_missing_keys_raise_key_error():
+    ranked = RankedSet(seed=1)
+    for key in (3, 1, 2):
+        ranked.insert(key)
+    with pytest.raises(KeyError):
+        ranked.rank(4)
+    with pytest.raises(KeyError):
+        ranked.remove(0)
+    ranked.remove(2)
+    assert ranked.slice(0, 5) == [1, 3]
+    assert ranked.slice(5, 10) == []
+
+
+def test_ranking_reorders_users_as_totals_change():
+    ranking = Ranking(min_distance=50)
+    ranking.add(1, 10.0, 100.0)   # 0.1 kg/km
+    ranking.add(2, 30.0, 100.0)   # 0.3 kg/km
+    ranking.add(3, 1.0, 20.0)     # under min_distance: unranked
+    assert [key[-1] for key in ranking.order.slice(0, 10)] == [1, 2]
+    ranking.add(2, 0.0, 200.0)    # now 0.1 kg/km over a longer distance
+    ranking.add(3, 0.0, 40.0)     # 0.0167 kg/km
+    assert [key[-1] for key in ranking.order.slice(0, 10)] == [3, 2, 1]
+    assert ranking.order.rank(ranking.keys[1]) == 2
@@ -0,0 +1,19 @@
+# test_metrics.py - /api/metrics is limited to admins and the monitoring token
+import flask_backend_sql as backend
+
+
+def test_metrics_require_admin_or_token(app, client):
+    assert client.get('/api/metrics').status_code == 403
+    assert client.post('/register', json={
+        'username': 'alice', 'email': 'alice@example.com', 'password': 'secret123'}).status_code == 201
+    assert client.get('/api/metrics').status_code == 403
+
+    app.config['METRICS_TOKEN'] = 'monitor'
+    assert app.test_client().get('/api/metrics', headers={'X-Metrics-Token': 'wrong'}).status_code == 403
+    response = app.test_client().get('/api/metrics', headers={'X-Metrics-Token': 'monitor'})
+    assert response.status_code == 200 and 'sql' in response.get_json()
+
+    with app.app_context():
+        backend.User.query.filter_by(username='alice').one().role = 'admin'
+        backend.db.session.commit()
+    assert client.get('/api/metrics').status_code == 200
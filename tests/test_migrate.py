@@ -0,0 +1,107 @@
+# test_migrate.py - `flask migrate` brings a pre-catalog database up to date in place
+from datetime import date, datetime
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import flask_backend_sql as backend
+
+LEGACY_SCHEMA = [
+    '''CREATE TABLE user (
+        id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, email VARCHAR(120) NOT NULL UNIQUE,
+        password_hash VARCHAR(256) NOT NULL, role VARCHAR(20) NOT NULL, created_at DATETIME)''',
+    '''CREATE TABLE user_car (
+        id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id), company VARCHAR(100) NOT NULL,
+        model VARCHAR(100) NOT NULL, year INTEGER NOT NULL, price FLOAT NOT NULL, mileage FLOAT NOT NULL,
+        fuel_type VARCHAR(50) NOT NULL, transmission VARCHAR(20) NOT NULL, image_url VARCHAR(500),
+        type VARCHAR(50), color VARCHAR(50), registration_number VARCHAR(100), purchase_date DATE,
+        created_at DATETIME)''',
+    '''CREATE TABLE trip (
+        id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id),
+        start_location VARCHAR(255) NOT NULL, end_location VARCHAR(255) NOT NULL, distance FLOAT NOT NULL,
+        start_time DATETIME NOT NULL, end_time DATETIME NOT NULL,
+        vehicle_id INTEGER NOT NULL REFERENCES user_car (id), created_at DATETIME)''',
+    '''CREATE TABLE emission_record (
+        id INTEGER PRIMARY KEY, trip_id INTEGER REFERENCES trip (id), user_id INTEGER NOT NULL REFERENCES user (id),
+        vehicle_id INTEGER NOT NULL REFERENCES user_car (id), co2_emissions FLOAT NOT NULL, distance FLOAT NOT NULL,
+        fuel_consumed FLOAT NOT NULL, record_date DATE NOT NULL, created_at DATETIME)''',
+    'CREATE INDEX ix_user_car_company ON user_car (company)'
+]
+
+# Free-text spellings that should intern to one catalog entry each
+LEGACY_CARS = [
+    ('Toyota', 'Prius', 'Petrol', 'Automatic'),
+    (' toyota', 'prius ', 'petrol', 'automatic'),
+    ('TOYOTA', 'Corolla', 'Diesel', 'Manual'),
+    ('Honda', 'Civic', 'Petrol', 'Manual'),
+]
+
+
+@pytest.fixture
+def legacy_app(tmp_path):
+    app = backend.create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'legacy.db'),
+        'RESPONSE_CACHE_TTL': 0,
+        'PASSWORD_HASH_WORKERS': 0,
+        'ADMISSION_CONTROL': False,
+        'LOG_LEVEL': 'WARNING'
+    })
+    backend.user_profiles.clear()
+    backend.vehicle_catalog.clear()
+    with app.app_context(), backend.db.engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(backend.db.text(statement))
+        conn.execute(backend.db.text(
+            "INSERT INTO user VALUES (1, 'alice', 'alice@example.com', :hash, 'customer', :now)"),
+            {'hash': generate_password_hash('secret123'), 'now': datetime(2025, 1, 1)})
+        for car_id, (company, model, fuel_type, transmission) in enumerate(LEGACY_CARS, 1):
+            conn.execute(backend.db.text(
+                'INSERT INTO user_car (id, user_id, company, model, year, price, mileage, fuel_type, transmission) '
+                'VALUES (:id, 1, :company, :model, 2020, 1, 20, :fuel_type, :transmission)'),
+                {'id': car_id, 'company': company, 'model': model, 'fuel_type': fuel_type,
+                 'transmission': transmission})
+        conn.execute(backend.db.text(
+            "INSERT INTO emission_record (id, user_id, vehicle_id, co2_emissions, distance, fuel_consumed, record_date) "
+            "VALUES (1, 1, 1, 2.5, 10, 1, '2025-03-04'), (2, 1, 3, 4.0, 20, 2, '2025-03-20')"))
+    yield app
+    with app.app_context():
+        backend.db.session.remove()
+        backend.db.engine.dispose()
+
+
+def user_car_columns(app):
+    with app.app_context():
+        return {column['name'] for column in backend.db.inspect(backend.db.engine).get_columns('user_car')}
+
+
+def test_dry_run_changes_nothing(legacy_app):
+    with legacy_app.app_context():
+        statements = backend.migrate_schema(dry_run=True)
+    assert 'ALTER TABLE user_car DROP COLUMN company' in statements
+    assert '-- backfill emission_rollup' in statements
+    assert {'company', 'model', 'fuel_type', 'transmission'} <= user_car_columns(legacy_app)
+    assert 'make_id' not in user_car_columns(legacy_app)
+
+
+def test_migrate_interns_legacy_cars_and_keeps_data(legacy_app):
+    with legacy_app.app_context():
+        assert backend.migrate_schema()
+        # Running it again finds nothing left to do
+        assert backend.migrate_schema() == []
+        assert backend.VehicleMake.query.count() == 2
+        assert backend.VehicleModel.query.count() == 3
+    columns = user_car_columns(legacy_app)
+    assert {'make_id', 'model_id', 'fuel_type_id', 'transmission_id'} <= columns
+    assert not {'company', 'model', 'fuel_type', 'transmission'} & columns
+
+    client = legacy_app.test_client()
+    assert client.post('/login', json={'username': 'alice', 'password': 'secret123'}).status_code == 200
+    cars = sorted(client.get('/api/vehicles').get_json(), key=lambda car: car['id'])
+    # Whichever spelling was interned first names the entry for all of them
+    assert [tuple(car[name].casefold() for name in ('company', 'model', 'fuel_type', 'transmission'))
+            for car in cars] == [tuple(value.strip().casefold() for value in car) for car in LEGACY_CARS]
+    assert cars[0]['company'] == cars[1]['company'] == cars[2]['company']
+    assert cars[0]['model'] == cars[1]['model']
+    summary = client.get('/api/emissions/summary?granularity=month').get_json()['periods']
+    assert summary == [{'period': date(2025, 3, 1).isoformat(), 'co2_emissions': 6.5, 'distance': 30.0,
+                        'fuel_consumed': 3.0, 'records': 2}]
@@ -0,0 +1,38 @@
+# test_pubsub.py - Stream events reach subscribers in other processes and replay by id
+import flask_backend_sql as backend
+from pubsub import Broker, TableEventLog
+
+
+def make_broker(app):
+    # Each broker stands in for one worker process sharing the database
+    broker = Broker(poll_interval=0.05)
+    broker.configure(TableEventLog(backend.StreamEvent.__table__, lambda: backend.db.get_engine(app)), 0.05)
+    return broker
+
+
+def next_event(subscription):
+    return next(event for event in subscription.events(heartbeat=5) if event is not None)
+
+
+def test_event_reaches_subscriber_of_another_broker(app):
+    publisher, streamer = make_broker(app), make_broker(app)
+    subscription = streamer.subscribe('messages')
+    first = publisher.publish('messages', 'message', {'id': 1})
+    publisher.publish('post:1', 'comment', {'id': 7})
+    second = publisher.publish('messages', 'message_deleted', {'id': 1})
+    events = [next_event(subscription), next_event(subscription)]
+    assert [(event.id, event.type, event.data) for event in events] == [
+        (first, 'message', {'id': 1}), (second, 'message_deleted', {'id': 1})]
+    subscription.close()
+
+
+def test_resume_replays_events_after_last_event_id(app, client):
+    assert client.post('/register', json={
+        'username': 'alice', 'email': 'alice@example.com', 'password': 'secret123'}).status_code == 201
+    ids = [client.post('/messages', json={'content': f'Message {i}'}).get_json()['id'] for i in range(3)]
+    streamer = make_broker(app)
+    with app.app_context():
+        last_event_id = backend.db.session.query(backend.db.func.min(backend.StreamEvent.id)).scalar()
+    subscription = streamer.subscribe('messages', last_event_id)
+    assert [next_event(subscription).data['id'] for _ in ids[1:]] == ids[1:]
+    subscription.close()
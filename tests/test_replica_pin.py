@@ -0,0 +1,53 @@
+# test_replica_pin.py - A client that just wrote reads its own write, cookies or not
+import shutil
+
+import pytest
+
+import flask_backend_sql as backend
+
+
+@pytest.fixture
+def replica_app(tmp_path):
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+    app = backend.create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary}',
+        'DATABASE_REPLICA_URLS': [f'sqlite:///{replica}'],
+        'REPLICA_PIN_SECONDS': 60,
+        'AUTH_MODE': 'token',
+        'RESPONSE_CACHE_TTL': 0,
+        'PASSWORD_HASH_WORKERS': 0,
+        'ADMISSION_CONTROL': False,
+        'LOG_LEVEL': 'WARNING'
+    })
+    backend.user_profiles.clear()
+    backend.vehicle_catalog.clear()
+    with app.app_context():
+        backend.migrate_schema()
+    yield app, primary, replica
+    with app.app_context():
+        backend.db.session.remove()
+        backend.db.engine.dispose()
+    for member in backend.replicas.replicas:
+        member.engine.dispose()
+
+
+def test_bearer_client_reads_own_write_from_primary(replica_app):
+    app, primary, replica = replica_app
+    client = app.test_client(use_cookies=False)
+    for username in ('alice', 'bob'):
+        assert client.post('/register', json={
+            'username': username, 'email': f'{username}@example.com', 'password': 'secret123'}).status_code == 201
+    tokens = {username: client.post('/login', json={'username': username, 'password': 'secret123'}).get_json()['token']
+              for username in ('alice', 'bob')}
+    # The replica lags: it has the users but none of what follows
+    shutil.copyfile(primary, replica)
+
+    alice = {'Authorization': f"Bearer {tokens['alice']}"}
+    response = client.post('/messages', json={'content': 'Hello'}, headers=alice)
+    assert response.status_code == 201
+    assert 'db_pin' in response.headers.get('Set-Cookie', '')
+
+    # No cookie comes back from a bearer client; the pin is on alice's row
+    assert [message['content'] for message in client.get('/messages', headers=alice).get_json()] == ['Hello']
+    assert client.get('/messages', headers={'Authorization': f"Bearer {tokens['bob']}"}).get_json() == []
+    assert client.get('/messages').get_json() == []
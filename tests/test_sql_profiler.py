@@ -0,0 +1,13 @@
+# test_sql_profiler.py - The slow-query log keeps the slowest queries, not the latest
+from sql_profiler import SQLProfiler
+
+
+def test_slow_query_log_keeps_the_slowest():
+    profiler = SQLProfiler()
+    profiler.slow_query_log_size = 3
+    for elapsed_ms in (5, 50, 1, 40, 30, 2, 60, 3):
+        if profiler._would_keep(elapsed_ms):
+            profiler._record_slow_query(None, f'UPDATE t SET x = {elapsed_ms}', (), None, False, elapsed_ms)
+    slowest = profiler.snapshot()['slow_queries']
+    assert [entry['duration_ms'] for entry in slowest] == [60, 50, 40]
+    assert slowest[0]['statement'] == 'UPDATE t SET x = 60'
@@ -0,0 +1,95 @@
+# vehicle_catalog.py - In-process cache of the vehicle lookup tables (makes, models, fuels, ...)
+import threading
+import time
+
+
+def clean(name):
+    return ' '.join(str(name).split()) if name is not None else ''
+
+
+def fold(name):
+    # Catalog names match case- and whitespace-insensitively, so "petrol"
+    # and " Petrol" intern to the same entry
+    return clean(name).casefold()
+
+
+class VehicleCatalog:
+    # Entry ids never change once assigned, so cached entries never go
+    # stale; a miss only means another process added the entry. Unknown ids
+    # always reload, unknown names at most every reload_interval seconds.
+    def __init__(self, load, create, reload_interval=5.0):
+        # load(): iterable of (kind, id, name, parent_id)
+        # create(kind, name, parent_id): id of the committed entry
+        self._load = load
+        self._create = create
+        self.reload_interval = reload_interval
+        self._ids = {}  # (kind, parent_id, folded name) -> id
+        self._names = {}  # (kind, id) -> name
+        self._parents = {}  # (kind, id) -> parent_id
+        self._loaded_at = None
+        self._lock = threading.RLock()
+
+    def _remember(self, kind, entry_id, name, parent_id=None):
+        self._ids.setdefault((kind, parent_id, fold(name)), entry_id)
+        self._names[(kind, entry_id)] = name
+        self._parents[(kind, entry_id)] = parent_id
+
+    def reload(self):
+        rows = list(self._load())
+        with self._lock:
+            self._ids, self._names, self._parents = {}, {}, {}
+            # Lowest id wins when differently spelled duplicates exist
+            for kind, entry_id, name, parent_id in sorted(rows, key=lambda row: row[1]):
+                self._remember(kind, entry_id, name, parent_id)
+            self._loaded_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._ids, self._names, self._parents = {}, {}, {}
+            self._loaded_at = None
+
+    def lookup(self, kind, name, parent_id=None):
+        # Id of an existing entry, or None
+        key = (kind, parent_id, fold(name))
+        entry_id = self._ids.get(key)
+        if entry_id is None and (self._loaded_at is None or
+                                 time.monotonic() - self._loaded_at >= self.reload_interval):
+            self.reload()
+            entry_id = self._ids.get(key)
+        return entry_id
+
+    def intern(self, kind, name, parent_id=None):
+        # Id of the entry for `name`, created if missing
+        name = clean(name)
+        if not name:
+            raise ValueError(f'{kind} must not be empty')
+        entry_id = self.lookup(kind, name, parent_id)
+        if entry_id is None:
+            with self._lock:
+                entry_id = self._ids.get((kind, parent_id, fold(name)))
+                if entry_id is None:
+                    entry_id = self._create(kind, name, parent_id)
+                    self._remember(kind, entry_id, name, parent_id)
+        return entry_id
+
+    def name(self, kind, entry_id):
+        if entry_id is None:
+            return None
+        name = self._names.get((kind, entry_id))
+        if name is None:
+            self.reload()
+            name = self._names.get((kind, entry_id))
+        return name
+
+    def parent(self, kind, entry_id):
+        if self.name(kind, entry_id) is None:
+            return None
+        return self._parents.get((kind, entry_id))
+
+    def entries(self, kind):
+        # [(id, name)] of every cached entry of `kind`
+        if self._loaded_at is None:
+            self.reload()
+        with self._lock:
+            return [(entry_id, name) for (entry_kind, entry_id), name in self._names.items()
+                    if entry_kind == kind]
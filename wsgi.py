@@ -0,0 +1,4 @@
+# wsgi.py - Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+from flask_backend_sql import create_app
+
+app = create_app()